@@ -1,40 +1,54 @@
 from abc import ABC, abstractmethod
 from typing import List
-from langchain_groq import ChatGroq
-from langchain.schema import BaseMessage
-import os
+from langchain.schema import BaseMessage, HumanMessage
+from agents.conversation_memory import ConversationMemory
 from rag.retriever import chroma_retriever
+from rag.context_packer import context_packer
+from rag.llm_provider import get_llm
 
 
 class BaseAgent(ABC):
+    # Surgical phase of the agent, selecting its context token budget
+    phase: str = None
+
     def __init__(self, system_prompt: str):
-        self.llm = ChatGroq(
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            model_name="llama-3.1-8b-instant",
-            temperature=0.7,
-        )
         self.system_prompt = system_prompt
-        self.conversation_history = []
+        # Recent turns verbatim within a token budget, older ones summarized
+        self.memory = ConversationMemory()
+
+    @property
+    def llm(self):
+        """Shared chat client, created on first use"""
+        return get_llm(temperature=0.7)
 
     def add_to_history(self, message: BaseMessage):
         """Add a message to conversation history"""
-        self.conversation_history.append(message)
+        role = "user" if isinstance(message, HumanMessage) else "assistant"
+        self.memory.append(None, role, message.content)
+        if role == "assistant":
+            # Turns past the memory budget are summarized in the background
+            self.memory.schedule_summary(None)
 
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.memory.clear(None)
 
-    def retrieve_relevant_info(self, query: str, collections: List[str]) -> str:
-        """Retrieve relevant information from specified collections"""
-        context = ""
-
-        for collection in collections:
-            results = chroma_retriever.query_collection(collection, query)
-            if results:
-                context += f"\n\n--- Information from {collection} ---\n"
-                for i, result in enumerate(results[:3]):  # Top 3 results per collection
-                    context += f"\n{result['document']}\n"
+    def history_messages(self) -> List[BaseMessage]:
+        """Running summary and the recent turns that fit the memory budget"""
+        messages, _ = self.memory.messages(None)
+        return messages
 
+    def retrieve_relevant_info(
+        self, query: str, collections: List[str], patient_id: str = None
+    ) -> str:
+        """Retrieve relevant information from specified collections"""
+        all_results = chroma_retriever.query_many(collections, query)
+        # Pre-op device selection only sees devices that fit the patient's anatomy
+        if self.phase == "pre-op" and patient_id and "devices" in all_results:
+            all_results["devices"] = chroma_retriever.compatible_devices(
+                patient_id, all_results["devices"], query
+            )
+        context, _ = context_packer.pack(None, all_results, phase=self.phase)
         return context
 
     @abstractmethod
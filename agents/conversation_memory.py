@@ -0,0 +1,239 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from dotenv import load_dotenv
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from agents.conversation_store import DEFAULT_SESSION, ConversationStore
+
+load_dotenv()
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a cardiac surgeon and an AI assistant.
+Keep patient IDs, devices, measurements, decisions and open questions; drop pleasantries and repetition.
+Answer with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+Turns to add:
+{turns}
+
+Updated summary:"""
+
+
+class ConversationMemory:
+    """Token-budgeted view of a session's conversation for the prompt.
+
+    The newest messages are kept verbatim while they fit in
+    ``token_budget``; older ones are left out of the prompt and, after the
+    response has been sent, folded into the session's running summary on a
+    background thread (one summarization per session at a time). Each
+    ``messages`` call reports how many prompt tokens this saved compared with
+    sending the session's whole history verbatim.
+    """
+
+    def __init__(
+        self,
+        store: ConversationStore = None,
+        token_budget: int = None,
+        summary_words: int = None,
+        summarize: bool = None,
+        counter: Callable[[str], int] = None,
+        llm=None,
+    ):
+        self.store = store or ConversationStore()
+        self.token_budget = token_budget or int(
+            os.getenv("CONVERSATION_TOKEN_BUDGET", "1000")
+        )
+        self.summary_words = summary_words or int(
+            os.getenv("CONVERSATION_SUMMARY_WORDS", "150")
+        )
+        if summarize is None:
+            summarize = os.getenv("CONVERSATION_SUMMARIZE", "true").lower() == "true"
+        self.summarize = summarize
+        self._counter = counter
+        self._llm = llm
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._summarizing = set()
+        self.totals = {
+            "turns": 0,
+            "saved_tokens": 0,
+            "used_tokens": 0,
+            "summaries": 0,
+            "summary_failures": 0,
+        }
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from rag.llm_provider import get_llm
+
+            self._llm = get_llm(temperature=0.1)
+        return self._llm
+
+    def count_tokens(self, message: Dict[str, Any]) -> int:
+        """Token count of a message, memoized on the message"""
+        if "tokens" not in message:
+            if self._counter is None:
+                from rag.context_packer import context_packer
+
+                self._counter = context_packer.count_tokens
+            message["tokens"] = self._counter(message["content"])
+        return message["tokens"]
+
+    def _split(
+        self, messages: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(older, recent): the newest messages that fit the budget are recent"""
+        used = 0
+        start = len(messages)
+        for message in reversed(messages):
+            tokens = self.count_tokens(message)
+            if used + tokens > self.token_budget:
+                break
+            used += tokens
+            start -= 1
+        return messages[:start], messages[start:]
+
+    # --- Recording ---
+
+    def append(self, session_id: str, role: str, content: str):
+        self.store.append(session_id, role, content)
+
+    def clear(self, session_id: str):
+        self.store.clear(session_id)
+
+    def history(self, session_id: str) -> List[Dict[str, Any]]:
+        """The session's verbatim messages that have not been summarized yet"""
+        return self.store.history(session_id)
+
+    def has_history(self, session_id: str) -> bool:
+        """Whether the session has earlier turns, verbatim or summarized"""
+        stored, summary, _ = self.store.snapshot(session_id)
+        return bool(stored or summary)
+
+    # --- Prompt ---
+
+    def messages(self, session_id: str) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """Summary and recent turns as LLM messages, plus token usage stats"""
+        stored, summary, folded_tokens = self.store.snapshot(session_id)
+        older, recent = self._split(stored)
+
+        messages: List[BaseMessage] = []
+        summary_tokens = 0
+        if summary:
+            content = f"Summary of the earlier conversation: {summary}"
+            summary_tokens = self.count_tokens({"content": content})
+            messages.append(SystemMessage(content=content))
+        for message in recent:
+            if message["role"] == "user":
+                messages.append(HumanMessage(content=message["content"]))
+            else:
+                messages.append(AIMessage(content=message["content"]))
+
+        used = summary_tokens + sum(self.count_tokens(m) for m in recent)
+        full = folded_tokens + sum(self.count_tokens(m) for m in stored)
+        stats = {
+            "budget": self.token_budget,
+            "used_tokens": used,
+            "summary_tokens": summary_tokens,
+            "recent_messages": len(recent),
+            "unsummarized_messages": len(older),
+            "saved_tokens": max(0, full - used),
+        }
+        with self._lock:
+            self.totals["turns"] += 1
+            self.totals["used_tokens"] += used
+            self.totals["saved_tokens"] += stats["saved_tokens"]
+        return messages, stats
+
+    # --- Summarization ---
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="memory"
+                )
+            return self._executor
+
+    def schedule_summary(self, session_id: str):
+        """Fold messages beyond the budget into the summary, in the background"""
+        session_id = session_id or DEFAULT_SESSION
+        if not self.summarize:
+            # Without summaries the older messages are simply dropped
+            stored, summary, _ = self.store.snapshot(session_id)
+            older, _ = self._split(stored)
+            if older:
+                self.store.fold(
+                    session_id,
+                    older,
+                    summary,
+                    sum(self.count_tokens(m) for m in older),
+                )
+            return
+        with self._lock:
+            if session_id in self._summarizing:
+                return
+            self._summarizing.add(session_id)
+        self._get_executor().submit(self._summarize_session, session_id)
+
+    def _summarize_session(self, session_id: str):
+        try:
+            self.summarize_now(session_id)
+        except Exception as e:
+            print(f"Error summarizing conversation {session_id}: {e}")
+            with self._lock:
+                self.totals["summary_failures"] += 1
+        finally:
+            with self._lock:
+                self._summarizing.discard(session_id)
+
+    def summarize_now(self, session_id: str) -> bool:
+        """Fold the messages that no longer fit the budget into the summary"""
+        stored, summary, _ = self.store.snapshot(session_id)
+        older, _ = self._split(stored)
+        if not older:
+            return False
+
+        turns = "\n".join(
+            f"{'Surgeon' if m['role'] == 'user' else 'Assistant'}: {m['content']}"
+            for m in older
+        )
+        response = self.llm.invoke(
+            [
+                HumanMessage(
+                    content=SUMMARY_PROMPT.format(
+                        max_words=self.summary_words,
+                        summary=summary or "(none yet)",
+                        turns=turns,
+                    )
+                )
+            ]
+        )
+        folded = self.store.fold(
+            session_id,
+            older,
+            response.content.strip(),
+            sum(self.count_tokens(m) for m in older),
+        )
+        if folded:
+            with self._lock:
+                self.totals["summaries"] += 1
+        return folded
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            turns = self.totals["turns"]
+            return {
+                **self.totals,
+                "token_budget": self.token_budget,
+                "saved_tokens_per_turn": (
+                    round(self.totals["saved_tokens"] / turns, 1) if turns else 0.0
+                ),
+                "summarizing": len(self._summarizing),
+            }
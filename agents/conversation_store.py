@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_SESSION = "default"
+
+
+class ConversationStore:
+    """Conversation histories kept per session id.
+
+    Each session holds its messages until they are folded into its summary
+    (the conversation memory's token budget decides when). As a safety cap
+    for when summarization fails or falls behind, a session keeps at most
+    ``max_messages`` messages in a ring buffer; the default is well above
+    what the token budget normally leaves. At most ``max_sessions`` sessions
+    are kept, least recently used first out, and sessions idle for longer
+    than ``idle_seconds`` are dropped the next time the store is touched.
+    Sessions are ordered by last use, so eviction only ever looks at the
+    oldest ones.
+
+    Next to its messages a session keeps a running summary of the messages
+    that were folded out of it (see ``fold``) and their token count.
+    """
+
+    def __init__(
+        self,
+        max_messages: int = None,
+        max_sessions: int = None,
+        idle_seconds: float = None,
+    ):
+        self.max_messages = max_messages or int(
+            os.getenv("CONVERSATION_MAX_MESSAGES", "200")
+        )
+        self.max_sessions = max_sessions or int(
+            os.getenv("CONVERSATION_MAX_SESSIONS", "256")
+        )
+        if idle_seconds is None:
+            idle_seconds = float(os.getenv("CONVERSATION_IDLE_SECONDS", "3600"))
+        self.idle_seconds = idle_seconds
+
+        # session id -> [last used, messages, summary, folded tokens],
+        # least recently used first
+        self._sessions: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+
+    def _evict(self, now: float):
+        if self.idle_seconds > 0:
+            while self._sessions:
+                last_used = next(iter(self._sessions.values()))[0]
+                if now - last_used <= self.idle_seconds:
+                    break
+                self._sessions.popitem(last=False)
+                self.evicted_idle += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted_lru += 1
+
+    def _session(self, session_id: str, create: bool) -> List[Any]:
+        now = time.time()
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            if not create:
+                self._evict(now)
+                return [now, deque(), "", 0]
+            entry = [now, deque(maxlen=self.max_messages), "", 0]
+            self._sessions[session_id] = entry
+        entry[0] = now
+        self._sessions.move_to_end(session_id)
+        self._evict(now)
+        return entry
+
+    def append(self, session_id: str, role: str, content: str):
+        """Add a message to a session, creating the session if needed"""
+        with self._lock:
+            self._session(session_id or DEFAULT_SESSION, create=True)[1].append(
+                {"role": role, "content": content}
+            )
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        """A session's messages, oldest first"""
+        with self._lock:
+            return list(self._session(session_id or DEFAULT_SESSION, create=False)[1])
+
+    def snapshot(self, session_id: str) -> Tuple[List[Dict[str, Any]], str, int]:
+        """A session's messages, running summary and tokens folded into it"""
+        with self._lock:
+            _, messages, summary, folded_tokens = self._session(
+                session_id or DEFAULT_SESSION, create=False
+            )
+            return list(messages), summary, folded_tokens
+
+    def fold(
+        self,
+        session_id: str,
+        folded: List[Dict[str, Any]],
+        summary: str,
+        folded_tokens: int,
+    ) -> bool:
+        """Replace a session's oldest messages with an updated summary.
+
+        ``folded`` must be the messages currently at the start of the session
+        (as returned by ``snapshot``); if the session was cleared, evicted or
+        has moved on since, nothing changes and False is returned.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id or DEFAULT_SESSION)
+            if entry is None:
+                return False
+            messages = entry[1]
+            if len(messages) < len(folded) or any(
+                current is not old for current, old in zip(messages, folded)
+            ):
+                return False
+            for _ in folded:
+                messages.popleft()
+            entry[2] = summary
+            entry[3] += folded_tokens
+            return True
+
+    def clear(self, session_id: str):
+        """Forget one session"""
+        with self._lock:
+            self._sessions.pop(session_id or DEFAULT_SESSION, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._evict(time.time())
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "max_messages": self.max_messages,
+                "messages": sum(len(entry[1]) for entry in self._sessions.values()),
+                "evicted_lru": self.evicted_lru,
+                "evicted_idle": self.evicted_idle,
+            }
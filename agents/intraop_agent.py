@@ -4,6 +4,8 @@ from langchain.schema import HumanMessage, SystemMessage
 
 
 class IntraOpAgent(BaseAgent):
+    phase = "intra-op"
+
     def __init__(self):
         super().__init__(INTRAOP_SYSTEM_PROMPT)
 
@@ -18,7 +20,7 @@ class IntraOpAgent(BaseAgent):
         # Prepare messages
         messages = [
             SystemMessage(content=self.system_prompt),
-            *self.conversation_history[-6:],  # Last 3 exchanges for context
+            *self.history_messages(),  # Summary and recent turns within budget
             HumanMessage(content=f"Context: {context}\n\nQuestion: {query}"),
         ]
 
@@ -1,9 +1,17 @@
-from typing import Dict, Any, List
-from langchain_groq import ChatGroq
+from typing import Dict, Any, Iterator, List
+from concurrent.futures import ThreadPoolExecutor
 from langchain.schema import HumanMessage, SystemMessage
 import os
+import threading
+import time
+from rag.embedding import embedding_model
 from rag.retriever import chroma_retriever
+from rag.context_packer import context_packer
+from rag.llm_provider import get_llm
+from agents.conversation_memory import ConversationMemory
+from agents.conversation_store import ConversationStore
 from rag.query_router import QueryRouter
+from rag.response_cache import query_identifiers, response_cache_from_env
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,57 +19,73 @@ load_dotenv()
 
 class SurgicalAssistant:
     def __init__(self):
-        self.llm = ChatGroq(
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            model_name="llama-3.1-8b-instant",
-            temperature=0.7,
-        )
         self.query_router = QueryRouter()
-        self.conversation_history = []
+        self.response_cache = response_cache_from_env()
+        self.context_packer = context_packer
+        # Histories per browser session; models and indexes stay process-wide
+        self.conversations = ConversationStore()
+        # Recent turns verbatim within a token budget, older ones summarized
+        self.memory = ConversationMemory(self.conversations)
 
-    def add_to_history(self, role: str, content: str):
-        """Add a message to conversation history"""
-        self.conversation_history.append({"role": role, "content": content})
+        # Pipelined mode overlaps retrieval with the routing call
+        self.pipelined = os.getenv("RETRIEVAL_PIPELINE", "false").lower() == "true"
+        self._routing_executor = None
+        self._pipeline_lock = threading.Lock()
+        self.pipeline_stats = {
+            "turns": 0,
+            "saved_seconds": 0.0,
+            "speculative_searches": 0,
+            "wasted_searches": 0,
+        }
 
-    def clear_history(self):
-        """Clear conversation history"""
-        self.conversation_history = []
+    @property
+    def llm(self):
+        """Shared chat client, created on first use so importing the app stays fast"""
+        return get_llm(temperature=0.7)
 
-    def retrieve_relevant_info(
-        self, query: str, collections: List[str], patient_id: str = None
-    ) -> str:
-        """Retrieve relevant information from specified collections with patient filtering"""
-        context = ""
+    def add_to_history(self, role: str, content: str, session_id: str = None):
+        """Add a message to a session's conversation history"""
+        self.memory.append(session_id, role, content)
 
-        # If this is a patient-specific query, get the patient info first
-        if patient_id:
-            patient_info = chroma_retriever.get_patient_info(patient_id)
-            if patient_info:
-                context += (
-                    f"\n\n--- Patient Information ---\n{patient_info['document']}\n"
-                )
+    def clear_history(self, session_id: str = None):
+        """Clear a session's conversation history"""
+        self.memory.clear(session_id)
 
-        for collection in collections:
-            # For patient-specific queries, filter notes by patient_id
-            filters = None
-            if patient_id and collection == "notes":
-                filters = {"patient_id": patient_id}
+    def get_history(self, session_id: str = None) -> List[Dict[str, str]]:
+        """A session's not yet summarized messages, oldest first"""
+        return self.memory.history(session_id)
 
-            results = chroma_retriever.query_collection(
-                collection, query, filters=filters
-            )
-            if results:
-                context += f"\n\n--- Information from {collection} ---\n"
-                for i, result in enumerate(results[:3]):  # Top 3 results per collection
-                    # Skip if this is the same patient info we already added
-                    if (
-                        patient_id
-                        and collection == "patients"
-                        and result["metadata"].get("patient_id") == patient_id
-                    ):
-                        continue
-                    context += f"\n{result['document']}\n"
+    @staticmethod
+    def _retrieval_filters(
+        collections: List[str], patient_id: str = None
+    ) -> Dict[str, Dict]:
+        """For patient-specific queries, filter notes by patient_id"""
+        filters = {}
+        if patient_id and "notes" in collections:
+            filters["notes"] = {"patient_id": patient_id}
+        return filters
 
+    def retrieve_relevant_info(
+        self,
+        query: str,
+        collections: List[str],
+        patient_id: str = None,
+        query_embedding: List[float] = None,
+        phase: str = None,
+    ) -> str:
+        """Retrieve relevant information from specified collections with patient filtering"""
+        # Fetch the patient record and search every collection concurrently,
+        # embedding the query once for all of them
+        patient_info, all_results = chroma_retriever.retrieve_all(
+            collections,
+            query,
+            query_embedding=query_embedding,
+            patient_id=patient_id,
+            filters=self._retrieval_filters(collections, patient_id),
+        )
+        context, _ = self.context_packer.pack(
+            patient_info, all_results, phase=phase, patient_id=patient_id
+        )
         return context
 
     def get_system_prompt(self, phase: str, patient_id: str = None) -> str:
@@ -98,50 +122,300 @@ class SurgicalAssistant:
 
         return base_prompt
 
-    def generate_response(self, query: str) -> Dict[str, Any]:
-        """Generate a response to the query with routing information"""
+    def _prepare_turn(self, query: str, session_id: str = None) -> Dict[str, Any]:
+        """Embed and route the query, and check the response cache.
+
+        Returns the turn state shared by the blocking and streaming paths; a
+        cache hit is returned under ``cached``.
+        """
+        if self.pipelined:
+            return self._prepare_turn_pipelined(query, session_id)
+
+        # Embed the query once for both routing and retrieval
+        query_embedding = embedding_model.embed_text(query)
+
         # Route the query to determine phase and collections
-        routing_info = self.query_router.route_query(query)
-        phase = routing_info.get("phase", "pre-op")
-        collections = routing_info.get("collections", ["patients"])
-        reasoning = routing_info.get("reasoning", "")
-        patient_specific = routing_info.get("patient_specific", False)
-        patient_id = routing_info.get("patient_id", None)
+        routing_info = self.query_router.route_query(
+            query, query_embedding=query_embedding
+        )
+        turn = self._new_turn(routing_info, query_embedding)
+        turn["session_id"] = session_id
+        return self._check_cache(query, turn)
+
+    def _prepare_turn_pipelined(
+        self, query: str, session_id: str = None
+    ) -> Dict[str, Any]:
+        """Run routing in the background while retrieval starts speculatively.
+
+        The query embedding, the patient lookup and searches of the
+        collections the keyword tables predict all run while the router is
+        deciding. Afterwards, collections the router picked but that were not
+        searched are fetched, and speculative results it did not pick are
+        dropped. Timings and wasted searches are recorded under ``pipeline``.
+        """
+        start = time.perf_counter()
+        with self._pipeline_lock:
+            if self._routing_executor is None:
+                self._routing_executor = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="router"
+                )
+
+        def timed_route():
+            route_start = time.perf_counter()
+            routing_info = self.query_router.route_query(query)
+            return routing_info, time.perf_counter() - route_start
+
+        routing_future = self._routing_executor.submit(timed_route)
+
+        patient_id = self.query_router.extract_patient_id(query)
+        speculative = self.query_router.likely_collections(query)
+        query_embedding = embedding_model.embed_text(query)
+        patient_info, results = chroma_retriever.retrieve_all(
+            speculative,
+            query,
+            query_embedding=query_embedding,
+            patient_id=patient_id,
+            filters=self._retrieval_filters(speculative, patient_id),
+        )
+        retrieval_seconds = time.perf_counter() - start
+
+        routing_info, route_seconds = routing_future.result()
+        turn = self._new_turn(routing_info, query_embedding)
+        turn["session_id"] = session_id
+        collections = turn["collections"]
+
+        followup_start = time.perf_counter()
+        # If the router reports a different patient, nothing speculative is usable
+        refetch_patient = turn["patient_id"] != patient_id
+        if refetch_patient:
+            missing = list(collections)
+        else:
+            missing = [c for c in collections if c not in results]
+        if missing or refetch_patient:
+            extra_patient, extra_results = chroma_retriever.retrieve_all(
+                missing,
+                query,
+                query_embedding=query_embedding,
+                patient_id=turn["patient_id"] if refetch_patient else None,
+                filters=self._retrieval_filters(missing, turn["patient_id"]),
+            )
+            results.update(extra_results)
+            if refetch_patient:
+                patient_info = extra_patient
+        retrieval_seconds += time.perf_counter() - followup_start
+
+        elapsed = time.perf_counter() - start
+        wasted = [c for c in speculative if c not in collections]
+        turn["retrieved"] = (patient_info, {c: results.get(c, []) for c in collections})
+        turn["pipeline"] = {
+            "elapsed_seconds": round(elapsed, 4),
+            "route_seconds": round(route_seconds, 4),
+            "retrieval_seconds": round(retrieval_seconds, 4),
+            # Time a route-then-retrieve turn would have taken beyond this one
+            "saved_seconds": round(route_seconds + retrieval_seconds - elapsed, 4),
+            "speculative_collections": speculative,
+            "wasted_collections": wasted,
+        }
+        with self._pipeline_lock:
+            self.pipeline_stats["turns"] += 1
+            self.pipeline_stats["saved_seconds"] += turn["pipeline"]["saved_seconds"]
+            self.pipeline_stats["speculative_searches"] += len(speculative)
+            self.pipeline_stats["wasted_searches"] += len(wasted)
+
+        return self._check_cache(query, turn)
 
-        # Retrieve relevant information
-        context = self.retrieve_relevant_info(query, collections, patient_id)
+    @staticmethod
+    def _new_turn(
+        routing_info: Dict[str, Any], query_embedding: List[float]
+    ) -> Dict[str, Any]:
+        """Turn state built from a routing decision"""
+        return {
+            "query_embedding": query_embedding,
+            "phase": routing_info.get("phase", "pre-op"),
+            "collections": routing_info.get("collections", ["patients"]),
+            "reasoning": routing_info.get("reasoning", ""),
+            "patient_specific": routing_info.get("patient_specific", False),
+            "patient_id": routing_info.get("patient_id", None),
+            "router": routing_info.get("router", "llm"),
+            "cache_version": None,
+            "cache_identifiers": (),
+            "cached": None,
+            "retrieved": None,
+            "pipeline": None,
+            "context": None,
+            "memory": None,
+            "session_id": None,
+        }
+
+    def _check_cache(self, query: str, turn: Dict[str, Any]) -> Dict[str, Any]:
+        """Look up a stored answer for a routed turn"""
+        patient_id = turn["patient_id"]
+        query_embedding = turn["query_embedding"]
+
+        # Serve a stored answer to a near-identical question about the same
+        # patient, phase and identifiers, as long as the documents it was
+        # built from are unchanged. Answers depend on the conversation once
+        # it has earlier turns, so those are neither looked up nor stored.
+        if self.response_cache is not None and not self.memory.has_history(
+            turn["session_id"]
+        ):
+            turn["cache_version"] = chroma_retriever.data_version(
+                turn["collections"], patient_id
+            )
+            turn["cache_identifiers"] = query_identifiers(query)
+            if turn["cache_version"] is not None:
+                turn["cached"] = self.response_cache.lookup(
+                    query_embedding,
+                    patient_id,
+                    turn["phase"],
+                    version=turn["cache_version"],
+                    identifiers=turn["cache_identifiers"],
+                )
+
+        return turn
+
+    def _build_messages(self, query: str, turn: Dict[str, Any]) -> List:
+        """Retrieve context for a routed turn and assemble the LLM messages"""
+        patient_id = turn["patient_id"]
+
+        # Retrieve relevant information, unless the pipeline already did
+        if turn["retrieved"] is None:
+            turn["retrieved"] = chroma_retriever.retrieve_all(
+                turn["collections"],
+                query,
+                query_embedding=turn["query_embedding"],
+                patient_id=patient_id,
+                filters=self._retrieval_filters(turn["collections"], patient_id),
+            )
+
+        # Pre-op device selection only sees devices that fit the patient's anatomy
+        patient_info, results = turn["retrieved"]
+        if turn["phase"] == "pre-op" and patient_id and "devices" in results:
+            results = {
+                **results,
+                "devices": chroma_retriever.compatible_devices(
+                    patient_id,
+                    results["devices"],
+                    query,
+                    query_embedding=turn["query_embedding"],
+                ),
+            }
+
+        # Fit the best documents into the phase's token budget
+        context, turn["context"] = self.context_packer.pack(
+            patient_info, results, phase=turn["phase"], patient_id=patient_id
+        )
 
         # Get appropriate system prompt
-        system_prompt = self.get_system_prompt(phase, patient_id)
+        system_prompt = self.get_system_prompt(turn["phase"], patient_id)
+
+        # Earlier conversation: a running summary plus the turns that fit the budget
+        history, turn["memory"] = self.memory.messages(turn["session_id"])
 
         # Prepare messages for the LLM
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
-            *[
-                HumanMessage(content=msg["content"])
-                for msg in self.conversation_history[-6:]
-                if msg["role"] == "user"
-            ],
-            *[
-                SystemMessage(content=msg["content"])
-                for msg in self.conversation_history[-6:]
-                if msg["role"] == "assistant"
-            ],
+            *history,
             HumanMessage(content=f"Context: {context}\n\nQuestion: {query}"),
         ]
 
+    @staticmethod
+    def _metadata(turn: Dict[str, Any]) -> Dict[str, Any]:
+        """Routing information reported alongside a response"""
+        metadata = {
+            "phase": turn["phase"],
+            "collections": turn["collections"],
+            "patient_specific": turn["patient_specific"],
+            "patient_id": turn["patient_id"],
+            "reasoning": turn["reasoning"],
+            "router": turn["router"],
+        }
+        if turn["pipeline"] is not None:
+            metadata["pipeline"] = turn["pipeline"]
+        if turn["context"] is not None:
+            metadata["context"] = turn["context"]
+        if turn["memory"] is not None:
+            metadata["memory"] = turn["memory"]
+        return metadata
+
+    def _finish_turn(
+        self, query: str, turn: Dict[str, Any], response_text: str
+    ) -> Dict[str, Any]:
+        """Record a completed turn in history and the response cache"""
+        # Update this session's history only
+        self.add_to_history("user", query, session_id=turn["session_id"])
+        self.add_to_history("assistant", response_text, session_id=turn["session_id"])
+        # Turns past the memory budget are summarized off the critical path
+        self.memory.schedule_summary(turn["session_id"])
+
+        # Per-turn pipeline timings and context usage are reported but never cached
+        per_turn = {
+            key: turn[key] for key in ("pipeline", "context", "memory") if turn[key]
+        }
+
+        if turn["cached"] is not None:
+            return {**turn["cached"], **per_turn, "cache": "hit"}
+
+        result = {"response": response_text, **self._metadata(turn)}
+        for key in per_turn:
+            result.pop(key, None)
+        if self.response_cache is not None and turn["cache_version"] is not None:
+            self.response_cache.store(
+                turn["query_embedding"],
+                turn["patient_id"],
+                turn["phase"],
+                result,
+                version=turn["cache_version"],
+                identifiers=turn["cache_identifiers"],
+            )
+
+        return {**result, **per_turn, "cache": "miss"}
+
+    def generate_response(self, query: str, session_id: str = None) -> Dict[str, Any]:
+        """Generate a response to the query with routing information.
+
+        ``session_id`` selects the conversation history the turn sees and
+        extends; turns without one share a default session.
+        """
+        turn = self._prepare_turn(query, session_id)
+        if turn["cached"] is not None:
+            return self._finish_turn(query, turn, turn["cached"]["response"])
+
+        messages = self._build_messages(query, turn)
+
         # Generate response
         response = self.llm.invoke(messages)
 
-        # Update history
-        self.add_to_history("user", query)
-        self.add_to_history("assistant", response.content)
+        return self._finish_turn(query, turn, response.content)
 
-        return {
-            "response": response.content,
-            "phase": phase,
-            "collections": collections,
-            "patient_specific": patient_specific,
-            "patient_id": patient_id,
-            "reasoning": reasoning,
+    def generate_response_stream(
+        self, query: str, session_id: str = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream a response to the query as it is generated.
+
+        Yields a ``metadata`` event with the routing information first, then
+        ``token`` events with response text as it arrives, and finally a
+        ``done`` event carrying the same result dict as ``generate_response``.
+        History and the response cache are only updated once the stream
+        completes. ``session_id`` is used as in ``generate_response``.
+        """
+        turn = self._prepare_turn(query, session_id)
+        yield {
+            "type": "metadata",
+            **self._metadata(turn),
+            "cache": "hit" if turn["cached"] is not None else "miss",
         }
+
+        if turn["cached"] is not None:
+            response_text = turn["cached"]["response"]
+            yield {"type": "token", "content": response_text}
+        else:
+            messages = self._build_messages(query, turn)
+            chunks = []
+            for chunk in self.llm.stream(messages):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield {"type": "token", "content": chunk.content}
+            response_text = "".join(chunks)
+
+        yield {"type": "done", "result": self._finish_turn(query, turn, response_text)}
@@ -4,6 +4,8 @@ from langchain.schema import HumanMessage, SystemMessage
 
 
 class PostOpAgent(BaseAgent):
+    phase = "post-op"
+
     def __init__(self):
         super().__init__(POSTOP_SYSTEM_PROMPT)
 
@@ -18,7 +20,7 @@ class PostOpAgent(BaseAgent):
         # Prepare messages
         messages = [
             SystemMessage(content=self.system_prompt),
-            *self.conversation_history[-6:],  # Last 3 exchanges for context
+            *self.history_messages(),  # Summary and recent turns within budget
             HumanMessage(content=f"Context: {context}\n\nQuestion: {query}"),
         ]
 
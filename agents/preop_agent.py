@@ -4,6 +4,8 @@ from langchain.schema import HumanMessage, SystemMessage
 
 
 class PreOpAgent(BaseAgent):
+    phase = "pre-op"
+
     def __init__(self):
         super().__init__(PREOP_SYSTEM_PROMPT)
 
@@ -13,12 +15,12 @@ class PreOpAgent(BaseAgent):
         if patient_id:
             query = f"Patient {patient_id}: {query}"
 
-        context = self.retrieve_relevant_info(query, collections)
+        context = self.retrieve_relevant_info(query, collections, patient_id)
 
         # Prepare messages
         messages = [
             SystemMessage(content=self.system_prompt),
-            *self.conversation_history[-6:],  # Last 3 exchanges for context
+            *self.history_messages(),  # Summary and recent turns within budget
             HumanMessage(content=f"Context: {context}\n\nQuestion: {query}"),
         ]
 
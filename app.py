@@ -1,5 +1,9 @@
+import uuid
 import streamlit as st
 from agents.orchestrator import SurgicalAssistant
+from rag.embedding import embedding_model
+from rag.llm_provider import llm_provider
+from rag.retriever import chroma_retriever
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -18,15 +22,20 @@ st.title("❤️ Cardiac Surgery Assistant")
 st.caption("AI-powered support for cardiac surgery procedures")
 
 
-# Initialize the assistant
+# Initialize the assistant; models, indexes and clients are shared by all
+# sessions, conversation histories are kept per session
 @st.cache_resource
 def get_assistant():
+    # Load the indexes and model in the background so the page renders at once
+    chroma_retriever.warmup(background=True)
     return SurgicalAssistant()
 
 
 assistant = get_assistant()
 
 # Initialize session state
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "show_debug" not in st.session_state:
@@ -39,13 +48,35 @@ with st.sidebar:
     st.header("Controls")
 
     if st.button("Clear Conversation"):
-        assistant.clear_history()
+        assistant.clear_history(st.session_state.session_id)
         st.session_state.messages = []
         st.session_state.current_patient = None
         st.rerun()
 
     st.session_state.show_debug = st.checkbox("Show Debug Info", value=False)
 
+    if st.session_state.show_debug:
+        with st.expander("Embedding Cache"):
+            st.json(embedding_model.cache_stats())
+        with st.expander("Model Startup"):
+            st.json({"loaded": embedding_model.loaded, **embedding_model.load_timings})
+        with st.expander("LLM Clients"):
+            st.json(llm_provider.stats())
+        with st.expander("Routing Tiers"):
+            st.json(assistant.query_router.routing_stats())
+        if assistant.pipelined:
+            with st.expander("Retrieval Pipeline"):
+                st.json(assistant.pipeline_stats)
+        with st.expander("Conversations"):
+            st.json(assistant.conversations.stats())
+        with st.expander("Conversation Memory"):
+            st.json(assistant.memory.stats())
+        with st.expander("Context Budget"):
+            st.json(assistant.context_packer.stats())
+        if assistant.response_cache is not None:
+            with st.expander("Response Cache"):
+                st.json(assistant.response_cache.stats())
+
     # Display current patient if available
     if st.session_state.current_patient:
         st.info(f"**Current Patient**: {st.session_state.current_patient}")
@@ -81,18 +112,38 @@ if prompt := st.chat_input("Ask a question about cardiac surgery..."):
 
     # Get and display assistant response
     with st.chat_message("assistant"):
-        with st.spinner("Analyzing your question..."):
-            response_data = assistant.generate_response(prompt)
+        response_data = {}
+        error_message = "Sorry, the response could not be generated. Please try again."
+
+        def stream_tokens():
+            for event in events:
+                if event["type"] == "token":
+                    yield event["content"]
+                elif event["type"] == "done":
+                    response_data.update(event["result"])
+
+        try:
+            events = assistant.generate_response_stream(
+                prompt, session_id=st.session_state.session_id
+            )
+            with st.spinner("Analyzing your question..."):
+                # Routing metadata arrives before any response tokens
+                next(events)
+
+            # Display the response as it is generated
+            st.write_stream(stream_tokens())
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            response_data.clear()
+        if not response_data:
+            st.error(error_message)
 
         # Update current patient if this is a patient-specific query
         if response_data.get("patient_specific") and response_data.get("patient_id"):
             st.session_state.current_patient = response_data.get("patient_id")
 
-        # Display the response
-        st.markdown(response_data["response"])
-
         # Show phase and routing info if debug is enabled
-        if st.session_state.show_debug:
+        if response_data and st.session_state.show_debug:
             phase_display = {
                 "pre-op": "🟢 Pre-operative",
                 "intra-op": "🔵 Intra-operative",
@@ -107,30 +158,59 @@ if prompt := st.chat_input("Ask a question about cardiac surgery..."):
                 st.info(f"**Patient**: {response_data.get('patient_id', 'Unknown')}")
 
             st.caption(f"**Reasoning**: {response_data.get('reasoning', '')}")
+            st.caption(f"**Router**: {response_data.get('router', 'llm')}")
+            if response_data.get("cache") == "hit":
+                st.caption(
+                    f"**Response Cache**: hit (similarity {response_data.get('similarity')})"
+                )
+            else:
+                st.caption("**Response Cache**: miss")
+            if response_data.get("context"):
+                context_stats = response_data["context"]
+                st.caption(
+                    f"**Context**: {context_stats['used_tokens']}/{context_stats['budget']} tokens "
+                    f"({context_stats['dropped_tokens']} dropped)"
+                )
+            if response_data.get("memory"):
+                memory_stats = response_data["memory"]
+                st.caption(
+                    f"**Memory**: {memory_stats['used_tokens']}/{memory_stats['budget']} tokens "
+                    f"({memory_stats['saved_tokens']} saved)"
+                )
 
             with st.expander("Retrieved Collections"):
                 st.write(", ".join(response_data["collections"]))
 
-    # Add assistant response to chat history with debug info
-    debug_info = (
-        {
-            "phase": response_data["phase"],
-            "collections": response_data["collections"],
-            "patient_specific": response_data.get("patient_specific", False),
-            "patient_id": response_data.get("patient_id"),
-            "reasoning": response_data.get("reasoning", ""),
-        }
-        if st.session_state.show_debug
-        else None
-    )
-
-    st.session_state.messages.append(
-        {
-            "role": "assistant",
-            "content": response_data["response"],
-            "debug_info": debug_info,
-        }
-    )
+    if response_data:
+        # Add assistant response to chat history with debug info
+        debug_info = (
+            {
+                "phase": response_data["phase"],
+                "collections": response_data["collections"],
+                "patient_specific": response_data.get("patient_specific", False),
+                "patient_id": response_data.get("patient_id"),
+                "reasoning": response_data.get("reasoning", ""),
+                "router": response_data.get("router", "llm"),
+                "cache": response_data.get("cache", "miss"),
+                "pipeline": response_data.get("pipeline"),
+                "context": response_data.get("context"),
+                "memory": response_data.get("memory"),
+            }
+            if st.session_state.show_debug
+            else None
+        )
+
+        st.session_state.messages.append(
+            {
+                "role": "assistant",
+                "content": response_data["response"],
+                "debug_info": debug_info,
+            }
+        )
+    else:
+        st.session_state.messages.append(
+            {"role": "assistant", "content": error_message, "debug_info": None}
+        )
 
 # Footer
 st.divider()
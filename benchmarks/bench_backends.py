@@ -0,0 +1,144 @@
+"""Embedding backends compared: fp32 torch vs int8 torch vs ONNX Runtime.
+
+Each backend runs in its own subprocess so its peak RSS is measured in
+isolation. Reports load time, single-query latency, batched throughput and
+peak RSS, and checks cosine parity of every backend against fp32 torch.
+Exits non-zero when a backend falls below --min-cosine.
+
+Run from the project root:
+    python -m benchmarks.bench_backends --limit 128 --intra-op-threads 4
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import SAMPLE_QUERIES, load_texts, percentile
+from rag.embedding_backends import cosine_parity
+
+
+def run_backend(args):
+    """Measure one backend in this process and write the results to args.out"""
+    # The module singleton is the only model loaded, configured from the env
+    os.environ["EMBEDDING_BACKEND"] = args.run_backend
+    os.environ["EMBEDDING_INTRA_OP_THREADS"] = str(args.intra_op_threads)
+    os.environ["EMBEDDING_INTER_OP_THREADS"] = str(args.inter_op_threads)
+    start = time.perf_counter()
+    from rag.embedding import embedding_model as model
+
+    # The model is lazy; load the tokenizer and weights inside the timed block
+    model.load()
+    load_seconds = time.perf_counter() - start
+
+    queries = SAMPLE_QUERIES * args.repeats
+    model.embed_batch(queries[:1])
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        model.embed_batch([query])
+        timings.append(time.perf_counter() - start)
+
+    texts = load_texts(args.collection, args.limit)
+    start = time.perf_counter()
+    embeddings = model.embed_batch(texts, batch_size=args.batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    np.save(args.out + ".npy", embeddings)
+    with open(args.out + ".json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "backend": model.backend.name,
+                "load_seconds": load_seconds,
+                "p50_ms": percentile(timings, 50) * 1e3,
+                "p95_ms": percentile(timings, 95) * 1e3,
+                "docs_per_second": len(texts) / batch_seconds,
+                # ru_maxrss is in KiB on Linux
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+            },
+            f,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", default="torch,int8,onnx")
+    parser.add_argument("--collection", default="guidelines")
+    parser.add_argument("--limit", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=4)
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    parser.add_argument("--inter-op-threads", type=int, default=0)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--run-backend", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        run_backend(args)
+        return
+
+    backends = args.backends.split(",")
+    if "torch" in backends:
+        backends.remove("torch")
+    # fp32 torch is always run first as the parity reference
+    backends.insert(0, "torch")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend in backends:
+            out = os.path.join(tmp_dir, backend)
+            command = [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_backends",
+                "--run-backend", backend,
+                "--out", out,
+                "--collection", args.collection,
+                "--limit", str(args.limit),
+                "--batch-size", str(args.batch_size),
+                "--repeats", str(args.repeats),
+                "--intra-op-threads", str(args.intra_op_threads),
+                "--inter-op-threads", str(args.inter_op_threads),
+            ]  # fmt: skip
+            if subprocess.run(command).returncode != 0:
+                print(f"{backend}: failed")
+                continue
+            with open(out + ".json", "r", encoding="utf-8") as f:
+                results[backend] = json.load(f)
+            results[backend]["embeddings"] = np.load(out + ".npy")
+
+    if "torch" not in results:
+        print("The fp32 reference failed; nothing to compare against")
+        sys.exit(1)
+
+    reference = results["torch"]["embeddings"]
+    failed = False
+    print(
+        f"\n{'backend':<8} {'loaded as':<10} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'docs/s':>8} {'RSS MB':>8} {'min cos':>9} {'mean cos':>9}"
+    )
+    for backend, result in results.items():
+        parity = cosine_parity(reference, result["embeddings"])
+        failed |= parity["min_cosine"] < args.min_cosine
+        print(
+            f"{backend:<8} {result['backend']:<10} {result['load_seconds']:7.2f} "
+            f"{result['p50_ms']:8.2f} {result['p95_ms']:8.2f} "
+            f"{result['docs_per_second']:8.1f} {result['peak_rss_mb']:8.0f} "
+            f"{parity['min_cosine']:9.5f} {parity['mean_cosine']:9.5f}"
+        )
+
+    if failed:
+        print(f"\nParity check failed: min cosine below {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
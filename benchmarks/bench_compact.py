@@ -0,0 +1,85 @@
+"""Compact vector storage: memory saved and recall@k of each quantization mode.
+
+Builds a float16, int8 and binary compact index of a Chroma collection in a
+temporary directory and compares them with the exact float32 search on the
+sample queries plus noisy copies of stored vectors.
+
+Run from the project root:
+    python -m benchmarks.bench_compact --collection guidelines --k 5
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import SAMPLE_QUERIES, percentile
+from rag.compact_index import COMPACT_MODES, CompactIndex
+from rag.embedding import embedding_model
+from rag.retriever import chroma_retriever
+
+
+def timed_searches(index, queries, k, exact=False):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k, exact=exact)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--collection", default="guidelines")
+    parser.add_argument("--modes", default=",".join(COMPACT_MODES))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--doc-queries", type=int, default=64)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    collection = chroma_retriever.backend.get_store(args.collection)
+    queries = list(embedding_model.embed_batch(SAMPLE_QUERIES))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode in args.modes.split(","):
+            start = time.perf_counter()
+            index = CompactIndex.build(
+                collection, os.path.join(tmp_dir, mode), mode=mode
+            )
+            build_seconds = time.perf_counter() - start
+
+            if len(queries) == len(SAMPLE_QUERIES):
+                # Stored vectors with relative noise, as near-duplicate queries
+                rng = np.random.default_rng(0)
+                rows = rng.choice(
+                    len(index), min(args.doc_queries, len(index)), replace=False
+                )
+                for row in rows:
+                    vector = np.asarray(index.vectors[row])
+                    noise = rng.normal(size=vector.shape).astype(np.float32)
+                    noise *= args.noise * np.linalg.norm(vector) / np.linalg.norm(noise)
+                    queries.append(vector + noise)
+                exact = timed_searches(index, queries, args.k, exact=True)
+                print(
+                    f"{len(index)} vectors x {index.vectors.shape[1]} dims, "
+                    f"{len(queries)} queries, exact float32 p50 "
+                    f"{percentile(exact, 50) * 1e3:.2f} ms"
+                )
+
+            timings = timed_searches(index, queries, args.k)
+            memory = index.memory()
+            print(
+                f"{mode:<8} recall@{args.k} {index.recall_at_k(queries, args.k):.3f}  "
+                f"p50 {percentile(timings, 50) * 1e3:7.2f} ms  "
+                f"p95 {percentile(timings, 95) * 1e3:7.2f} ms  "
+                f"resident {memory['resident_bytes'] / 1e6:8.2f} MB "
+                f"of {memory['float32_bytes'] / 1e6:8.2f} MB "
+                f"(saved {memory['saved_pct']:.0f}%)  build {build_seconds:.1f}s"
+            )
+            del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Device compatibility: one vectorized pass versus a per-device Python loop.
+
+Checks synthetic patient anatomies (spread over the ranges the EHR generator
+uses) against every device in the devices collection, and reports the time
+to fill the patient x device matrix both ways and how many devices each
+patient keeps.
+
+Run from the project root:
+    python -m benchmarks.bench_compatibility --patients 1000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from rag.device_compatibility import CRITERIA, DeviceCompatibility
+from rag.retriever import chroma_retriever
+
+# Synthetic measurement ranges per criterion, as in generate_synthetic_EHR_notes
+ANATOMY_RANGES = {
+    "proximal_diameter": (18.0, 34.0),
+    "distal_diameter": (10.0, 22.0),
+    "neck_length": (8.0, 35.0),
+    "neck_angulation": (20.0, 80.0),
+    "iliac_access": (5.5, 14.0),
+}
+
+
+def loop_matrix(engine, anatomies):
+    """Reference implementation: one device bound at a time"""
+    compatible = np.zeros((len(anatomies), len(engine)), dtype=bool)
+    for patient, anatomy in enumerate(anatomies):
+        for column in range(len(engine)):
+            ok = True
+            for row in range(len(CRITERIA)):
+                low, high = engine.low[row, column], engine.high[row, column]
+                value = anatomy[row]
+                if (not np.isnan(low) and value < low) or (
+                    not np.isnan(high) and value > high
+                ):
+                    ok = False
+                    break
+            compatible[patient, column] = ok
+    return compatible
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patients", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = DeviceCompatibility.build(chroma_retriever.backend.get_store("devices"))
+    rng = np.random.default_rng(0)
+    anatomies = np.column_stack(
+        [
+            rng.uniform(*ANATOMY_RANGES[criterion], args.patients)
+            for criterion in CRITERIA
+        ]
+    )
+
+    start = time.perf_counter()
+    failures, _ = engine.matrix(anatomies)
+    compatible = ~failures.any(axis=1)
+    vectorized_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = loop_matrix(engine, anatomies)
+    loop_seconds = time.perf_counter() - start
+
+    kept = compatible.sum(axis=1)
+    print(
+        f"{args.patients} patients x {len(engine)} devices: "
+        f"vectorized {vectorized_seconds * 1e3:.1f} ms, "
+        f"loop {loop_seconds * 1e3:.1f} ms "
+        f"({loop_seconds / max(vectorized_seconds, 1e-9):.0f}x), "
+        f"matrices agree: {bool((compatible == expected).all())}"
+    )
+    print(
+        f"compatible devices per patient: median {int(np.median(kept))}, "
+        f"min {kept.min()}, max {kept.max()}, none for {(kept == 0).sum()} patients"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Throughput benchmark: per-document embed_text loop vs batched embed_batch.
+
+Run from the project root:
+    python -m benchmarks.bench_embedding --collection guidelines --limit 256
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import load_texts
+from rag.embedding import embedding_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--collection", default="guidelines")
+    parser.add_argument("--limit", type=int, default=256)
+    parser.add_argument("--batch-sizes", default="8,16,32,64")
+    args = parser.parse_args()
+
+    texts = load_texts(args.collection, args.limit)
+    print(f"Embedding {len(texts)} documents with {embedding_model.model_name}")
+
+    start = time.perf_counter()
+    reference = np.array(
+        [embedding_model.embed_batch([text])[0] for text in texts], dtype=np.float32
+    )
+    per_doc_seconds = time.perf_counter() - start
+    print(
+        f"per-document: {per_doc_seconds:8.2f}s  "
+        f"{len(texts) / per_doc_seconds:8.1f} docs/s"
+    )
+
+    ref_norm = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        start = time.perf_counter()
+        batched = embedding_model.embed_batch(texts, batch_size=batch_size)
+        seconds = time.perf_counter() - start
+
+        batched_norm = batched / np.linalg.norm(batched, axis=1, keepdims=True)
+        min_cosine = float(np.min(np.sum(ref_norm * batched_norm, axis=1)))
+        print(
+            f"batch={batch_size:<4d}: {seconds:8.2f}s  "
+            f"{len(texts) / seconds:8.1f} docs/s  "
+            f"speedup x{per_doc_seconds / seconds:5.2f}  "
+            f"min cosine vs per-document {min_cosine:.6f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""LLM client reuse: a new client per call versus the shared provider.
+
+Runs concurrent generation calls the old way (a client built for every call,
+as generation_node used to) and through the shared provider, and reports
+client setup time and call latency. With the default local stand-in no
+network is used; pass --provider groq (with GROQ_API_KEY) to include real
+connection setup and TLS handshakes.
+
+Run from the project root:
+    python -m benchmarks.bench_llm --calls 64 --concurrency 8 --latency 0.05
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.common import SAMPLE_QUERIES, percentile
+from rag.llm_provider import LLMProvider
+
+
+def run(calls, concurrency, call):
+    timings = []
+
+    def timed(i):
+        start = time.perf_counter()
+        call(i)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(calls)))
+    return time.perf_counter() - start, timings
+
+
+def report(name, elapsed, timings):
+    print(
+        f"{name:<16} {len(timings)} calls in {elapsed:6.2f}s  "
+        f"p50 {percentile(timings, 50) * 1e3:8.1f} ms  "
+        f"p95 {percentile(timings, 95) * 1e3:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--provider", default="local")
+    parser.add_argument("--calls", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.environ["LOCAL_LLM_LATENCY_SECONDS"] = str(args.latency)
+
+    def messages(i):
+        return [HumanMessage(content=SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)])]
+
+    def per_call(i):
+        # A fresh provider has no clients or connections to reuse
+        provider = LLMProvider(provider=args.provider)
+        try:
+            provider.get(temperature=0.7).invoke(messages(i))
+        finally:
+            provider.close()
+
+    shared = LLMProvider(provider=args.provider)
+
+    def pooled(i):
+        shared.get(temperature=0.7).invoke(messages(i))
+
+    report("client per call", *run(args.calls, args.concurrency, per_call))
+    report("shared provider", *run(args.calls, args.concurrency, pooled))
+    print(shared.stats())
+    shared.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Offline phase-routing accuracy and latency: keyword vs semantic vs LLM router.
+
+Builds (or loads) the cached prototype centroids, then routes the held-out
+queries in rag.router_prototypes.EVAL_QUERIES with each router. The LLM
+router is only run with --with-llm since it needs GROQ_API_KEY.
+
+Run from the project root:
+    python -m benchmarks.bench_router --rebuild --with-llm
+"""
+
+import argparse
+import time
+
+from benchmarks.common import percentile
+from rag.embedding import embedding_model
+from rag.query_router import QueryRouter, SemanticRouter
+from rag.router_prototypes import EVAL_QUERIES
+
+
+def report(name, predictions, timings):
+    correct = sum(
+        predicted == expected
+        for predicted, (_, expected) in zip(predictions, EVAL_QUERIES)
+    )
+    print(
+        f"{name:<10} accuracy {correct}/{len(EVAL_QUERIES)} "
+        f"({correct / len(EVAL_QUERIES):.0%})  "
+        f"p50 {percentile(timings, 50) * 1e3:9.3f} ms  "
+        f"p95 {percentile(timings, 95) * 1e3:9.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild centroids")
+    parser.add_argument("--with-llm", action="store_true", help="include LLM router")
+    args = parser.parse_args()
+
+    semantic = SemanticRouter(embedding_model=embedding_model)
+    start = time.perf_counter()
+    if args.rebuild:
+        semantic.build()
+    else:
+        semantic.load()
+    print(
+        f"Centroids ready in {time.perf_counter() - start:.2f}s at {semantic.cache_path}"
+    )
+
+    queries = [query for query, _ in EVAL_QUERIES]
+    start = time.perf_counter()
+    embeddings = [embedding_model.embed_batch([query])[0] for query in queries]
+    embed_ms = (time.perf_counter() - start) / len(queries) * 1e3
+    print(f"Query embedding (shared with retrieval): {embed_ms:.1f} ms/query")
+
+    router = QueryRouter(mode="keyword")
+    predictions, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        predictions.append(router.route_query(query)["phase"])
+        timings.append(time.perf_counter() - start)
+    report("keyword", predictions, timings)
+
+    predictions, timings = [], []
+    for embedding in embeddings:
+        start = time.perf_counter()
+        predictions.append(semantic.route(embedding)[0])
+        timings.append(time.perf_counter() - start)
+    report("semantic", predictions, timings)
+
+    if args.with_llm:
+        router = QueryRouter(mode="llm")
+        predictions, timings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            predictions.append(router.route_query(query).get("phase"))
+            timings.append(time.perf_counter() - start)
+        report("llm", predictions, timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""LLM scheduler under injected rate limits.
+
+Starts the local fake chat server, which answers with 429 + Retry-After on a
+share of requests and whenever too many are in flight, and fires concurrent
+invoke and stream calls through a Groq client behind the scheduler. Reports
+how many calls succeeded, call latency, and the scheduler's queue, wait and
+retry metrics. No network access or API key is needed.
+
+Run from the project root:
+    python -m benchmarks.bench_scheduler --calls 48 --concurrency 16
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.common import SAMPLE_QUERIES, percentile
+from benchmarks.fake_llm_server import FakeLLMServer
+from rag.llm_provider import LLMProvider
+from rag.llm_scheduler import LLMScheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=48)
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="scheduler cap")
+    parser.add_argument("--rpm", type=float, default=600)
+    parser.add_argument("--tpm", type=float, default=0)
+    parser.add_argument("--deadline", type=float, default=30)
+    parser.add_argument("--reject-every", type=int, default=4)
+    parser.add_argument("--server-max-concurrent", type=int, default=6)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        latency=args.latency,
+        reject_every=args.reject_every,
+        max_concurrent=args.server_max_concurrent,
+        retry_after=args.retry_after,
+    ).start()
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    scheduler = LLMScheduler(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_concurrency=args.max_concurrency,
+        deadline_seconds=args.deadline,
+        backoff_seconds=0.05,
+    )
+    provider = LLMProvider(
+        provider="groq", base_url=server.base_url, scheduler=scheduler
+    )
+    llm = provider.get(temperature=0.7)
+
+    timings, errors = [], []
+
+    def call(i):
+        messages = [HumanMessage(content=SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)])]
+        start = time.perf_counter()
+        try:
+            if i % 2:
+                "".join(chunk.content for chunk in llm.stream(messages))
+            else:
+                llm.invoke(messages)
+            timings.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(call, range(args.calls)))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{len(timings)}/{args.calls} calls succeeded in {elapsed:.2f}s  "
+        f"p50 {percentile(timings, 50) * 1e3:.0f} ms  "
+        f"p95 {percentile(timings, 95) * 1e3:.0f} ms"
+    )
+    if errors:
+        print(f"errors: {sorted(set(errors))}")
+    print(f"server: {server.stats}")
+    print(f"scheduler: {scheduler.stats()}")
+    provider.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Process startup: where the time goes before the first answer.
+
+Each run starts a fresh Python process and times, in order: importing
+rag.embedding, rag.retriever and agents.orchestrator (none of which should
+load the model), loading the tokenizer, loading the weights, the first
+forward pass and a second, warm forward pass. Runs are cold processes, but
+the model files come from the local HuggingFace cache after the first one.
+
+Run from the project root:
+    python -m benchmarks.bench_startup --runs 3
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+STAGES = [
+    "import_embedding",
+    "import_retriever",
+    "import_orchestrator",
+    "tokenizer",
+    "weights",
+    "first_inference",
+    "second_inference",
+]
+
+
+def child():
+    """Time each startup stage in this (fresh) process and print them as JSON"""
+    timings = {}
+
+    def stage(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[name] = time.perf_counter() - start
+        return result
+
+    embedding = stage("import_embedding", lambda: __import__("rag.embedding").embedding)
+    stage("import_retriever", lambda: __import__("rag.retriever"))
+    stage("import_orchestrator", lambda: __import__("agents.orchestrator"))
+    model = embedding.embedding_model
+    timings["loaded_after_imports"] = model.loaded
+
+    stage("tokenizer", lambda: model.tokenizer)
+    stage("weights", lambda: model.backend)
+    stage("first_inference", lambda: model.embed_batch(["first surgeon question"]))
+    stage("second_inference", lambda: model.embed_batch(["second surgeon question"]))
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    runs = []
+    for run in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        total = time.perf_counter() - start
+        # The timings are the last line; libraries may print before it
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings["process_total"] = total
+        runs.append(timings)
+        print(
+            f"run {run + 1}: {total:.2f}s total, model loaded by imports: "
+            f"{timings['loaded_after_imports']}"
+        )
+
+    print(f"{'stage':<22} {'min':>9} {'median':>9}")
+    for name in STAGES + ["process_total"]:
+        values = sorted(run[name] for run in runs)
+        print(
+            f"{name:<22} {values[0] * 1e3:8.0f}ms {values[len(values) // 2] * 1e3:8.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
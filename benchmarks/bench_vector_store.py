@@ -0,0 +1,107 @@
+"""Vector store backends compared: Chroma (HNSW) vs NumPy brute force over mmap.
+
+Copies a Chroma collection into a temporary NumPy store, then runs the
+sample queries plus noisy copies of stored vectors against both, with and
+without a metadata filter. Recall@k is measured against the NumPy store,
+whose search is exact.
+
+Run from the project root:
+    python -m benchmarks.bench_vector_store --collection notes --where patient_id=P003
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import SAMPLE_QUERIES, percentile
+from rag.embedding import embedding_model
+from rag.vector_store import ChromaBackend, NumpyBackend
+
+
+def copy_collection(source, target, page_size=5000):
+    offset = 0
+    while True:
+        page = source.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset,
+        )
+        if not page["ids"]:
+            return
+        target.upsert(
+            ids=page["ids"],
+            embeddings=np.asarray(page["embeddings"], dtype=np.float32),
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+        )
+        offset += len(page["ids"])
+
+
+def run(store, queries, k, where):
+    timings, hits = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = store.query(
+            query_embeddings=[query.tolist()], n_results=k, where=where
+        )
+        timings.append(time.perf_counter() - start)
+        hits.append(set(result["ids"][0]))
+    return timings, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--collection", default="guidelines")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--doc-queries", type=int, default=64)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--where", help="equality filter as key=value")
+    args = parser.parse_args()
+
+    chroma = ChromaBackend().get_store(args.collection)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        numpy_store = NumpyBackend(tmp_dir).get_or_create_store(args.collection)
+        copy_collection(chroma, numpy_store)
+        print(
+            f"Copied {numpy_store.count()} vectors to the NumPy store "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+        queries = list(embedding_model.embed_batch(SAMPLE_QUERIES))
+        rng = np.random.default_rng(0)
+        for row in rng.choice(
+            numpy_store.count(),
+            min(args.doc_queries, numpy_store.count()),
+            replace=False,
+        ):
+            vector = np.asarray(numpy_store.vectors[row])
+            noise = rng.normal(size=vector.shape).astype(np.float32)
+            noise *= args.noise * np.linalg.norm(vector) / np.linalg.norm(noise)
+            queries.append(vector + noise)
+
+        filters = [None]
+        if args.where:
+            key, _, value = args.where.partition("=")
+            filters.append({key: {"$eq": value}})
+
+        for where in filters:
+            exact_timings, truth = run(numpy_store, queries, args.k, where)
+            chroma_timings, found = run(chroma, queries, args.k, where)
+            recall = sum(len(t & f) for t, f in zip(truth, found)) / max(
+                1, sum(len(t) for t in truth)
+            )
+            label = f"where {where}" if where else "no filter"
+            print(f"\n{label} ({len(queries)} queries, k={args.k})")
+            for name, timings in (("numpy", exact_timings), ("chroma", chroma_timings)):
+                print(
+                    f"{name:<7} p50 {percentile(timings, 50) * 1e3:7.2f} ms  "
+                    f"p95 {percentile(timings, 95) * 1e3:7.2f} ms  "
+                    f"recall@{args.k} {1.0 if name == 'numpy' else recall:.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import json
+import os
+import random
+from typing import List
+
+DATA_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "database", "preprocessed_data")
+)
+
+SAMPLE_QUERIES = [
+    "What risks can patient P003 have before the operation?",
+    "What is the best device for this patient according to their medical data?",
+    "What are the deployment steps for the EndoFlex device?",
+    "What post-operative care is recommended after TEVAR procedures?",
+    "Contraindications for SG-0137",
+    "Follow-up imaging schedule for P012 after EVAR",
+    "Which guidelines cover iliac access assessment?",
+    "Outcomes literature for thoracic aneurysm repair",
+]
+
+
+def load_texts(collection_name: str = "guidelines", limit: int = 256) -> List[str]:
+    """Load document texts from the preprocessed data, or synthesize them if missing"""
+    json_path = os.path.join(DATA_DIR, f"{collection_name}.json")
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        texts = [doc["text"] for doc in data if doc.get("text")]
+        return texts[:limit]
+
+    # Synthetic documents with a realistic spread of lengths
+    rng = random.Random(0)
+    words = " ".join(SAMPLE_QUERIES).split()
+    return [
+        " ".join(rng.choice(words) for _ in range(rng.randint(20, 400)))
+        for _ in range(limit)
+    ]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of timings"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
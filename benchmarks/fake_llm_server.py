@@ -0,0 +1,174 @@
+"""Local stand-in for Groq's OpenAI-compatible chat endpoint that injects 429s.
+
+Answers ``POST .../chat/completions`` (plain and ``stream: true``) with a
+fixed reply after ``latency`` seconds. Every ``reject_every``-th request, and
+any request beyond ``max_concurrent`` in flight, gets a 429 with a
+Retry-After header, so the LLM scheduler can be exercised offline.
+
+Point the provider at it with LLM_BASE_URL=http://127.0.0.1:<port>, or run
+it on its own:
+    python -m benchmarks.fake_llm_server --port 8765 --reject-every 3
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "Fake completion from the local test server."
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.05,
+        reject_every: int = 0,
+        max_concurrent: int = 0,
+        retry_after: float = 0.2,
+    ):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.reject_every = reject_every
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rejected": 0, "served": 0, "in_flight": 0}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "FakeLLMServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+
+        with server.lock:
+            server.stats["requests"] += 1
+            reject = (
+                server.reject_every
+                and server.stats["requests"] % server.reject_every == 0
+            ) or (
+                server.max_concurrent
+                and server.stats["in_flight"] >= server.max_concurrent
+            )
+            if reject:
+                server.stats["rejected"] += 1
+            else:
+                server.stats["in_flight"] += 1
+        if reject:
+            self._json(
+                429,
+                {
+                    "error": {
+                        "message": "Rate limit reached",
+                        "type": "tokens",
+                        "code": "rate_limit_exceeded",
+                    }
+                },
+                {"retry-after": str(server.retry_after)},
+            )
+            return
+
+        try:
+            time.sleep(server.latency)
+            model = request.get("model", "fake")
+            if request.get("stream"):
+                self._stream(model)
+            else:
+                self._json(
+                    200,
+                    {
+                        "id": "fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": REPLY},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": 10,
+                            "completion_tokens": 8,
+                            "total_tokens": 18,
+                        },
+                    },
+                )
+        finally:
+            with server.lock:
+                server.stats["in_flight"] -= 1
+                server.stats["served"] += 1
+
+    def _stream(self, model):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.end_headers()
+        words = REPLY.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": word if i == 0 else " " + word},
+                        "finish_reason": "stop" if i == len(words) - 1 else None,
+                    }
+                ],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--reject-every", type=int, default=3)
+    parser.add_argument("--max-concurrent", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        port=args.port,
+        latency=args.latency,
+        reject_every=args.reject_every,
+        max_concurrent=args.max_concurrent,
+        retry_after=args.retry_after,
+    )
+    print(f"Fake LLM server on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
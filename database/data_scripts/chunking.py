@@ -0,0 +1,198 @@
+"""
+Token-aware chunking of multi-section documents (guidelines and literature).
+
+A document's first line is its title; blank lines separate sections, and a
+section's header is the text before the first colon of its first line. Lines
+are packed into chunks that stay within a token budget, breaking at section
+boundaries where possible, and consecutive chunks share ``overlap`` tokens of
+trailing lines. Each chunk is embedded with the title prepended so it keeps
+its context, and records the character offsets of its body in the source text.
+"""
+
+import os
+from typing import Callable, Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Collections whose documents are long enough to need chunking
+CHUNKED_COLLECTIONS = {"guidelines", "literature"}
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+
+def count_tokens(text: str) -> int:
+    """Number of embedding-model tokens in a text (without special tokens)."""
+    # The shared model's tokenizer, so chunk budgets match what gets embedded
+    from rag.embedding import get_embedding_model
+
+    return get_embedding_model().count_tokens(text)
+
+
+def chunk_id(doc_id: str, index: int) -> str:
+    return f"{doc_id}#{index}"
+
+
+def _section_header(line: str) -> str:
+    header = line.split(":", 1)[0].strip()
+    return header if ":" in line and len(header) <= 60 else ""
+
+
+def _split_long_line(
+    line: str, start: int, budget: int, counter, overlap: int = 0
+) -> List[Dict]:
+    """
+    Splits a line that alone exceeds the budget at word boundaries.
+
+    Consecutive pieces share up to ``overlap`` tokens of trailing words, the
+    same overlap chunks built from whole lines get.
+    """
+    words = line.split(" ")
+    starts = []
+    offset = start
+    for word in words:
+        starts.append(offset)
+        offset += len(word) + 1
+
+    pieces = []
+    first, end = 0, 0
+    while end < len(words):
+        # Every piece reaches past the previous one, even if the overlap and
+        # the next word alone exceed the budget
+        end = max(first, end) + 1
+        while end < len(words) and counter(" ".join(words[first : end + 1])) <= budget:
+            end += 1
+        pieces.append({"text": " ".join(words[first:end]), "start": starts[first]})
+        carry = end
+        while (
+            carry - 1 > first and counter(" ".join(words[carry - 1 : end])) <= overlap
+        ):
+            carry -= 1
+        first = carry
+    return pieces
+
+
+def chunk_document(
+    text: str,
+    max_tokens: int = None,
+    overlap_tokens: int = None,
+    counter: Callable[[str], int] = None,
+) -> List[Dict]:
+    """
+    Splits a document into overlapping, token-bounded chunks.
+
+    Args:
+        text (str): The full document text.
+        max_tokens (int): Token budget per chunk, including the title.
+        overlap_tokens (int): Tokens of trailing lines repeated in the next chunk.
+        counter (callable): Token counter; defaults to the embedding tokenizer.
+
+    Returns:
+        list: Dicts with the chunk ``text`` (title + body), its ``section``
+        header, and ``char_start``/``char_end`` offsets of the body in ``text``
+        plus ``body_offset``, the length of the title prefix in the chunk text.
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    counter = counter or count_tokens
+
+    if counter(text) <= max_tokens:
+        return [
+            {
+                "text": text,
+                "section": "",
+                "char_start": 0,
+                "char_end": len(text),
+                "body_offset": 0,
+            }
+        ]
+
+    title, newline, _ = text.partition("\n")
+    if not newline:
+        # A single line has no separate title; all of it is body
+        title = ""
+    prefix = f"{title}\n\n" if title else ""
+    budget = max(16, max_tokens - counter(prefix))
+
+    # Lines of the body with their offsets and section headers
+    lines = []
+    offset = len(title) + 1 if newline else 0
+    section = ""
+    new_section = True
+    for raw_line in text[offset:].split("\n"):
+        start = offset
+        offset += len(raw_line) + 1
+        if not raw_line.strip():
+            new_section = True
+            continue
+        if new_section:
+            section = _section_header(raw_line) or section
+        tokens = counter(raw_line)
+        if tokens > budget:
+            pieces = _split_long_line(
+                raw_line, start, budget, counter, min(overlap_tokens, budget // 2)
+            )
+            for piece in pieces:
+                lines.append(
+                    {
+                        **piece,
+                        "section": section,
+                        "tokens": counter(piece["text"]),
+                        "boundary": new_section,
+                    }
+                )
+                new_section = False
+        else:
+            lines.append(
+                {
+                    "text": raw_line,
+                    "start": start,
+                    "section": section,
+                    "tokens": tokens,
+                    "boundary": new_section,
+                }
+            )
+        new_section = False
+
+    chunks = []
+    current: List[Dict] = []
+    current_tokens = 0
+
+    def emit():
+        start = current[0]["start"]
+        end = current[-1]["start"] + len(current[-1]["text"])
+        chunks.append(
+            {
+                "text": prefix + text[start:end],
+                "section": current[0]["section"],
+                "char_start": start,
+                "char_end": end,
+                "body_offset": len(prefix),
+            }
+        )
+
+    for line in lines:
+        # Prefer to break where a new section starts once the chunk is half full
+        section_break = line["boundary"] and current_tokens >= budget // 2
+        if current and (current_tokens + line["tokens"] > budget or section_break):
+            emit()
+            # Carry trailing lines into the next chunk as overlap, unless the
+            # next chunk starts a new section
+            carried: List[Dict] = []
+            carried_tokens = 0
+            for previous in reversed([] if line["boundary"] else current):
+                if carried_tokens + previous["tokens"] > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous["tokens"]
+            if carried_tokens + line["tokens"] > budget:
+                carried, carried_tokens = [], 0
+            current, current_tokens = carried, carried_tokens
+        current.append(line)
+        current_tokens += line["tokens"]
+
+    if current:
+        emit()
+    return chunks
@@ -1,101 +1,110 @@
 from dotenv import load_dotenv
 import os
-import json
-from transformers import AutoModel, AutoTokenizer
-import torch
-import chromadb
+import sys
 
-# Load environment variables from .env file
-load_dotenv()
+# Make the project root importable when run as a script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-# Using a persistent client to save data locally
-db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "chroma_db"))
+from database.data_scripts.ingest_pipeline import ingest  # noqa: E402
+from rag.vector_store import (  # noqa: E402
+    collection_signature,
+    save_signature,
+    vector_backend_from_env,
+)
+from rag.compact_index import (  # noqa: E402
+    CompactIndex,
+    compact_index_dir,
+    compact_mode_from_env,
+)
+from rag.lexical_index import (  # noqa: E402
+    LEXICAL_FIELDS,
+    LexicalIndex,
+    lexical_index_path,
+)
 
-# Use PersistentClient with that path
-client = chromadb.PersistentClient(path=db_path)
+# Load environment variables from .env file
+load_dotenv()
 
-# Define the embedding model and tokenizer
-embedding_model_name = "BAAI/bge-large-en-v1.5"
-embedding_model = AutoModel.from_pretrained(
-    embedding_model_name, trust_remote_code=True
-)
-tokenizer = AutoTokenizer.from_pretrained(embedding_model_name, trust_remote_code=True)
+# Persistent local vector store: ChromaDB unless VECTOR_STORE says otherwise.
+# Opened on first use: spawned embedding workers re-import this module and
+# must not each open the database.
+_backend = None
 
 
-def embed_text_transformers(text):
-    """Generates an embedding for the given text using the specified model."""
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-    with torch.no_grad():
-        outputs = embedding_model(**inputs)
-        # mean pooling to get a single vector
-        embedding = outputs.last_hidden_state.mean(dim=1).squeeze().tolist()
-    return embedding
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = vector_backend_from_env()
+    return _backend
 
 
 def upload_with_embeddings(collection_name, json_path, text_key):
     """
-    Loads documents from a JSON file, generates embeddings from a specified text key,
-    and uploads them to a ChromaDB collection. Converts complex metadata values
-    to strings to comply with ChromaDB's schema.
+    Incrementally syncs a vector store collection with the documents in a JSON or JSONL file.
+
+    Documents are identified by their natural key (patient_id, note_id, device_id
+    or doc_id) and carry a content hash in their metadata. Records are streamed
+    through the ingestion pipeline: only new or changed documents are embedded
+    (on a process pool) and upserted in bounded chunks, unchanged ones are
+    skipped, and documents that disappeared from the source are deleted. An
+    interrupted run resumes from its checkpoint.
 
     Args:
-        collection_name (str): The name of the ChromaDB collection.
-        json_path (str): The path to the JSON file containing the documents.
+        collection_name (str): The name of the collection.
+        json_path (str): The path to the JSON or JSONL file containing the documents.
         text_key (str): The key in the JSON documents whose value is used for embedding.
     """
     try:
-        collection = client.get_or_create_collection(name=collection_name)
+        collection = get_backend().get_or_create_store(collection_name)
     except Exception as e:
         print(f"Error getting/creating collection '{collection_name}': {e}")
         return
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    if not data:
-        print(f"No data found in {json_path}. Skipping upload.")
+    try:
+        counts = ingest(collection, collection_name, json_path, text_key=text_key)
+    except Exception as e:
+        print(f"Error ingesting '{json_path}' into '{collection_name}': {e}")
         return
 
-    documents = []
-    embeddings = []
-    metadatas = []
-    ids = []
-
-    for i, doc in enumerate(data):
-        text = doc.get(text_key, "")
-
-        if text:
-            try:
-                embedding = embed_text_transformers(text)
-                # Create a new metadata dictionary with flattened values
-                cleaned_metadata = {}
-                for key, value in doc.items():
-                    if isinstance(value, (str, int, float, bool)):
-                        cleaned_metadata[key] = value
-                    else:
-                        # Convert any complex type to a string
-                        cleaned_metadata[key] = json.dumps(value)
-
-                metadatas.append(cleaned_metadata)
-                documents.append(text)
-                embeddings.append(embedding)
-                ids.append(str(i))
-            except Exception as e:
-                print(f"Could not embed document {i}: {e}")
-
-    if not embeddings:
-        print(
-            f"Error: No embeddings were generated for collection '{collection_name}' from '{json_path}'."
-        )
-        return
+    print(
+        f"'{collection_name}': {counts['added']} added, {counts['changed']} changed, "
+        f"{counts['skipped']} skipped, {counts['deleted']} deleted"
+        + (f", {counts['resumed']} resumed" if counts["resumed"] else "")
+    )
 
+    # Record the synced contents so running retrievers pick up the change
+    # without scanning the collection themselves
     try:
-        collection.add(
-            documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids
-        )
-        print(f"Uploaded {len(documents)} documents to '{collection_name}'")
+        save_signature(collection_name, collection_signature(collection))
     except Exception as e:
-        print(f"Error adding documents to collection '{collection_name}': {e}")
+        print(f"Error recording signature of '{collection_name}': {e}")
+
+    # Rebuild the quantized search index from the synced collection
+    compact_mode = compact_mode_from_env()
+    if compact_mode and collection.count() > 0:
+        try:
+            index = CompactIndex.build(
+                collection, compact_index_dir(collection_name), mode=compact_mode
+            )
+            memory = index.memory()
+            print(
+                f"'{collection_name}': {compact_mode} compact index, "
+                f"{memory['saved_bytes'] / 1e6:.1f} MB saved ({memory['saved_pct']:.0f}%)"
+            )
+        except Exception as e:
+            print(f"Error building compact index for '{collection_name}': {e}")
+
+    # Rebuild the BM25 / exact-ID index over device, patient and note identifiers
+    if collection_name in LEXICAL_FIELDS:
+        try:
+            index = LexicalIndex.build(collection, collection_name)
+            index.save(lexical_index_path(collection_name))
+            print(
+                f"'{collection_name}': lexical index, {len(index.postings)} terms, "
+                f"{len(index.exact)} exact ids"
+            )
+        except Exception as e:
+            print(f"Error building lexical index for '{collection_name}': {e}")
 
 
 # --- Main execution ---
@@ -107,7 +116,10 @@ if __name__ == "__main__":
     collections = ["patients", "notes", "devices", "guidelines", "literature"]
 
     for collection_name in collections:
-        json_path = os.path.join(data_dir, f"{collection_name}.json")
+        # Large corpora can be provided as JSONL instead
+        json_path = os.path.join(data_dir, f"{collection_name}.jsonl")
+        if not os.path.exists(json_path):
+            json_path = os.path.join(data_dir, f"{collection_name}.json")
         upload_with_embeddings(
             collection_name=collection_name, json_path=json_path, text_key="text"
         )
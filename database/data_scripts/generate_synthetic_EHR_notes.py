@@ -70,6 +70,12 @@ for i in range(50):
     aneurysm_diameter = round(random.uniform(4.5, 7.0), 1)
     scan_date = random_date(datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
     patient_id = f"P{i + 1:03d}"
+    # CT-derived anatomy used to check stent graft sizing
+    aortic_neck_diameter = round(random.uniform(18.0, 34.0), 1)
+    distal_landing_diameter = round(random.uniform(10.0, 22.0), 1)
+    neck_length = random.randint(8, 35)
+    neck_angulation = random.randint(20, 80)
+    iliac_access_diameter = round(random.uniform(5.5, 14.0), 1)
     risk_factors = ", ".join(random.sample(risk_factors_list, random.randint(2, 4)))
 
     # EHR record
@@ -82,6 +88,11 @@ for i in range(50):
         "diagnosis": diagnosis,
         "aneurysm_diameter_cm": aneurysm_diameter,
         "aneurysm_location": aneurysm_locations[diagnosis],
+        "aortic_neck_diameter_mm": aortic_neck_diameter,
+        "distal_landing_diameter_mm": distal_landing_diameter,
+        "neck_length_mm": neck_length,
+        "neck_angulation_deg": neck_angulation,
+        "iliac_access_diameter_mm": iliac_access_diameter,
         "ct_scan_date": scan_date.strftime("%Y-%m-%d"),
         "planned_intervention": planned_interventions[diagnosis],
     }
@@ -96,6 +107,10 @@ for i in range(50):
         f"Diagnosis: {ehr_record['diagnosis']}. "
         f"Aneurysm Diameter: {ehr_record['aneurysm_diameter_cm']} cm. "
         f"Location: {ehr_record['aneurysm_location']}. "
+        f"Anatomy: Aortic Neck Diameter: {aortic_neck_diameter} mm, "
+        f"Distal Landing Diameter: {distal_landing_diameter} mm, "
+        f"Neck Length: {neck_length} mm, Neck Angulation: {neck_angulation} deg, "
+        f"Iliac Access Diameter: {iliac_access_diameter} mm. "
         f"Planned Intervention: {ehr_record['planned_intervention']}."
     )
 
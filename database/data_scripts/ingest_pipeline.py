@@ -0,0 +1,467 @@
+"""
+Streaming ingestion pipeline for large corpora.
+
+Records are streamed from a JSON array or JSONL file, flattened and hashed in
+the main process, embedded in chunks on a process pool, and written to
+ChromaDB chunk by chunk in source order. At most ``max_pending`` chunks are in
+flight, so memory stays bounded regardless of corpus size and the reader
+waits for the writers (backpressure). After every written chunk the number of
+consumed records is checkpointed, so a crashed ingest resumes from there. The
+per-document bookkeeping (stored hashes, ids seen in the source) lives in a
+SQLite file next to the checkpoint rather than in memory.
+
+Guidelines and literature are split into section-aware chunks before
+embedding (see chunking.py); each chunk is stored as its own document with id
+``<doc_id>#<index>`` and keeps the parent ``doc_id`` in its metadata.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from database.data_scripts.chunking import (
+    CHUNKED_COLLECTIONS,
+    chunk_document,
+    chunk_id,
+)
+
+load_dotenv()
+
+# Natural key used as the stable document id in each collection
+ID_KEYS = {
+    "patients": "patient_id",
+    "notes": "note_id",
+    "devices": "device_id",
+    "guidelines": "doc_id",
+    "literature": "doc_id",
+}
+FALLBACK_ID_KEYS = ["note_id", "device_id", "doc_id", "patient_id"]
+
+CHECKPOINT_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "ingest_checkpoints")
+)
+
+
+def flatten_metadata(doc):
+    """Converts complex metadata values to strings to comply with ChromaDB's schema."""
+    cleaned_metadata = {}
+    for key, value in doc.items():
+        if isinstance(value, (str, int, float, bool)):
+            cleaned_metadata[key] = value
+        else:
+            # Convert any complex type to a string
+            cleaned_metadata[key] = json.dumps(value)
+    return cleaned_metadata
+
+
+def content_hash(text, metadata):
+    """Hash of a document's text and metadata, used to detect changes between runs."""
+    payload = json.dumps([text, metadata], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def document_id(collection_name, doc, text):
+    """Stable id from the document's natural key, or its text hash as a last resort."""
+    for key in [ID_KEYS.get(collection_name)] + FALLBACK_ID_KEYS:
+        if key and doc.get(key):
+            return str(doc[key])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _iter_json_array(f, read_size=1 << 16):
+    """Yields the objects of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = f.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return not eof
+
+    def peek():
+        # Next non-whitespace character, or None at end of file
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return None
+
+    if peek() != "[":
+        raise ValueError("Expected a JSON array of records")
+    pos += 1
+    if peek() == "]":
+        return
+
+    while True:
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                # The record continues past the buffered text
+                if not read_more():
+                    raise
+        pos = end
+        yield obj
+
+        separator = peek()
+        if separator == ",":
+            pos += 1
+        elif separator == "]":
+            return
+        else:
+            raise ValueError(f"Malformed JSON array: unexpected {separator!r}")
+
+
+def stream_records(path) -> Iterator[Dict[str, Any]]:
+    """Streams records from a JSON array file or a JSONL file."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+
+def document_units(doc_id, text, metadata, chunked):
+    """
+    The (id, text, metadata) entries stored for one source record.
+
+    Unchunked records map to a single entry. Chunked records map to one entry
+    per chunk whose metadata carries the parent ``doc_id``, the section, the
+    chunk's position and its character offsets in the source text.
+    """
+    if not chunked:
+        metadata = dict(metadata)
+        metadata["content_hash"] = content_hash(text, metadata)
+        return [(doc_id, text, metadata)]
+
+    # The full text lives in the chunk documents, not in every chunk's metadata
+    base = {key: value for key, value in metadata.items() if key != "text"}
+    chunks = chunk_document(text)
+    units = []
+    for index, chunk in enumerate(chunks):
+        chunk_metadata = {
+            **base,
+            "doc_id": doc_id,
+            "chunk_index": index,
+            "chunk_count": len(chunks),
+            "chunk_section": chunk["section"],
+            "char_start": chunk["char_start"],
+            "char_end": chunk["char_end"],
+            "body_offset": chunk["body_offset"],
+        }
+        chunk_metadata["content_hash"] = content_hash(chunk["text"], chunk_metadata)
+        units.append((chunk_id(doc_id, index), chunk["text"], chunk_metadata))
+    return units
+
+
+# --- Embedding workers ---
+
+_worker_model = None
+
+
+def _init_worker(intra_op_threads):
+    """Loads one embedding model per worker process."""
+    global _worker_model
+    # Workers split the cores between them, whatever the backend
+    os.environ["EMBEDDING_INTRA_OP_THREADS"] = str(intra_op_threads)
+    os.environ["EMBEDDING_INTER_OP_THREADS"] = "1"
+    from rag.embedding import get_embedding_model
+
+    _worker_model = get_embedding_model().load()
+
+
+def _embed_chunk(texts, batch_size):
+    return _worker_model.embed_batch(texts, batch_size=batch_size)
+
+
+# --- Checkpoints ---
+
+
+def _checkpoint_path(collection_name):
+    return os.path.join(CHECKPOINT_DIR, f"{collection_name}.json")
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(collection_name, path) -> int:
+    """Number of source records already ingested by an interrupted run."""
+    checkpoint_path = _checkpoint_path(collection_name)
+    if not os.path.exists(checkpoint_path):
+        return 0
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return 0
+    # A checkpoint for a different version of the source file is useless
+    if checkpoint.get("source") != _source_signature(path):
+        return 0
+    return int(checkpoint.get("records_done", 0))
+
+
+def save_checkpoint(collection_name, path, records_done):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    checkpoint_path = _checkpoint_path(collection_name)
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"source": _source_signature(path), "records_done": records_done}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def clear_checkpoint(collection_name):
+    checkpoint_path = _checkpoint_path(collection_name)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+# --- Sync state ---
+
+
+class SyncState:
+    """
+    On-disk bookkeeping for one ingest run, so memory stays flat as the corpus grows.
+
+    Holds the content hash of every document already in the collection, the
+    stored ids the source still produces, and the source record ids (to skip
+    duplicates), in a SQLite file that is removed when the run ends.
+    """
+
+    def __init__(self, collection_name):
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        self.path = os.path.join(CHECKPOINT_DIR, f"{collection_name}.sync.sqlite")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE stored (id TEXT PRIMARY KEY, hash TEXT);
+            CREATE TABLE seen (id TEXT PRIMARY KEY);
+            CREATE TABLE records (id TEXT PRIMARY KEY);
+            """)
+
+    def load_stored(self, collection, page_size=10000):
+        """Copies the content hashes of the collection's documents, page by page."""
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO stored VALUES (?, ?)",
+                (
+                    (doc_id, (metadata or {}).get("content_hash"))
+                    for doc_id, metadata in zip(page["ids"], page["metadatas"])
+                ),
+            )
+            if len(page["ids"]) < page_size:
+                return
+            offset += page_size
+
+    def stored_hash(self, doc_id) -> Tuple[bool, Optional[str]]:
+        """Whether the document is stored, and its content hash."""
+        row = self._conn.execute(
+            "SELECT hash FROM stored WHERE id = ?", (doc_id,)
+        ).fetchone()
+        return (row is not None, row[0] if row else None)
+
+    def add_record(self, doc_id) -> bool:
+        """Records a source id; False if it was already seen in this run."""
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO records VALUES (?)", (doc_id,)
+        )
+        return cursor.rowcount == 1
+
+    def add_seen(self, unit_ids):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO seen VALUES (?)", ((i,) for i in unit_ids)
+        )
+
+    def any_seen(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM seen LIMIT 1").fetchone() is not None
+
+    def unseen_stored(self, batch_size) -> Iterator[List[str]]:
+        """Batches of stored ids the source no longer produces."""
+        cursor = self._conn.execute(
+            "SELECT id FROM stored WHERE id NOT IN (SELECT id FROM seen)"
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [row[0] for row in rows]
+
+    def close(self):
+        self._conn.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# --- Pipeline ---
+
+
+def ingest(
+    collection,
+    collection_name,
+    path,
+    text_key="text",
+    workers: int = None,
+    chunk_size: int = None,
+    batch_size: int = None,
+    max_pending: int = None,
+    resume: bool = True,
+    chunked: bool = None,
+) -> Dict[str, int]:
+    """
+    Incrementally syncs a ChromaDB collection with a JSON or JSONL source.
+
+    Only new or changed documents (by content hash) are embedded and
+    upserted, and documents that disappeared from the source are deleted once
+    the whole source has been read. Duplicate ids keep their first record.
+
+    Args:
+        collection: The ChromaDB collection to write to.
+        collection_name (str): Its name, used for ids and the checkpoint file.
+        path (str): JSON array or .jsonl file with the documents.
+        text_key (str): The key whose value is embedded.
+        workers (int): Embedding processes; 0 embeds in this process.
+        chunk_size (int): Documents per embedding task and per Chroma write.
+        batch_size (int): Documents per forward pass inside a task.
+        max_pending (int): Chunks in flight before the reader waits.
+        resume (bool): Skip records an interrupted run already wrote.
+        chunked (bool): Split records into section chunks; defaults to True
+            for the collections in CHUNKED_COLLECTIONS.
+
+    Returns:
+        dict: Counts of added, changed, skipped, deleted and resumed
+        documents (chunks, for chunked collections).
+    """
+    cpu_count = os.cpu_count() or 1
+    if workers is None:
+        # Each worker loads its own copy of the model, so keep the pool small
+        workers = int(os.getenv("INGEST_WORKERS", str(min(2, cpu_count))))
+    chunk_size = chunk_size or int(os.getenv("INGEST_CHUNK_SIZE", "256"))
+    batch_size = batch_size or int(os.getenv("EMBED_BATCH_SIZE", "32"))
+    max_pending = max_pending or max(2, 2 * workers)
+    if chunked is None:
+        chunked = collection_name in CHUNKED_COLLECTIONS
+
+    state = SyncState(collection_name)
+    try:
+        state.load_stored(collection)
+    except Exception:
+        state.close()
+        raise
+    resume_from = load_checkpoint(collection_name, path) if resume else 0
+    counts = {"added": 0, "changed": 0, "skipped": 0, "deleted": 0, "resumed": 0}
+
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            # Spawned workers start clean and get an equal share of the cores
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(max(1, cpu_count // workers),),
+        )
+    else:
+        # The same model instance the app uses when both run in one process
+        from rag.embedding import get_embedding_model
+
+        embedding_model = get_embedding_model()
+
+    pending = deque()
+
+    def submit(chunk, records_done):
+        texts = [text for _, text, _, _ in chunk]
+        if executor is not None:
+            future = executor.submit(_embed_chunk, texts, batch_size)
+        else:
+            future = Future()
+            future.set_result(embedding_model.embed_batch(texts, batch_size=batch_size))
+        pending.append((future, chunk, records_done))
+
+    def write_oldest():
+        # Chunks are written in source order so the checkpoint stays valid
+        future, chunk, records_done = pending.popleft()
+        embeddings = future.result()
+        collection.upsert(
+            ids=[doc_id for doc_id, _, _, _ in chunk],
+            documents=[text for _, text, _, _ in chunk],
+            metadatas=[metadata for _, _, metadata, _ in chunk],
+            embeddings=embeddings.tolist(),
+        )
+        for _, _, _, is_new in chunk:
+            counts["added" if is_new else "changed"] += 1
+        save_checkpoint(collection_name, path, records_done)
+
+    chunk: List = []
+    try:
+        for index, doc in enumerate(stream_records(path)):
+            text = doc.get(text_key, "")
+            if not text:
+                continue
+            doc_id = document_id(collection_name, doc, text)
+            if not state.add_record(doc_id):
+                print(f"Duplicate id '{doc_id}' in {path}; keeping the first one")
+                continue
+
+            units = document_units(doc_id, text, flatten_metadata(doc), chunked)
+            state.add_seen(unit_id for unit_id, _, _ in units)
+
+            if index < resume_from:
+                counts["resumed"] += len(units)
+                continue
+
+            for unit_id, unit_text, metadata in units:
+                stored, stored_hash = state.stored_hash(unit_id)
+                if stored and stored_hash == metadata["content_hash"]:
+                    counts["skipped"] += 1
+                    continue
+                chunk.append((unit_id, unit_text, metadata, not stored))
+            if len(chunk) >= chunk_size:
+                submit(chunk, index + 1)
+                chunk = []
+                while len(pending) >= max_pending:
+                    write_oldest()
+
+        if chunk:
+            submit(chunk, index + 1)
+        while pending:
+            write_oldest()
+
+        if not state.any_seen():
+            # Never wipe a collection because its source came back empty
+            print(f"No data found in {path}. Nothing to delete.")
+            clear_checkpoint(collection_name)
+            return counts
+
+        for deleted in state.unseen_stored(chunk_size):
+            collection.delete(ids=deleted)
+            counts["deleted"] += len(deleted)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        state.close()
+
+    clear_checkpoint(collection_name)
+    return counts
@@ -0,0 +1,333 @@
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .vector_store import content_signature
+
+load_dotenv()
+
+COMPACT_MODES = ("float16", "int8", "binary")
+
+DEFAULT_COMPACT_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "database", "compact_index")
+)
+
+# Shortlist size as a multiple of k; sign bits need a wider net than scalars
+DEFAULT_OVERSAMPLE = {"float16": 4, "int8": 4, "binary": 16}
+
+# Set bits per byte value, for NumPy releases without np.bitwise_count (< 2.0)
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def _hamming(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Differing bits between each row of packed codes and the query"""
+    differences = codes ^ query_bits
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(differences).sum(axis=1)
+    return _POPCOUNT[differences].sum(axis=1)
+
+
+class CompactIndex:
+    """Quantized copy of a collection's vectors with exact rescoring.
+
+    Candidate search runs over compact codes kept in memory (float16, int8
+    with a per-vector scale, or sign bits of the mean-centred vector). The
+    best ``k * oversample`` candidates are then rescored with the exact
+    squared L2 distance (Chroma's default metric) against the float32 vectors,
+    which stay in a memory-mapped file and are only paged in for the
+    shortlisted rows. ``signature`` is the ``content_signature`` of the
+    documents the index was built from, to tell when it is out of date.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        mode: str,
+        ids: List[str],
+        metadatas: List[Dict[str, Any]],
+        vectors: np.ndarray,
+        codes: np.ndarray,
+        norms: np.ndarray,
+        scales: Optional[np.ndarray] = None,
+        mean: Optional[np.ndarray] = None,
+        oversample: int = None,
+        signature: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.mode = mode
+        self.ids = ids
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self.codes = codes
+        self.norms = norms
+        self.scales = scales
+        self.mean = mean
+        if oversample is None:
+            oversample = int(
+                os.getenv("COMPACT_OVERSAMPLE", str(DEFAULT_OVERSAMPLE[mode]))
+            )
+        self.oversample = max(1, oversample)
+        self.signature = signature
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # --- Building ---
+
+    @classmethod
+    def build(
+        cls,
+        collection,
+        directory: str,
+        mode: str = "int8",
+        page_size: int = 5000,
+        block_size: int = 8192,
+    ) -> "CompactIndex":
+        """Export a Chroma collection's vectors and quantize them into ``directory``"""
+        if mode not in COMPACT_MODES:
+            raise ValueError(f"Unknown compact mode {mode!r}; expected {COMPACT_MODES}")
+
+        tmp_dir = directory.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        count = collection.count()
+        ids: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        vectors = None
+        offset = 0
+        while offset < count:
+            page = collection.get(
+                include=["embeddings", "metadatas"], limit=page_size, offset=offset
+            )
+            if not page["ids"]:
+                break
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    os.path.join(tmp_dir, "vectors.npy"),
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(count, embeddings.shape[1]),
+                )
+            vectors[offset : offset + len(embeddings)] = embeddings
+            ids.extend(page["ids"])
+            metadatas.extend(m or {} for m in page["metadatas"])
+            offset += len(page["ids"])
+
+        if vectors is None:
+            raise ValueError("Cannot build a compact index of an empty collection")
+        vectors.flush()
+        vectors = vectors[: len(ids)]
+
+        # Quantize block by block so the float32 matrix is never fully resident
+        count, dimension = vectors.shape
+        norms = np.empty(count, dtype=np.float32)
+        scales = None
+        mean = None
+        if mode == "float16":
+            codes = np.empty((count, dimension), dtype=np.float16)
+        elif mode == "int8":
+            codes = np.empty((count, dimension), dtype=np.int8)
+            scales = np.empty(count, dtype=np.float32)
+        else:
+            mean = np.zeros(dimension, dtype=np.float64)
+            for start in range(0, count, block_size):
+                mean += vectors[start : start + block_size].sum(axis=0)
+            mean = (mean / count).astype(np.float32)
+            codes = np.empty((count, (dimension + 7) // 8), dtype=np.uint8)
+
+        for start in range(0, count, block_size):
+            block = np.asarray(vectors[start : start + block_size])
+            end = start + len(block)
+            norms[start:end] = np.einsum("ij,ij->i", block, block)
+            if mode == "float16":
+                codes[start:end] = block.astype(np.float16)
+            elif mode == "int8":
+                block_scales = np.abs(block).max(axis=1) / 127.0
+                block_scales[block_scales == 0] = 1.0
+                scales[start:end] = block_scales
+                codes[start:end] = np.round(block / block_scales[:, None]).astype(
+                    np.int8
+                )
+            else:
+                codes[start:end] = np.packbits(block > mean, axis=1)
+
+        arrays = {"codes": codes, "norms": norms}
+        if scales is not None:
+            arrays["scales"] = scales
+        if mean is not None:
+            arrays["mean"] = mean
+        np.savez(os.path.join(tmp_dir, "codes.npz"), **arrays)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "mode": mode,
+                    "count": count,
+                    "dimension": dimension,
+                    "ids": ids,
+                    "metadatas": metadatas,
+                    "signature": content_signature(ids, metadatas),
+                },
+                f,
+            )
+
+        del vectors
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str, oversample: int = None) -> "CompactIndex":
+        """Load the codes into memory and memory-map the float32 vectors"""
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with np.load(os.path.join(directory, "codes.npz")) as arrays:
+            arrays = {name: arrays[name] for name in arrays.files}
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        return cls(
+            directory,
+            manifest["mode"],
+            manifest["ids"],
+            manifest["metadatas"],
+            vectors,
+            arrays["codes"],
+            arrays["norms"],
+            scales=arrays.get("scales"),
+            mean=arrays.get("mean"),
+            oversample=oversample,
+            signature=manifest.get("signature"),
+        )
+
+    # --- Search ---
+
+    def _mask(self, filters: Dict = None) -> Optional[np.ndarray]:
+        """Rows whose metadata equals every filter value"""
+        if not filters:
+            return None
+        return np.fromiter(
+            (
+                all(metadata.get(key) == value for key, value in filters.items())
+                for metadata in self.metadatas
+            ),
+            dtype=bool,
+            count=len(self.metadatas),
+        )
+
+    def _approximate(self, query: np.ndarray, block_size: int = 8192) -> np.ndarray:
+        """Candidate scores from the codes; lower is closer"""
+        if self.mode == "binary":
+            query_bits = np.packbits(query > self.mean)
+            return _hamming(self.codes, query_bits)
+
+        # ||x||^2 - 2 q.x ranks like the squared L2 distance
+        dots = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), block_size):
+            block = self.codes[start : start + block_size].astype(np.float32)
+            dots[start : start + len(block)] = block @ query
+        if self.mode == "int8":
+            dots *= self.scales
+        return self.norms - 2.0 * dots
+
+    def _exact(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(self.vectors[np.sort(rows)])
+        order = np.argsort(np.argsort(rows))
+        vectors = vectors[order]
+        return self.norms[rows] + float(query @ query) - 2.0 * (vectors @ query)
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        k: int = 5,
+        filters: Dict = None,
+        exact: bool = False,
+    ) -> List[Tuple[str, Dict[str, Any], float]]:
+        """
+        Nearest documents to a query embedding.
+
+        Args:
+            query_embedding: The query vector.
+            k (int): Number of results.
+            filters (dict): Equality filters on metadata.
+            exact (bool): Score every row against the float32 vectors instead
+                of shortlisting with the codes (used to measure recall).
+
+        Returns:
+            list: ``(id, metadata, squared L2 distance)`` tuples, closest first.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        mask = self._mask(filters)
+        candidates = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+
+        if exact:
+            shortlist = candidates
+        else:
+            scores = self._approximate(query)
+            if mask is not None:
+                scores = scores[candidates]
+            size = min(len(candidates), max(k, k * self.oversample))
+            best = np.argpartition(scores, size - 1)[:size]
+            shortlist = candidates[best]
+
+        distances = self._exact(query, shortlist)
+        size = min(k, len(shortlist))
+        top = np.argpartition(distances, size - 1)[:size]
+        top = top[np.argsort(distances[top])]
+        return [
+            (self.ids[row], self.metadatas[row], float(distances[i]))
+            for i, row in zip(top, shortlist[top])
+        ]
+
+    def recall_at_k(
+        self, query_embeddings: Sequence[Sequence[float]], k: int = 5
+    ) -> float:
+        """Share of the exact top-k that the compact search also returns"""
+        found = 0
+        total = 0
+        for query_embedding in query_embeddings:
+            truth = {
+                doc_id for doc_id, _, _ in self.search(query_embedding, k, exact=True)
+            }
+            approx = {doc_id for doc_id, _, _ in self.search(query_embedding, k)}
+            found += len(truth & approx)
+            total += len(truth)
+        return found / total if total else 1.0
+
+    def memory(self) -> Dict[str, Any]:
+        """Resident bytes of the compact index vs an in-memory float32 matrix"""
+        full = self.vectors.shape[0] * self.vectors.shape[1] * 4
+        resident = self.codes.nbytes + self.norms.nbytes
+        for extra in (self.scales, self.mean):
+            if extra is not None:
+                resident += extra.nbytes
+        return {
+            "mode": self.mode,
+            "vectors": len(self),
+            "float32_bytes": full,
+            "resident_bytes": resident,
+            "saved_bytes": full - resident,
+            "saved_pct": 100.0 * (full - resident) / full if full else 0.0,
+        }
+
+
+def compact_mode_from_env() -> Optional[str]:
+    """VECTOR_COMPACT_MODE, or None when compact storage is off"""
+    mode = os.getenv("VECTOR_COMPACT_MODE", "").strip().lower()
+    if not mode or mode == "none":
+        return None
+    if mode not in COMPACT_MODES:
+        print(f"Unknown VECTOR_COMPACT_MODE {mode!r}; compact storage disabled")
+        return None
+    return mode
+
+
+def compact_index_dir(collection_name: str) -> str:
+    return os.path.join(
+        os.getenv("COMPACT_INDEX_DIR") or DEFAULT_COMPACT_DIR, collection_name
+    )
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Prompt context budgets in tokens; intra-op answers are on the critical path
+DEFAULT_PHASE_BUDGETS = {"pre-op": 3000, "intra-op": 1500, "post-op": 2500}
+
+
+def _phase_budgets_from_env() -> Dict[str, int]:
+    """Parse CONTEXT_PHASE_BUDGETS, e.g. "pre-op=3000,intra-op=1500" """
+    budgets = dict(DEFAULT_PHASE_BUDGETS)
+    for item in os.getenv("CONTEXT_PHASE_BUDGETS", "").split(","):
+        phase, _, value = item.partition("=")
+        if phase.strip() and value.strip():
+            try:
+                budgets[phase.strip()] = int(value)
+            except ValueError:
+                print(f"Ignoring invalid context budget {item!r}")
+    return budgets
+
+
+class ContextPacker:
+    """Assembles retrieved documents into a prompt context under a token budget.
+
+    Candidates from every collection are ranked together by distance (patient
+    notes served from the patient index have no distance and rank first, most
+    recent first), duplicates and chunks overlapping an already selected chunk
+    of the same document are dropped, and documents are added until the
+    phase's budget is spent. The patient record, when present, always goes
+    first. Every pack reports the tokens it used and dropped.
+    """
+
+    def __init__(
+        self,
+        phase_budgets: Dict[str, int] = None,
+        default_budget: int = None,
+        counter: Callable[[str], int] = None,
+    ):
+        self.phase_budgets = phase_budgets or _phase_budgets_from_env()
+        self.default_budget = default_budget or int(
+            os.getenv("CONTEXT_TOKEN_BUDGET", "2500")
+        )
+        self._counter = counter
+        self._lock = threading.Lock()
+        self.totals = {"packs": 0, "used_tokens": 0, "dropped_tokens": 0}
+
+    def count_tokens(self, text: str) -> int:
+        """Token count of a text; the embedding tokenizer approximates the LLM's"""
+        if self._counter is None:
+            from .embedding import embedding_model
+
+            self._counter = embedding_model.count_tokens
+        return self._counter(text)
+
+    def budget_for(self, phase: str = None) -> int:
+        return self.phase_budgets.get(phase, self.default_budget)
+
+    @staticmethod
+    def _fingerprint(document: str) -> str:
+        return hashlib.sha256(" ".join(document.split()).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _overlaps(metadata: Dict[str, Any], spans: Dict[str, List[Tuple[int, int]]]):
+        """Whether a chunk overlaps a selected chunk of the same document"""
+        if "chunk_index" not in metadata or "char_start" not in metadata:
+            return False
+        start, end = int(metadata["char_start"]), int(metadata["char_end"])
+        return any(
+            start < other_end and other_start < end
+            for other_start, other_end in spans.get(metadata.get("doc_id"), [])
+        )
+
+    def _candidates(
+        self,
+        results: Dict[str, List[Dict[str, Any]]],
+        patient_id: str = None,
+    ) -> List[Dict[str, Any]]:
+        """All results in rank order, tagged with their collection"""
+        candidates = []
+        for collection, collection_results in results.items():
+            for position, result in enumerate(collection_results):
+                metadata = result.get("metadata") or {}
+                # The patient record is added separately
+                if (
+                    patient_id
+                    and collection == "patients"
+                    and metadata.get("patient_id") == patient_id
+                ):
+                    continue
+                candidates.append(
+                    {"collection": collection, "position": position, **result}
+                )
+
+        def rank(candidate):
+            distance = candidate.get("distance")
+            if distance is None:
+                return (0, 0.0, candidate["position"])
+            return (1, float(distance), candidate["position"])
+
+        return sorted(candidates, key=rank)
+
+    def pack(
+        self,
+        patient_info: Optional[Dict[str, Any]],
+        results: Dict[str, List[Dict[str, Any]]],
+        phase: str = None,
+        patient_id: str = None,
+        budget: int = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Build the prompt context for one turn.
+
+        Args:
+            patient_info: The patient record to put first, if any.
+            results: Retrieval results keyed by collection name.
+            phase: Surgical phase, selecting the token budget.
+            patient_id: The patient of a patient-specific turn.
+            budget: Overrides the phase budget.
+
+        Returns:
+            tuple: The context string and a stats dict with the budget, the
+            tokens used and dropped, and candidate/included/duplicate counts.
+        """
+        budget = budget if budget is not None else self.budget_for(phase)
+        used = 0
+        dropped_tokens = 0
+        dropped = 0
+        duplicates = 0
+        seen = set()
+        spans: Dict[str, List[Tuple[int, int]]] = {}
+        selected: Dict[str, List[str]] = {}
+
+        patient_section = ""
+        if patient_info:
+            patient_section = (
+                f"\n\n--- Patient Information ---\n{patient_info['document']}\n"
+            )
+            used += self.count_tokens(patient_section)
+            seen.add(self._fingerprint(patient_info["document"]))
+
+        candidates = self._candidates(results, patient_id)
+        for candidate in candidates:
+            document = candidate["document"]
+            metadata = candidate.get("metadata") or {}
+            fingerprint = self._fingerprint(document)
+            if fingerprint in seen or self._overlaps(metadata, spans):
+                duplicates += 1
+                continue
+            seen.add(fingerprint)
+
+            collection = candidate["collection"]
+            text = f"\n{document}\n"
+            tokens = self.count_tokens(text)
+            if collection not in selected:
+                tokens += self.count_tokens(
+                    f"\n\n--- Information from {collection} ---\n"
+                )
+            if used + tokens > budget:
+                # Keep going: a shorter, lower-ranked document may still fit
+                dropped += 1
+                dropped_tokens += tokens
+                continue
+
+            used += tokens
+            selected.setdefault(collection, []).append(text)
+            if "chunk_index" in metadata and "char_start" in metadata:
+                spans.setdefault(metadata.get("doc_id"), []).append(
+                    (int(metadata["char_start"]), int(metadata["char_end"]))
+                )
+
+        context = patient_section
+        for collection, texts in selected.items():
+            context += f"\n\n--- Information from {collection} ---\n"
+            context += "".join(texts)
+
+        stats = {
+            "phase": phase,
+            "budget": budget,
+            "used_tokens": used,
+            "dropped_tokens": dropped_tokens,
+            "candidates": len(candidates),
+            "included": sum(len(texts) for texts in selected.values()),
+            "duplicates": duplicates,
+            "dropped": dropped,
+        }
+        with self._lock:
+            self.totals["packs"] += 1
+            self.totals["used_tokens"] += used
+            self.totals["dropped_tokens"] += dropped_tokens
+        return context, stats
+
+    def stats(self) -> Dict[str, Any]:
+        """Cumulative token usage for the debug panel"""
+        with self._lock:
+            return {
+                **self.totals,
+                "phase_budgets": dict(self.phase_budgets),
+                "default_budget": self.default_budget,
+            }
+
+
+# Singleton instance
+context_packer = ContextPacker()
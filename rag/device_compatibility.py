@@ -0,0 +1,293 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .vector_store import collection_signature, content_signature
+
+load_dotenv()
+
+# criterion -> (patient metadata key, label, unit)
+PATIENT_ANATOMY_FIELDS = {
+    "proximal_diameter": ("aortic_neck_diameter_mm", "Aortic neck diameter", "mm"),
+    "distal_diameter": ("distal_landing_diameter_mm", "Distal landing diameter", "mm"),
+    "neck_length": ("neck_length_mm", "Neck length", "mm"),
+    "neck_angulation": ("neck_angulation_deg", "Neck angulation", "deg"),
+    "iliac_access": ("iliac_access_diameter_mm", "Iliac access diameter", "mm"),
+}
+CRITERIA = tuple(PATIENT_ANATOMY_FIELDS)
+
+
+def _json_field(metadata: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """A nested record field, stored as a JSON string by flatten_metadata"""
+    value = metadata.get(key)
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _range(values) -> Tuple[float, float]:
+    if isinstance(values, (list, tuple)) and len(values) >= 2:
+        return float(values[0]), float(values[-1])
+    return np.nan, np.nan
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def patient_anatomy(metadata: Dict[str, Any]) -> Dict[str, float]:
+    """The measurements in a patient record, keyed by criterion"""
+    metadata = metadata or {}
+    anatomy = {}
+    for criterion, (key, _, _) in PATIENT_ANATOMY_FIELDS.items():
+        value = _number(metadata.get(key))
+        if not np.isnan(value):
+            anatomy[criterion] = value
+    return anatomy
+
+
+class DeviceCompatibility:
+    """Vectorized patient-device anatomical compatibility checks.
+
+    Device sizing and anatomical requirements are parsed once into columns of
+    ``low`` and ``high`` bounds per criterion (NaN where a device has no
+    bound), so a patient is checked against every device in one broadcast
+    comparison. Patients with a measurement outside a device's bound reject
+    it; criteria the patient has no measurement for are reported as
+    unchecked rather than rejected. Compatible devices are ranked by their
+    smallest normalized margin, so devices the patient sits comfortably
+    inside come first. Devices with no bound the patient could be checked
+    against are not ranked but listed as unverified.
+
+    Rows of the patient x device matrix are cached per patient and reused
+    while the patient's measurements are unchanged. ``signature`` is the
+    ``content_signature`` of the device documents the bounds were parsed
+    from, to tell when the engine is out of date.
+    """
+
+    def __init__(
+        self,
+        doc_ids: List[str],
+        device_ids: List[str],
+        device_names: List[str],
+        low: np.ndarray,
+        high: np.ndarray,
+        signature: Optional[str] = None,
+    ):
+        self.doc_ids = doc_ids
+        self.device_ids = device_ids
+        self.device_names = device_names
+        # (criteria, devices)
+        self.low = low
+        self.high = high
+        self.signature = signature
+        self._rows: Dict[str, Tuple[Tuple[float, ...], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.device_ids)
+
+    @classmethod
+    def from_metadatas(
+        cls, doc_ids: List[str], metadatas: List[Dict[str, Any]]
+    ) -> "DeviceCompatibility":
+        low = np.full((len(CRITERIA), len(doc_ids)), np.nan)
+        high = np.full((len(CRITERIA), len(doc_ids)), np.nan)
+        device_ids, device_names = [], []
+        for column, (doc_id, metadata) in enumerate(zip(doc_ids, metadatas)):
+            metadata = metadata or {}
+            device_ids.append(metadata.get("device_id", doc_id))
+            device_names.append(metadata.get("device_name", ""))
+            sizing = _json_field(metadata, "sizing")
+            requirements = _json_field(metadata, "anatomical_requirements")
+            bounds = {
+                "proximal_diameter": _range(sizing.get("proximal_diameter_range_mm")),
+                "distal_diameter": _range(sizing.get("distal_diameter_range_mm")),
+                "neck_length": (
+                    _number(requirements.get("min_neck_length_mm")),
+                    np.nan,
+                ),
+                "neck_angulation": (
+                    np.nan,
+                    _number(requirements.get("max_neck_angulation_deg")),
+                ),
+                "iliac_access": (
+                    _number(requirements.get("iliac_access_min_mm")),
+                    _number(requirements.get("iliac_access_max_mm")),
+                ),
+            }
+            for row, criterion in enumerate(CRITERIA):
+                low[row, column], high[row, column] = bounds[criterion]
+        return cls(
+            list(doc_ids),
+            device_ids,
+            device_names,
+            low,
+            high,
+            signature=content_signature(doc_ids, metadatas),
+        )
+
+    @classmethod
+    def build(cls, collection, page_size: int = 5000) -> "DeviceCompatibility":
+        """Parse the bounds of every device in the devices collection"""
+        doc_ids: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            doc_ids.extend(page["ids"])
+            metadatas.extend(page["metadatas"])
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        return cls.from_metadatas(doc_ids, metadatas)
+
+    def matrix(self, anatomies: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Check patients against all devices in one pass.
+
+        ``anatomies`` is (patients, criteria) with NaN for missing
+        measurements. Returns ``(failures, margins)``: failures is a
+        (patients, criteria, devices) boolean array and margins the
+        (patients, devices) smallest normalized distance to a bound, NaN
+        where none of the device's bounds could be checked.
+        """
+        values = np.asarray(anatomies, dtype=np.float64)[:, :, None]
+        with np.errstate(invalid="ignore"):
+            below = values < self.low[None]
+            above = values > self.high[None]
+            failures = below | above
+
+            # Margin to each bound as a fraction of the range (or of the bound)
+            span = self.high - self.low
+            scale = np.where(
+                np.isnan(span) | (span <= 0),
+                np.fmax(np.abs(self.low), np.abs(self.high)),
+                span,
+            )
+            scale = np.where(np.isnan(scale) | (scale == 0), 1.0, scale)[None]
+            margins = np.fmin(values - self.low[None], self.high[None] - values) / scale
+        checked = ~np.isnan(margins).all(axis=1)
+        margins = np.where(np.isnan(margins), np.inf, margins).min(axis=1)
+        margins[~checked] = np.nan
+        return failures, margins
+
+    def _rejections(self, failures: np.ndarray, anatomy: np.ndarray, column: int):
+        reasons = []
+        for row in np.flatnonzero(failures[:, column]):
+            criterion = CRITERIA[row]
+            _, label, unit = PATIENT_ANATOMY_FIELDS[criterion]
+            value, low, high = (
+                anatomy[row],
+                self.low[row, column],
+                self.high[row, column],
+            )
+            if value < low:
+                bound = f"below minimum {low:g} {unit}"
+            else:
+                bound = f"above maximum {high:g} {unit}"
+            reasons.append(f"{label} {value:g} {unit} {bound}")
+        return reasons
+
+    def _evaluate_rows(self, anatomies: np.ndarray) -> List[Dict[str, Any]]:
+        failures, margins = self.matrix(anatomies)
+        results = []
+        for patient, anatomy in enumerate(anatomies):
+            rejected_mask = failures[patient].any(axis=0)
+            unverified_mask = ~rejected_mask & np.isnan(margins[patient])
+            compatible = np.flatnonzero(~rejected_mask & ~unverified_mask)
+            order = compatible[np.argsort(-margins[patient, compatible], kind="stable")]
+            results.append(
+                {
+                    "compatible": [
+                        {
+                            "doc_id": self.doc_ids[column],
+                            "device_id": self.device_ids[column],
+                            "device_name": self.device_names[column],
+                            "margin": float(margins[patient, column]),
+                        }
+                        for column in order
+                    ],
+                    "rejected": {
+                        self.device_ids[column]: self._rejections(
+                            failures[patient], anatomy, column
+                        )
+                        for column in np.flatnonzero(rejected_mask)
+                    },
+                    "unverified": [
+                        {
+                            "doc_id": self.doc_ids[column],
+                            "device_id": self.device_ids[column],
+                            "device_name": self.device_names[column],
+                            "reason": "No sizing bounds for the patient's measurements",
+                        }
+                        for column in np.flatnonzero(unverified_mask)
+                    ],
+                    "unchecked": [
+                        criterion
+                        for criterion, value in zip(CRITERIA, anatomy)
+                        if np.isnan(value)
+                    ],
+                }
+            )
+        return results
+
+    @staticmethod
+    def _vector(anatomy: Dict[str, float]) -> Tuple[float, ...]:
+        return tuple(float(anatomy.get(criterion, np.nan)) for criterion in CRITERIA)
+
+    def evaluate_all(self, anatomies: Dict[str, Dict[str, float]]):
+        """Fill the cached matrix for many patients with one vectorized pass"""
+        stale = {}
+        with self._lock:
+            for patient_id, anatomy in anatomies.items():
+                key = self._vector(anatomy)
+                cached = self._rows.get(patient_id)
+                if cached is None or not np.array_equal(cached[0], key, equal_nan=True):
+                    stale[patient_id] = key
+        if not stale:
+            return
+        rows = self._evaluate_rows(np.array(list(stale.values()), dtype=np.float64))
+        with self._lock:
+            for (patient_id, key), result in zip(stale.items(), rows):
+                self._rows[patient_id] = (key, result)
+
+    def evaluate(self, patient_id: str, anatomy: Dict[str, float]) -> Dict[str, Any]:
+        """Ranked compatible devices and rejection reasons for one patient.
+
+        Returns ``{"compatible": [...], "rejected": {device_id: [reasons]},
+        "unverified": [...], "unchecked": [criteria]}``, served from the cached matrix row while
+        the patient's measurements are unchanged.
+        """
+        self.evaluate_all({patient_id: anatomy})
+        with self._lock:
+            return self._rows[patient_id][1]
+
+
+def compatibility_enabled() -> bool:
+    return os.getenv("DEVICE_COMPATIBILITY", "true").lower() == "true"
+
+
+def load_for(
+    collection, current: Optional[DeviceCompatibility] = None, signature: str = None
+):
+    """Reuse ``current`` while the devices collection's contents are unchanged.
+
+    ``signature`` is the collection's current ``collection_signature``; it is
+    read from the collection when not given.
+    """
+    if current is not None:
+        if signature is None:
+            signature = collection_signature(collection)
+        if current.signature == signature:
+            return current
+    return DeviceCompatibility.build(collection)
@@ -1,28 +1,363 @@
-import torch
-from transformers import AutoModel, AutoTokenizer
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
 
+DEFAULT_MODEL_NAME = "BAAI/bge-large-en-v1.5"
+
+
+class EmbeddingCache:
+    """LRU cache of query embeddings with TTL expiry and an optional SQLite store.
+
+    Entries are keyed by (model name, normalized text). The in-memory layer is
+    bounded by ``max_entries``; when ``db_path`` is set, embeddings are also
+    written to SQLite so they survive process restarts.
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, ttl_seconds: float = 86400, db_path: str = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._conn = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL, "
+                "vector BLOB NOT NULL, PRIMARY KEY (model, text))"
+            )
+            self._conn.commit()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds
+
+    def _remember(self, key: Tuple[str, str], created: float, vector: np.ndarray):
+        self._entries[key] = (created, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding, or None on a miss"""
+        key = (model_name, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, vector = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT created, vector FROM embeddings WHERE model = ? AND text = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    created, blob = row
+                    if not self._expired(created):
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, created, vector)
+                        self.disk_hits += 1
+                        return vector
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE model = ? AND text = ?", key
+                    )
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, model_name: str, text: str, vector: np.ndarray):
+        """Store an embedding in memory and, if configured, on disk"""
+        key = (model_name, text)
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, vector)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text, created, vector) "
+                    "VALUES (?, ?, ?, ?)",
+                    (model_name, text, created, vector.tobytes()),
+                )
+                self._conn.commit()
+
+    def clear(self):
+        """Drop every cached embedding, including the on-disk store"""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+def _cache_from_env() -> Optional[EmbeddingCache]:
+    """Build the query embedding cache from EMBEDDING_CACHE_* settings"""
+    max_entries = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+    if max_entries <= 0:
+        return None
+    return EmbeddingCache(
+        max_entries=max_entries,
+        ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL", "86400")),
+        db_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+    )
+
 
 class EmbeddingModel:
-    def __init__(self):
-        self.model_name = "BAAI/bge-large-en-v1.5"
-        self.model = AutoModel.from_pretrained(self.model_name, trust_remote_code=True)
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            self.model_name, trust_remote_code=True
+    """Embeds texts with a HuggingFace encoder, loading it on first use.
+
+    Constructing the model is cheap: transformers and the backend are only
+    imported, and the tokenizer and weights only loaded, when they are first
+    needed (or by ``load`` / ``warmup``). Load times are recorded in
+    ``load_timings``.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        max_length: int = 512,
+        cache: EmbeddingCache = None,
+        backend: str = None,
+        intra_op_threads: int = None,
+        inter_op_threads: int = None,
+    ):
+        """
+        Args:
+            model_name (str): HuggingFace model to embed with.
+            max_length (int): Tokens per input; longer texts are truncated.
+            cache (EmbeddingCache): Query embedding cache; defaults to EMBEDDING_CACHE_*.
+            backend (str): "torch" (fp32), "int8" (torch dynamic quantization)
+                or "onnx" (ONNX Runtime); defaults to EMBEDDING_BACKEND.
+            intra_op_threads (int): Threads per operator; 0 keeps the default.
+            inter_op_threads (int): Operators run concurrently; 0 keeps the default.
+        """
+        self.model_name = model_name
+        self.max_length = max_length
+        self.backend_name = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.cache = cache if cache is not None else _cache_from_env()
+
+        self._tokenizer = None
+        self._backend = None
+        self._load_lock = threading.RLock()
+        self._warmup_thread: Optional[threading.Thread] = None
+        self.load_timings: Dict[str, float] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._backend is not None
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._load_lock:
+                if self._tokenizer is None:
+                    start = time.perf_counter()
+                    from transformers import AutoTokenizer
+
+                    self._tokenizer = AutoTokenizer.from_pretrained(
+                        self.model_name, trust_remote_code=True
+                    )
+                    self.load_timings["tokenizer_seconds"] = round(
+                        time.perf_counter() - start, 4
+                    )
+        return self._tokenizer
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._load_lock:
+                if self._backend is None:
+                    input_names = self.tokenizer.model_input_names
+                    start = time.perf_counter()
+                    from .embedding_backends import create_backend
+
+                    intra_op_threads = self.intra_op_threads
+                    if intra_op_threads is None:
+                        intra_op_threads = int(
+                            os.getenv("EMBEDDING_INTRA_OP_THREADS", "0")
+                        )
+                    inter_op_threads = self.inter_op_threads
+                    if inter_op_threads is None:
+                        inter_op_threads = int(
+                            os.getenv("EMBEDDING_INTER_OP_THREADS", "0")
+                        )
+                    self._backend = create_backend(
+                        self.backend_name,
+                        self.model_name,
+                        input_names,
+                        intra_op_threads=intra_op_threads,
+                        inter_op_threads=inter_op_threads,
+                        onnx_path=os.getenv("EMBEDDING_ONNX_PATH") or None,
+                    )
+                    self.load_timings["weights_seconds"] = round(
+                        time.perf_counter() - start, 4
+                    )
+        return self._backend
+
+    @property
+    def dimension(self) -> int:
+        return self.backend.hidden_size
+
+    def load(self) -> "EmbeddingModel":
+        """Load the tokenizer and weights now instead of on first use"""
+        self.backend  # noqa: B018 - the property loads on access
+        return self
+
+    def warmup(self, background: bool = False) -> Optional[threading.Thread]:
+        """Load the model and run one forward pass.
+
+        With ``background`` the work runs on a daemon thread, which is
+        returned; callers embedding before it finishes wait for the load.
+        Repeated calls reuse the thread that is already running.
+        """
+
+        def run():
+            self.load()
+            start = time.perf_counter()
+            self._encode(["warmup"])
+            self.load_timings.setdefault(
+                "first_inference_seconds", round(time.perf_counter() - start, 4)
+            )
+
+        if not background:
+            run()
+            return None
+        with self._load_lock:
+            if self._warmup_thread is None or not self._warmup_thread.is_alive():
+                self._warmup_thread = threading.Thread(
+                    target=run, name="embedding-warmup", daemon=True
+                )
+                self._warmup_thread.start()
+            return self._warmup_thread
+
+    @property
+    def model_key(self) -> str:
+        """Model identity for cached vectors; quantized backends differ slightly from fp32"""
+        # The requested backend until loaded, so cache hits need no weights
+        name = self._backend.name if self._backend is not None else self.backend_name
+        if name == "torch":
+            return self.model_name
+        return f"{self.model_name}@{name}"
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Runs one padded forward pass and mean-pools over the real tokens only"""
+        inputs = dict(
+            self.tokenizer(
+                texts,
+                return_tensors="np",
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+            )
         )
+        hidden = self.backend.forward(inputs)
+        # Padding positions must not contribute to the mean
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        summed = (hidden * mask).sum(axis=1)
+        counts = np.maximum(mask.sum(axis=1), 1.0)
+        return (summed / counts).astype(np.float32)
+
+    def embed_batch(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Generates embeddings for many texts as a (len(texts), dim) float32 matrix.
+
+        Inputs are sorted by length before batching so each batch is padded to
+        a similar size; rows are returned in the original input order.
+        """
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return embeddings
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start : start + batch_size]
+            embeddings[batch_idx] = self._encode([texts[i] for i in batch_idx])
+
+        return np.ascontiguousarray(embeddings)
+
+    def normalize(self, text: str) -> str:
+        """Canonical form of a text for cache lookups"""
+        normalized = " ".join(text.split())
+        if getattr(self.tokenizer, "do_lower_case", False):
+            normalized = normalized.lower()
+        return normalized
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokenizer tokens in a text, without special tokens"""
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
 
     def embed_text(self, text):
-        """Generates an embedding for the given text"""
-        inputs = self.tokenizer(
-            text, return_tensors="pt", truncation=True, max_length=512
-        )
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            embedding = outputs.last_hidden_state.mean(dim=1).squeeze().tolist()
-        return embedding
+        """Generates an embedding for the given text, served from the cache when possible"""
+        if self.cache is None:
+            return self.embed_batch([text])[0].tolist()
+
+        key = self.normalize(text)
+        vector = self.cache.get(self.model_key, key)
+        if vector is None:
+            vector = self.embed_batch([key])[0]
+            self.cache.put(self.model_key, key, vector)
+        return vector.tolist()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit-rate counters of the query embedding cache"""
+        return self.cache.stats() if self.cache is not None else {}
+
+
+_models: Dict[Tuple[str, str, int], EmbeddingModel] = {}
+_models_lock = threading.Lock()
+
+
+def get_embedding_model(
+    model_name: str = DEFAULT_MODEL_NAME, backend: str = None, max_length: int = 512
+) -> EmbeddingModel:
+    """The process-wide model for a configuration, shared by the app and ingestion"""
+    key = (model_name, backend or os.getenv("EMBEDDING_BACKEND", "torch"), max_length)
+    with _models_lock:
+        if key not in _models:
+            _models[key] = EmbeddingModel(
+                model_name=model_name, max_length=max_length, backend=key[1]
+            )
+        return _models[key]
 
 
-# Singleton instance
-embedding_model = EmbeddingModel()
+# Singleton instance; nothing is loaded until the first embedding or warmup
+embedding_model = get_embedding_model()
@@ -0,0 +1,174 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+import torch
+from transformers import AutoModel
+
+BACKENDS = ("torch", "int8", "onnx")
+
+DEFAULT_ONNX_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "database", "onnx")
+)
+
+
+def configure_torch_threads(intra_op_threads: int = 0, inter_op_threads: int = 0):
+    """Pin torch's thread pools; 0 keeps the library default"""
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # Only allowed before the first parallel region of the process
+            print(f"Could not set inter-op threads: {e}")
+
+
+class TorchBackend:
+    """fp32 PyTorch forward pass; with ``quantize`` the Linear layers run as
+    dynamically quantized int8 (weights int8, activations quantized per batch)."""
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = False,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+    ):
+        configure_torch_threads(intra_op_threads, inter_op_threads)
+        model = AutoModel.from_pretrained(model_name, trust_remote_code=True)
+        model.eval()
+        self.hidden_size = model.config.hidden_size
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model = model
+        self.name = "int8" if quantize else "torch"
+
+    def forward(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        with torch.inference_mode():
+            outputs = self.model(
+                **{name: torch.from_numpy(value) for name, value in inputs.items()}
+            )
+        return outputs.last_hidden_state.to(torch.float32).numpy()
+
+
+class _LastHiddenState(torch.nn.Module):
+    """Positional-input wrapper so the exported graph has named tensor inputs"""
+
+    def __init__(self, model, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *tensors):
+        return self.model(**dict(zip(self.input_names, tensors))).last_hidden_state
+
+
+def export_onnx(model_name: str, path: str, input_names: List[str]):
+    """Export the model's last hidden state to ONNX with dynamic batch and length"""
+    model = AutoModel.from_pretrained(model_name, trust_remote_code=True)
+    model.eval()
+    dummy = tuple(torch.ones((2, 8), dtype=torch.long) for _ in input_names)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.onnx.export(
+        _LastHiddenState(model, input_names),
+        dummy,
+        tmp_path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        dynamo=False,
+    )
+    os.replace(tmp_path, path)
+
+
+class OnnxBackend:
+    """ONNX Runtime CPU session over an exported copy of the model.
+
+    The model is exported once to ``path`` and reused afterwards; the torch
+    weights are not kept in memory.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        input_names: List[str],
+        path: str = None,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+    ):
+        import onnxruntime as ort
+
+        self.path = path or os.path.join(
+            DEFAULT_ONNX_DIR, f"{model_name.replace('/', '__')}.onnx"
+        )
+        if not os.path.exists(self.path):
+            print(f"Exporting {model_name} to {self.path}")
+            export_onnx(model_name, self.path, input_names)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(
+            self.path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.hidden_size = self.session.get_outputs()[0].shape[-1]
+        self.name = "onnx"
+
+    def forward(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(["last_hidden_state"], feed)[0]
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Row-wise cosine similarity between two embedding matrices of the same texts"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {
+        "min_cosine": float(np.min(cosines)),
+        "mean_cosine": float(np.mean(cosines)),
+    }
+
+
+def create_backend(
+    name: str,
+    model_name: str,
+    input_names: List[str],
+    intra_op_threads: int = 0,
+    inter_op_threads: int = 0,
+    onnx_path: str = None,
+):
+    """Build an embedding backend by name, falling back to fp32 torch on failure"""
+    if name not in BACKENDS:
+        print(f"Unknown embedding backend {name!r}; using torch")
+        name = "torch"
+    if name == "onnx":
+        try:
+            return OnnxBackend(
+                model_name,
+                input_names,
+                path=onnx_path,
+                intra_op_threads=intra_op_threads,
+                inter_op_threads=inter_op_threads,
+            )
+        except Exception as e:
+            print(f"Error loading ONNX backend, using torch: {e}")
+            name = "torch"
+    return TorchBackend(
+        model_name,
+        quantize=name == "int8",
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
+    )
@@ -0,0 +1,215 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .vector_store import collection_signature, content_signature
+
+load_dotenv()
+
+# Metadata fields indexed per collection; identifiers also get exact lookup
+LEXICAL_FIELDS = {
+    "devices": ["device_id", "device_name", "manufacturer"],
+    "patients": ["patient_id"],
+    "notes": ["note_id", "patient_id"],
+}
+ID_FIELDS = {"device_id", "patient_id", "note_id"}
+
+DEFAULT_LEXICAL_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "database", "lexical_index")
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens; hyphenated ids like SG-0137 stay whole"""
+    return _TOKEN.findall(str(text).lower())
+
+
+class LexicalIndex:
+    """Inverted index with BM25 scoring over identifier and name fields.
+
+    Built from the metadata of a collection's documents (see LEXICAL_FIELDS).
+    Identifier values also go into an exact map, so a query that names a
+    device, patient or note id resolves to its documents without any vector
+    search. ``signature`` is the ``content_signature`` of the documents the
+    index was built from, to tell when it is out of date.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        doc_ids: List[str],
+        postings: Dict[str, List[Tuple[int, int]]],
+        doc_lengths: List[int],
+        exact: Dict[str, List[int]],
+        k1: float = 1.2,
+        b: float = 0.75,
+        signature: Optional[str] = None,
+    ):
+        self.collection_name = collection_name
+        self.doc_ids = doc_ids
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.exact = exact
+        self.signature = signature
+        self.k1 = k1
+        self.b = b
+        self.average_length = (
+            sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        )
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, collection, collection_name: str, page_size: int = 5000):
+        """Index the LEXICAL_FIELDS of every document in a collection"""
+        fields = LEXICAL_FIELDS.get(collection_name, [])
+        doc_ids: List[str] = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths: List[int] = []
+        exact: Dict[str, List[int]] = {}
+        metadatas: List[Dict] = []
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                metadata = metadata or {}
+                row = len(doc_ids)
+                doc_ids.append(doc_id)
+                metadatas.append(metadata)
+                tokens = []
+                for field in fields:
+                    value = metadata.get(field)
+                    if value in (None, ""):
+                        continue
+                    tokens.extend(tokenize(value))
+                    if field in ID_FIELDS:
+                        exact.setdefault(str(value).lower(), []).append(row)
+                for token, frequency in Counter(tokens).items():
+                    postings.setdefault(token, []).append((row, frequency))
+                doc_lengths.append(len(tokens))
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        return cls(
+            collection_name,
+            doc_ids,
+            postings,
+            doc_lengths,
+            exact,
+            signature=content_signature(doc_ids, metadatas),
+        )
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "collection": self.collection_name,
+                    "doc_ids": self.doc_ids,
+                    "postings": self.postings,
+                    "doc_lengths": self.doc_lengths,
+                    "exact": self.exact,
+                    "signature": self.signature,
+                },
+                f,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            data["collection"],
+            data["doc_ids"],
+            {
+                token: [tuple(p) for p in rows]
+                for token, rows in data["postings"].items()
+            },
+            data["doc_lengths"],
+            data["exact"],
+            signature=data.get("signature"),
+        )
+
+    def exact_ids(self, query: str) -> List[str]:
+        """Ids of documents whose identifier appears verbatim in the query"""
+        rows: List[int] = []
+        for token in tokenize(query):
+            for row in self.exact.get(token, []):
+                if row not in rows:
+                    rows.append(row)
+        return [self.doc_ids[row] for row in rows]
+
+    def search(self, query: str, n_results: int = 5) -> List[Tuple[str, float]]:
+        """Top documents by BM25 score as ``(id, score)`` pairs"""
+        scores: Dict[int, float] = {}
+        count = len(self.doc_ids)
+        for token in set(tokenize(query)):
+            rows = self.postings.get(token)
+            if not rows:
+                continue
+            idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            for row, frequency in rows:
+                length_norm = (
+                    1
+                    - self.b
+                    + self.b * (self.doc_lengths[row] / (self.average_length or 1.0))
+                )
+                scores[row] = scores.get(row, 0.0) + idf * (
+                    frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                )
+        best = sorted(scores.items(), key=lambda item: -item[1])[:n_results]
+        return [(self.doc_ids[row], score) for row, score in best]
+
+
+def lexical_index_path(collection_name: str) -> str:
+    return os.path.join(
+        os.getenv("LEXICAL_INDEX_DIR") or DEFAULT_LEXICAL_DIR, f"{collection_name}.json"
+    )
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """Merge ranked id lists by summing 1 / (k + rank) across them"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def lexical_enabled() -> bool:
+    return os.getenv("LEXICAL_INDEX", "true").lower() == "true"
+
+
+def load_or_build(
+    collection, collection_name: str, signature: str = None
+) -> Optional[LexicalIndex]:
+    """The saved index if it matches the collection, otherwise a fresh build.
+
+    ``signature`` is the collection's current ``collection_signature``; it is
+    read from the collection when not given.
+    """
+    if collection_name not in LEXICAL_FIELDS:
+        return None
+    path = lexical_index_path(collection_name)
+    if os.path.exists(path):
+        try:
+            index = LexicalIndex.load(path)
+            if signature is None:
+                signature = collection_signature(collection)
+            if index.signature == signature:
+                return index
+        except Exception as e:
+            print(f"Error loading lexical index for {collection_name}: {e}")
+    return LexicalIndex.build(collection, collection_name)
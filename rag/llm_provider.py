@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .llm_scheduler import LLMScheduler, ScheduledChatModel, scheduler_enabled
+
+load_dotenv()
+
+LLM_PROVIDERS = ("groq", "local")
+DEFAULT_LLM_MODEL = "llama-3.1-8b-instant"
+
+# What the local stand-in answers to routing prompts, so the LLM tier parses it
+LOCAL_ROUTING_REPLY = (
+    '{"phase": "pre-op", "collections": ["patients", "guidelines"], '
+    '"patient_specific": false, "reasoning": "Local stand-in routing."}'
+)
+LOCAL_REPLY = (
+    "This is a response from the local stand-in model. It does not call any "
+    "API and is meant for offline benchmarks and development."
+)
+
+
+class LocalChatModel(BaseChatModel):
+    """Offline stand-in for the chat API with the same LangChain interface.
+
+    Supports ``invoke``, ``stream`` and use in ``prompt | llm`` chains. It
+    answers routing prompts with a fixed routing JSON and everything else
+    with ``response``, after ``latency_seconds`` and at ``tokens_per_second``
+    (0 = instantly), so call sites can be benchmarked without network access.
+    """
+
+    model: str = "local"
+    temperature: float = 0.0
+    response: str = LOCAL_REPLY
+    latency_seconds: float = 0.0
+    tokens_per_second: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        if messages and "Respond with a JSON object" in str(messages[-1].content):
+            return LOCAL_ROUTING_REPLY
+        return self.response
+
+    def _words(self, messages: List[BaseMessage]) -> Iterator[str]:
+        time.sleep(self.latency_seconds)
+        for i, word in enumerate(self._reply(messages).split(" ")):
+            if self.tokens_per_second > 0:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield word if i == 0 else " " + word
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(self._words(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for word in self._words(messages):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+
+class LLMProvider:
+    """Hands out shared chat clients keyed by model and temperature.
+
+    Every call site asks the provider instead of building its own client, so
+    one client per (model, temperature) is created per process. Groq clients
+    all send their requests through a single keep-alive ``httpx.Client``
+    whose connection pool is bounded by ``max_connections``, so TLS
+    connections are reused across calls and call sites. With
+    LLM_PROVIDER=local the provider hands out ``LocalChatModel`` instances.
+
+    Unless LLM_SCHEDULER=false, clients are wrapped so every request goes
+    through one shared ``LLMScheduler`` (quota buckets, concurrency cap,
+    retries and deadline); the Groq SDK's own retries are then disabled.
+    """
+
+    def __init__(
+        self,
+        provider: str = None,
+        model_name: str = None,
+        max_connections: int = None,
+        timeout_seconds: float = None,
+        scheduler: LLMScheduler = None,
+        base_url: str = None,
+    ):
+        self.provider = (provider or os.getenv("LLM_PROVIDER", "groq")).lower()
+        if self.provider not in LLM_PROVIDERS:
+            raise ValueError(
+                f"Unknown LLM provider '{self.provider}', expected one of {LLM_PROVIDERS}"
+            )
+        self.model_name = model_name or os.getenv("LLM_MODEL", DEFAULT_LLM_MODEL)
+        self.max_connections = max_connections or int(
+            os.getenv("LLM_MAX_CONNECTIONS", "20")
+        )
+        if timeout_seconds is None:
+            timeout_seconds = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+        self.timeout_seconds = timeout_seconds
+        # OpenAI-compatible endpoint override, e.g. a local fake server
+        self.base_url = base_url or os.getenv("LLM_BASE_URL") or None
+        if scheduler is None and scheduler_enabled():
+            scheduler = LLMScheduler()
+        self.scheduler = scheduler
+
+        self._clients: Dict[Tuple[str, float], BaseChatModel] = {}
+        self._http_client = None
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.created = 0
+
+    def _shared_http_client(self):
+        """The keep-alive connection pool shared by every Groq client"""
+        if self._http_client is None:
+            import httpx
+
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=self.timeout_seconds,
+            )
+        return self._http_client
+
+    def _create(self, model_name: str, temperature: float) -> BaseChatModel:
+        if self.provider == "local":
+            return LocalChatModel(
+                model=model_name,
+                temperature=temperature,
+                latency_seconds=float(os.getenv("LOCAL_LLM_LATENCY_SECONDS", "0")),
+                tokens_per_second=float(os.getenv("LOCAL_LLM_TOKENS_PER_SECOND", "0")),
+            )
+
+        from langchain_groq import ChatGroq
+
+        options = {}
+        if self.base_url:
+            options["base_url"] = self.base_url
+        if self.scheduler is not None:
+            options["max_retries"] = 0
+        return ChatGroq(
+            groq_api_key=os.getenv("GROQ_API_KEY"),
+            model_name=model_name,
+            temperature=temperature,
+            http_client=self._shared_http_client(),
+            **options,
+        )
+
+    def get(self, temperature: float = 0.7, model_name: str = None) -> BaseChatModel:
+        """The shared client for a model and temperature, created on first use"""
+        key = (model_name or self.model_name, float(temperature))
+        with self._lock:
+            self.lookups += 1
+            client = self._clients.get(key)
+            if client is None:
+                client = self._create(*key)
+                if self.scheduler is not None:
+                    client = ScheduledChatModel(inner=client, scheduler=self.scheduler)
+                self._clients[key] = client
+                self.created += 1
+            return client
+
+    def close(self):
+        """Drop every client and close the shared connection pool"""
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "provider": self.provider,
+                "clients": [
+                    {"model": model, "temperature": temperature}
+                    for model, temperature in self._clients
+                ],
+                "lookups": self.lookups,
+                "created": self.created,
+                "max_connections": self.max_connections,
+                "scheduler": self.scheduler.stats() if self.scheduler else None,
+            }
+
+
+# Singleton instance; clients are created on first use
+llm_provider = LLMProvider()
+
+
+def get_llm(temperature: float = 0.7, model_name: str = None) -> BaseChatModel:
+    """Shared chat client from the process-wide provider"""
+    return llm_provider.get(temperature=temperature, model_name=model_name)
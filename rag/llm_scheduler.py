@@ -0,0 +1,400 @@
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+load_dotenv()
+
+# Statuses worth another attempt; everything else is the caller's problem
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """An LLM call could not complete, including queueing and retries, in time"""
+
+
+class TokenBucket:
+    """Refilling budget of ``capacity`` units per ``period_seconds``.
+
+    Reservations may drive the balance negative; the debt is the wait the
+    reserving caller has to sleep, which queues callers in arrival order.
+    """
+
+    def __init__(self, capacity: float, period_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` units would be available"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def reserve(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Charge (positive) or refund (negative) units after the fact"""
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from the Retry-After header of a provider error, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _usage_tokens(message: Any) -> Optional[int]:
+    """Total tokens a provider reported for a response or stream chunk"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens") if isinstance(usage, dict) else None
+
+
+def _retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Connection resets and client-side timeouts carry no status
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or name.endswith(
+        ("ConnectionError", "TimeoutError")
+    )
+
+
+class LLMScheduler:
+    """Admission control for LLM calls against the provider's quota.
+
+    Each attempt takes one request and its estimated tokens from the
+    request and token buckets (sized to the per-minute quota), then one of
+    ``max_concurrency`` slots. Failed attempts with a retryable status are
+    retried with full-jitter exponential backoff; a Retry-After header sets
+    the minimum wait and pauses admission for every caller until it has
+    passed. The deadline bounds queueing, retries and the requests
+    themselves: each attempt gets the time left as its request timeout, and a
+    call that cannot be admitted or retried in time raises
+    ``LLMDeadlineExceeded``. Quota reserved for an attempt that never got a
+    slot is refunded.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        max_concurrency: int = None,
+        max_retries: int = None,
+        deadline_seconds: float = None,
+        backoff_seconds: float = None,
+        max_backoff_seconds: float = None,
+        expected_output_tokens: int = None,
+    ):
+        if requests_per_minute is None:
+            requests_per_minute = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+        if tokens_per_minute is None:
+            tokens_per_minute = float(os.getenv("LLM_TOKENS_PER_MINUTE", "6000"))
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_concurrency = max_concurrency or int(
+            os.getenv("LLM_MAX_CONCURRENCY", "4")
+        )
+        if max_retries is None:
+            max_retries = int(os.getenv("LLM_MAX_RETRIES", "4"))
+        self.max_retries = max_retries
+        if deadline_seconds is None:
+            deadline_seconds = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+        self.deadline_seconds = deadline_seconds
+        self.backoff_seconds = backoff_seconds or float(
+            os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5")
+        )
+        self.max_backoff_seconds = max_backoff_seconds or float(
+            os.getenv("LLM_RETRY_MAX_BACKOFF_SECONDS", "20")
+        )
+        self.expected_output_tokens = expected_output_tokens or int(
+            os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512")
+        )
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._waits: deque = deque(maxlen=1024)
+        self.counters = {
+            "calls": 0,
+            "attempts": 0,
+            "completed": 0,
+            "failed": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "deadline_exceeded": 0,
+        }
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+
+    def estimate_tokens(self, messages: List[BaseMessage]) -> int:
+        """Prompt tokens at ~4 characters each plus the expected completion"""
+        chars = sum(len(str(message.content)) for message in messages)
+        return chars // 4 + self.expected_output_tokens
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _admit(self, tokens: int, deadline: float):
+        """Wait for quota and a concurrency slot, or raise if the deadline passes"""
+        start = time.monotonic()
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(0.0, self._paused_until - now)
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_for(1, now))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_for(tokens, now))
+                if now + wait > deadline:
+                    raise LLMDeadlineExceeded(
+                        f"LLM quota frees up in {wait:.1f}s, past the call deadline"
+                    )
+                if self.requests is not None:
+                    self.requests.reserve(1, now)
+                if self.tokens is not None:
+                    self.tokens.reserve(tokens, now)
+            time.sleep(wait)
+
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                # Nothing was sent, so give the reserved quota back
+                with self._lock:
+                    if self.requests is not None:
+                        self.requests.adjust(-1)
+                    if self.tokens is not None:
+                        self.tokens.adjust(-min(tokens, self.tokens.capacity))
+                raise LLMDeadlineExceeded("No LLM concurrency slot before the deadline")
+        except LLMDeadlineExceeded:
+            self._count("deadline_exceeded")
+            raise
+        finally:
+            with self._lock:
+                self.queue_depth -= 1
+                self._waits.append(time.monotonic() - start)
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _backoff(self, error: Exception, attempt: int, deadline: float):
+        """Sleep before the next attempt, or re-raise if there is none"""
+        if attempt >= self.max_retries or not _retryable(error):
+            self._count("failed")
+            raise error
+        retry_after = _retry_after(error)
+        if _status_code(error) == 429:
+            self._count("rate_limited")
+        delay = random.uniform(
+            0, min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt)
+        )
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            # Nobody else should hit the provider before it said to come back
+            with self._lock:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+        if time.monotonic() + delay > deadline:
+            self._count("deadline_exceeded")
+            raise LLMDeadlineExceeded(
+                f"LLM call still failing ({error}) and the deadline allows no retry"
+            ) from error
+        self._count("retries")
+        time.sleep(delay)
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.001, deadline - time.monotonic())
+
+    def call(
+        self,
+        fn: Callable[[float], Any],
+        tokens: int = None,
+        deadline_seconds: float = None,
+    ) -> Any:
+        """Run one LLM request under the quota, concurrency cap and deadline.
+
+        ``fn`` receives the seconds left before the deadline, to use as the
+        request's timeout.
+        """
+        tokens = tokens or self.expected_output_tokens
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._admit(tokens, deadline)
+            try:
+                self._count("attempts")
+                result = fn(self._remaining(deadline))
+            except Exception as e:
+                self._release()
+                self._backoff(e, attempt, deadline)
+                attempt += 1
+                continue
+            self._release()
+            self._count("completed")
+            self._settle(tokens, _usage_tokens(result))
+            return result
+
+    def stream(
+        self,
+        fn: Callable[[float], Iterator[Any]],
+        tokens: int = None,
+        deadline_seconds: float = None,
+    ) -> Iterator[Any]:
+        """Like ``call`` for a streaming request.
+
+        Attempts are retried until the first chunk arrives; once output has
+        been yielded a failure is raised to the caller. The concurrency slot
+        is held until the stream is exhausted or closed. Once it is, the
+        token bucket is settled with the usage the chunks reported or, without
+        any, with the streamed text at ~4 characters per token.
+        """
+        tokens = tokens or self.expected_output_tokens
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._admit(tokens, deadline)
+            try:
+                self._count("attempts")
+                chunks = iter(fn(self._remaining(deadline)))
+                first = next(chunks, None)
+            except Exception as e:
+                self._release()
+                self._backoff(e, attempt, deadline)
+                attempt += 1
+                continue
+            break
+
+        reported = 0
+        chars = 0
+        try:
+            for chunk in itertools.chain([first] if first is not None else [], chunks):
+                reported += _usage_tokens(chunk) or 0
+                chars += len(str(getattr(chunk, "content", "")))
+                yield chunk
+            self._count("completed")
+        except Exception:
+            self._count("failed")
+            raise
+        finally:
+            self._release()
+            # Without reported usage, swap the expected completion for the streamed one
+            self._settle(
+                tokens, reported or tokens - self.expected_output_tokens + chars // 4
+            )
+
+    def _settle(self, estimated: int, actual: Optional[int]):
+        """Charge the token bucket for the difference between estimate and usage"""
+        if actual and self.tokens is not None:
+            with self._lock:
+                self.tokens.adjust(actual - estimated)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times and retry counters"""
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                **self.counters,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "wait_p50_seconds": round(waits[len(waits) // 2], 4) if waits else 0.0,
+                "wait_p95_seconds": (
+                    round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4)
+                    if waits
+                    else 0.0
+                ),
+                "wait_max_seconds": round(waits[-1], 4) if waits else 0.0,
+            }
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model whose every request goes through an ``LLMScheduler``.
+
+    Wraps the provider's client so ``invoke``, ``stream`` and chains keep
+    working unchanged at the call sites.
+    """
+
+    inner: Any
+    scheduler: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{self.inner._llm_type}"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self.scheduler.call(
+            lambda timeout: self.inner.invoke(
+                messages, stop=stop, timeout=timeout, **kwargs
+            ),
+            tokens=self.scheduler.estimate_tokens(messages),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for chunk in self.scheduler.stream(
+            lambda timeout: self.inner.stream(
+                messages, stop=stop, timeout=timeout, **kwargs
+            ),
+            tokens=self.scheduler.estimate_tokens(messages),
+        ):
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
+
+
+def scheduler_enabled() -> bool:
+    return os.getenv("LLM_SCHEDULER", "true").lower() == "true"
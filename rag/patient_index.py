@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PATIENTS = "patients"
+NOTES = "notes"
+
+
+def _content_hash(document: str, metadata: Dict[str, Any]) -> str:
+    return hashlib.sha256(
+        json.dumps([document, metadata], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class PatientIndex:
+    """In-process lookup tables over the patients and notes collections.
+
+    Provides patient_id -> record, patient_id -> notes sorted by timestamp and
+    note_type -> notes without a Chroma scan per turn. ``fetch`` returns the
+    raw ``collection.get()`` payload for a collection name, and the optional
+    ``signature`` a cheap hash of its ids and content hashes. The tables are
+    refreshed incrementally: collections whose signature is unchanged are
+    not re-read, and only patients and note types whose documents were
+    added, changed or removed are rebuilt. A collection that fails to load
+    keeps its previous entries.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Dict[str, Any]],
+        refresh_seconds: float = None,
+        signature: Callable[[str], Optional[str]] = None,
+    ):
+        self._fetch = fetch
+        self._signature = signature
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv("PATIENT_INDEX_REFRESH_SECONDS", "60"))
+        self.refresh_seconds = refresh_seconds
+
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._notes_by_patient: Dict[str, List[Dict[str, Any]]] = {}
+        self._notes_by_type: Dict[str, List[Dict[str, Any]]] = {}
+        self._fingerprints: Dict[str, str] = {}
+        # (collection, id) -> (content hash, entry)
+        self._documents: Dict[Tuple[str, str], Tuple[str, Dict[str, Any]]] = {}
+        # collection -> signature of the contents last loaded from it
+        self._signatures: Dict[str, Optional[str]] = {}
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.loaded = False
+        self.last_refresh = 0.0
+
+    def refresh(self) -> Dict[str, int]:
+        """Re-read changed collections and apply only what changed"""
+        with self._refresh_lock:
+            current = {}
+            signatures = {}
+            for collection_name in (PATIENTS, NOTES):
+                previous = {
+                    key: value
+                    for key, value in self._documents.items()
+                    if key[0] == collection_name
+                }
+                signature = None
+                if self._signature is not None:
+                    try:
+                        signature = self._signature(collection_name)
+                    except Exception as e:
+                        print(f"Error reading {collection_name} signature: {e}")
+                    if signature is not None and signature == self._signatures.get(
+                        collection_name
+                    ):
+                        current.update(previous)
+                        signatures[collection_name] = signature
+                        continue
+                try:
+                    results = self._fetch(collection_name)
+                except Exception as e:
+                    # A transient error must not look like every document was removed
+                    print(f"Error loading {collection_name} into patient index: {e}")
+                    current.update(previous)
+                    signatures[collection_name] = self._signatures.get(collection_name)
+                    continue
+                signatures[collection_name] = signature
+                for doc_id, document, metadata in zip(
+                    results["ids"], results["documents"], results["metadatas"]
+                ):
+                    metadata = metadata or {}
+                    current[(collection_name, doc_id)] = (
+                        _content_hash(document, metadata),
+                        {"id": doc_id, "document": document, "metadata": metadata},
+                    )
+
+            added = [key for key in current if key not in self._documents]
+            removed = [key for key in self._documents if key not in current]
+            changed = [
+                key
+                for key in current
+                if key in self._documents and current[key][0] != self._documents[key][0]
+            ]
+
+            # Patients and note types touched by any difference
+            patients: Set[str] = set()
+            note_types: Set[str] = set()
+            for key in added + removed + changed:
+                for source in (current, self._documents):
+                    if key in source:
+                        metadata = source[key][1]["metadata"]
+                        if metadata.get("patient_id"):
+                            patients.add(metadata["patient_id"])
+                        if key[0] == NOTES and metadata.get("note_type"):
+                            note_types.add(metadata["note_type"])
+
+            if patients or note_types:
+                self._rebuild(current, patients, note_types)
+
+            self._documents = current
+            self._signatures = signatures
+            self.loaded = True
+            self.last_refresh = time.time()
+            return {
+                "added": len(added),
+                "changed": len(changed),
+                "removed": len(removed),
+                "patients_rebuilt": len(patients),
+            }
+
+    def _rebuild(
+        self,
+        current: Dict[Tuple[str, str], Tuple[str, Dict[str, Any]]],
+        patients: Set[str],
+        note_types: Set[str],
+    ):
+        records = {}
+        notes_by_patient = {patient_id: [] for patient_id in patients}
+        notes_by_type = {note_type: [] for note_type in note_types}
+        for (collection_name, _), (_, entry) in current.items():
+            metadata = entry["metadata"]
+            patient_id = metadata.get("patient_id")
+            if collection_name == PATIENTS:
+                if patient_id in patients:
+                    records[patient_id] = entry
+            else:
+                if patient_id in patients:
+                    notes_by_patient[patient_id].append(entry)
+                if metadata.get("note_type") in note_types:
+                    notes_by_type[metadata["note_type"]].append(entry)
+
+        def by_time(entry):
+            return str(entry["metadata"].get("timestamp", ""))
+
+        fingerprints = {}
+        for patient_id in patients:
+            notes_by_patient[patient_id].sort(key=by_time)
+            digest = hashlib.sha256()
+            for entry in [records.get(patient_id)] + notes_by_patient[patient_id]:
+                if entry is not None:
+                    digest.update(
+                        json.dumps(
+                            [entry["id"], entry["document"], entry["metadata"]],
+                            sort_keys=True,
+                        ).encode("utf-8")
+                    )
+            fingerprints[patient_id] = digest.hexdigest()
+        for note_type in note_types:
+            notes_by_type[note_type].sort(key=by_time)
+
+        # Swap in new lists so concurrent readers never see a partial update
+        with self._lock:
+            for patient_id in patients:
+                if patient_id in records:
+                    self._records[patient_id] = records[patient_id]
+                else:
+                    self._records.pop(patient_id, None)
+                if notes_by_patient[patient_id] or patient_id in records:
+                    self._notes_by_patient[patient_id] = notes_by_patient[patient_id]
+                    self._fingerprints[patient_id] = fingerprints[patient_id]
+                else:
+                    self._notes_by_patient.pop(patient_id, None)
+                    self._fingerprints.pop(patient_id, None)
+            for note_type in note_types:
+                if notes_by_type[note_type]:
+                    self._notes_by_type[note_type] = notes_by_type[note_type]
+                else:
+                    self._notes_by_type.pop(note_type, None)
+
+    def ensure_fresh(self, submit: Callable = None):
+        """Load on first use; afterwards refresh in the background once stale"""
+        if not self.loaded:
+            self.refresh()
+        elif (
+            self.refresh_seconds > 0
+            and time.time() - self.last_refresh > self.refresh_seconds
+            and not self._refresh_lock.locked()
+        ):
+            # Readers keep using the current tables while the refresh runs
+            self.last_refresh = time.time()
+            if submit is not None:
+                submit(self.refresh)
+            else:
+                self.refresh()
+
+    def get_patient(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """patient_id -> patient record"""
+        with self._lock:
+            return self._records.get(patient_id)
+
+    def all_patients(self) -> Dict[str, Dict[str, Any]]:
+        """patient_id -> patient record for every indexed patient"""
+        with self._lock:
+            return dict(self._records)
+
+    def get_notes(self, patient_id: str) -> List[Dict[str, Any]]:
+        """patient_id -> notes in timestamp order"""
+        with self._lock:
+            return list(self._notes_by_patient.get(patient_id, []))
+
+    def get_notes_by_type(self, note_type: str) -> List[Dict[str, Any]]:
+        """note_type -> notes in timestamp order"""
+        with self._lock:
+            return list(self._notes_by_type.get(note_type, []))
+
+    def fingerprint(self, patient_id: str) -> Optional[str]:
+        """Hash of the patient's indexed record and notes"""
+        with self._lock:
+            return self._fingerprints.get(patient_id)
@@ -1,21 +1,234 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Sequence, Tuple
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
+import hashlib
 import os
 import json
 import re
+import threading
+import numpy as np
 from dotenv import load_dotenv
+from .llm_provider import get_llm
+from .router_prototypes import PHASE_PROTOTYPES, COLLECTION_PROTOTYPES
 
 load_dotenv()
 
+# Keyword tables for deterministic routing, in tie-break priority order
+PHASE_KEYWORDS = {
+    "pre-op": [
+        "pre-op",
+        "preoperative",
+        "planning",
+        "assessment",
+        "selection",
+        "evaluate",
+        "suitable",
+    ],
+    "intra-op": [
+        "intra-op",
+        "intraoperative",
+        "surgery",
+        "procedure",
+        "deployment",
+        "step",
+        "during",
+        "how to",
+    ],
+    "post-op": [
+        "post-op",
+        "postoperative",
+        "recovery",
+        "follow-up",
+        "discharge",
+        "complication",
+        "after surgery",
+    ],
+}
 
-class QueryRouter:
-    def __init__(self):
-        self.llm = ChatGroq(
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            model_name="llama-3.1-8b-instant",
-            temperature=0.1,
+PHASE_REASONING = {
+    "pre-op": "Query relates to preoperative planning or assessment",
+    "intra-op": "Query relates to intraoperative procedures or guidance",
+    "post-op": "Query relates to postoperative care or follow-up",
+}
+
+COLLECTION_KEYWORDS = {
+    "devices": ["device", "stent", "graft", "implant", "sizing", "delivery"],
+    "guidelines": ["guideline", "protocol", "standard", "recommend", "best practice"],
+    "literature": ["study", "literature", "research", "trial", "evidence", "outcome"],
+    "notes": ["note", "record", "history", "previous", "prior"],
+}
+
+ROUTER_MODES = ("llm", "keyword", "tiered", "semantic")
+
+# Keyword confidence is scaled by how well the collection tables cover the
+# query: a matched collection keyword, only a patient id, or nothing
+COVERAGE_COLLECTION = 1.0
+COVERAGE_PATIENT = 0.75
+COVERAGE_NONE = 0.5
+
+
+def _keyword_hits(text: str, terms: List[str]) -> int:
+    """Number of terms starting a word in the (lowercased) text"""
+    return sum(re.search(rf"\b{re.escape(term)}", text) is not None for term in terms)
+
+
+DEFAULT_CENTROIDS_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "database", "router_centroids.npz")
+)
+
+
+class SemanticRouter:
+    """Routes a query vector by cosine similarity to prototype centroids.
+
+    Centroids are the normalized mean embeddings of the labeled prototypes in
+    ``rag.router_prototypes``. They are cached in an .npz file tagged with a
+    fingerprint of the model and prototypes, and rebuilt when either changes.
+    """
+
+    def __init__(
+        self,
+        embedding_model=None,
+        cache_path: str = None,
+        collection_margin: float = None,
+    ):
+        self._embedding_model = embedding_model
+        self.cache_path = cache_path or os.getenv(
+            "ROUTER_CENTROIDS_PATH", DEFAULT_CENTROIDS_PATH
+        )
+        # Collections scoring within this margin of the best one are searched
+        if collection_margin is None:
+            collection_margin = float(os.getenv("ROUTER_COLLECTION_MARGIN", "0.05"))
+        self.collection_margin = collection_margin
+
+        self.phase_labels: List[str] = []
+        self.phase_centroids = None
+        self.collection_labels: List[str] = []
+        self.collection_centroids = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            from .embedding import embedding_model
+
+            self._embedding_model = embedding_model
+        return self._embedding_model
+
+    def fingerprint(self) -> str:
+        """Identify the model and prototype set the centroids were built from"""
+        payload = json.dumps(
+            [self.embedding_model.model_key, PHASE_PROTOTYPES, COLLECTION_PROTOTYPES],
+            sort_keys=True,
         )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _centroids(
+        self, prototypes: Dict[str, List[str]]
+    ) -> Tuple[List[str], np.ndarray]:
+        labels = list(prototypes)
+        texts = [text for label in labels for text in prototypes[label]]
+        vectors = self.embedding_model.embed_batch(texts)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        centroids = np.empty((len(labels), vectors.shape[1]), dtype=np.float32)
+        start = 0
+        for row, label in enumerate(labels):
+            count = len(prototypes[label])
+            centroids[row] = vectors[start : start + count].mean(axis=0)
+            start += count
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+        return labels, centroids
+
+    def build(self):
+        """Embed the prototypes and write the centroids to the cache file"""
+        self.phase_labels, self.phase_centroids = self._centroids(PHASE_PROTOTYPES)
+        self.collection_labels, self.collection_centroids = self._centroids(
+            COLLECTION_PROTOTYPES
+        )
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        np.savez(
+            self.cache_path,
+            fingerprint=np.array(self.fingerprint()),
+            phase_labels=np.array(self.phase_labels),
+            phase_centroids=self.phase_centroids,
+            collection_labels=np.array(self.collection_labels),
+            collection_centroids=self.collection_centroids,
+        )
+
+    def load(self):
+        """Load cached centroids, rebuilding them if missing or stale"""
+        with self._load_lock:
+            if self.phase_centroids is not None:
+                return
+            if os.path.exists(self.cache_path):
+                try:
+                    with np.load(self.cache_path) as data:
+                        if str(data["fingerprint"]) == self.fingerprint():
+                            self.phase_labels = data["phase_labels"].tolist()
+                            self.phase_centroids = data["phase_centroids"]
+                            self.collection_labels = data["collection_labels"].tolist()
+                            self.collection_centroids = data["collection_centroids"]
+                            return
+                except Exception as e:
+                    print(f"Error loading router centroids from {self.cache_path}: {e}")
+            self.build()
+
+    def route(
+        self, query_embedding: Sequence[float]
+    ) -> Tuple[str, List[str], float, Dict[str, float]]:
+        """Score a query vector against the centroids.
+
+        Returns the phase, the collections to search (always including
+        patients), the phase margin over the runner-up, and the phase scores.
+        """
+        self.load()
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+
+        phase_scores = self.phase_centroids @ query_vector
+        ranked = np.argsort(phase_scores)[::-1]
+        phase = self.phase_labels[ranked[0]]
+        margin = float(phase_scores[ranked[0]] - phase_scores[ranked[1]])
+
+        collection_scores = self.collection_centroids @ query_vector
+        cutoff = collection_scores.max() - self.collection_margin
+        collections = ["patients"] + [
+            label
+            for label, score in zip(self.collection_labels, collection_scores)
+            if label != "patients" and score >= cutoff
+        ]
+
+        scores = {
+            label: round(float(score), 4)
+            for label, score in zip(self.phase_labels, phase_scores)
+        }
+        return phase, collections, margin, scores
+
+
+class QueryRouter:
+    def __init__(self, mode: str = None, confidence_threshold: float = None):
+        # "llm" always asks the LLM, "keyword" never does, and "tiered" only
+        # escalates when the keyword classifier is not confident
+        self.mode = (mode or os.getenv("ROUTER_MODE", "tiered")).lower()
+        if self.mode not in ROUTER_MODES:
+            raise ValueError(
+                f"Unknown router mode '{self.mode}', expected one of {ROUTER_MODES}"
+            )
+        if confidence_threshold is None:
+            confidence_threshold = float(
+                os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.75")
+            )
+        self.confidence_threshold = confidence_threshold
+        self.semantic_router = SemanticRouter() if self.mode == "semantic" else None
+
+        # How often each tier made the final routing decision
+        self.tier_counts = {"keyword": 0, "semantic": 0, "llm": 0, "fallback": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def llm(self):
+        # Shared client, created on first escalation; keyword and semantic
+        # turns never need it
+        return get_llm(temperature=0.1)
 
     def extract_patient_id(self, query: str) -> str:
         """Extract patient ID from query if mentioned"""
@@ -33,11 +246,58 @@ class QueryRouter:
 
         return None
 
-    def route_query(self, query: str) -> Dict[str, Any]:
-        """Route a query to determine phase, relevant collections, and patient context"""
+    def likely_collections(self, query: str) -> List[str]:
+        """Collections the keyword tables predict, for speculative retrieval"""
+        result, _ = self._keyword_routing(query)
+        return result["collections"]
+
+    def _record_tier(self, result: Dict[str, Any], tier: str) -> Dict[str, Any]:
+        """Tag a routing decision with the tier that made it and count it"""
+        result["router"] = tier
+        with self._stats_lock:
+            self.tier_counts[tier] += 1
+        return result
+
+    def routing_stats(self) -> Dict[str, Any]:
+        """Counters of how often each routing tier decided"""
+        with self._stats_lock:
+            total = sum(self.tier_counts.values())
+            return {
+                "mode": self.mode,
+                "total": total,
+                **self.tier_counts,
+                "llm_avoided_rate": (
+                    (self.tier_counts["keyword"] + self.tier_counts["semantic"]) / total
+                    if total
+                    else 0.0
+                ),
+            }
+
+    def route_query(
+        self, query: str, query_embedding: Sequence[float] = None
+    ) -> Dict[str, Any]:
+        """Route a query to determine phase, relevant collections, and patient context.
+
+        ``query_embedding`` lets semantic mode reuse the vector computed for
+        retrieval instead of embedding the query again.
+        """
         # Extract patient ID if mentioned
         patient_id = self.extract_patient_id(query)
 
+        if self.mode == "semantic":
+            result = self._semantic_routing(query, patient_id, query_embedding)
+            return self._record_tier(result, "semantic")
+
+        if self.mode != "llm":
+            result, confidence = self._keyword_routing(query, patient_id)
+            if self.mode == "keyword" or confidence >= self.confidence_threshold:
+                result["confidence"] = round(confidence, 2)
+                return self._record_tier(result, "keyword")
+
+        return self._llm_routing(query, patient_id)
+
+    def _llm_routing(self, query: str, patient_id: str = None) -> Dict[str, Any]:
+        """Ask the LLM for a routing decision, falling back to keywords on bad output"""
         prompt = ChatPromptTemplate.from_template("""
         You are a medical AI assistant specializing in cardiac surgery. Analyze the following query and determine:
         1. Which surgical phase it relates to (pre-op, intra-op, or post-op)
@@ -63,7 +323,14 @@ class QueryRouter:
         """)
 
         chain = prompt | self.llm
-        response = chain.invoke({"query": query})
+        try:
+            response = chain.invoke({"query": query})
+        except Exception as e:
+            # Rate limited past the deadline or unreachable: route without it
+            print(f"LLM routing failed, using keyword routing: {e}")
+            return self._record_tier(
+                self._fallback_routing(query, patient_id), "fallback"
+            )
 
         # Parse response
         try:
@@ -80,100 +347,87 @@ class QueryRouter:
                         f" Query specifically mentions patient {patient_id}."
                     )
 
-                return result
+                return self._record_tier(result, "llm")
             else:
-                return self._fallback_routing(query, patient_id)
+                return self._record_tier(
+                    self._fallback_routing(query, patient_id), "fallback"
+                )
         except json.JSONDecodeError:
-            return self._fallback_routing(query, patient_id)
+            return self._record_tier(
+                self._fallback_routing(query, patient_id), "fallback"
+            )
 
-    def _fallback_routing(self, query: str, patient_id: str = None) -> Dict[str, Any]:
-        """Fallback routing logic if LLM parsing fails"""
+    def _semantic_routing(
+        self,
+        query: str,
+        patient_id: str = None,
+        query_embedding: Sequence[float] = None,
+    ) -> Dict[str, Any]:
+        """Route by similarity of the query vector to the prototype centroids"""
+        if query_embedding is None:
+            query_embedding = self.semantic_router.embedding_model.embed_text(query)
+        phase, collections, margin, scores = self.semantic_router.route(query_embedding)
+
+        reasoning = (
+            f"Query is closest to {phase} prototypes (similarity {scores[phase]:.2f})."
+        )
+        if patient_id:
+            reasoning += f" Query specifically mentions patient {patient_id}."
+
+        result = {
+            "phase": phase,
+            "collections": collections,
+            "patient_specific": patient_id is not None,
+            "reasoning": reasoning,
+            "confidence": round(margin, 4),
+        }
+        if patient_id:
+            result["patient_id"] = patient_id
+        return result
+
+    def _keyword_routing(
+        self, query: str, patient_id: str = None
+    ) -> Tuple[Dict[str, Any], float]:
+        """Score the query against the keyword tables.
+
+        Returns the routing decision and a confidence in [0, 1]. The winning
+        phase's evidence grows with its number of keyword hits (1 - 0.5**hits,
+        so a single hit gives 0.5) and is reduced by the hits of the
+        runner-up phase. It is then scaled by collection coverage: full when
+        a collection keyword matched, less when only a patient id did, half
+        when neither did. A query with no phase keywords gets confidence 0
+        and the pre-op default.
+        """
         query_lower = query.lower()
 
-        # Phase detection
-        if any(
-            term in query_lower
-            for term in [
-                "pre-op",
-                "preoperative",
-                "planning",
-                "assessment",
-                "selection",
-                "evaluate",
-                "suitable",
-            ]
-        ):
-            phase = "pre-op"
-            reasoning = "Query relates to preoperative planning or assessment"
-        elif any(
-            term in query_lower
-            for term in [
-                "intra-op",
-                "intraoperative",
-                "surgery",
-                "procedure",
-                "deployment",
-                "step",
-                "during",
-                "how to",
-            ]
-        ):
-            phase = "intra-op"
-            reasoning = "Query relates to intraoperative procedures or guidance"
-        elif any(
-            term in query_lower
-            for term in [
-                "post-op",
-                "postoperative",
-                "recovery",
-                "follow-up",
-                "discharge",
-                "complication",
-                "after surgery",
-            ]
-        ):
-            phase = "post-op"
-            reasoning = "Query relates to postoperative care or follow-up"
+        # Phase detection - ties go to the earlier phase in PHASE_KEYWORDS
+        scores = {
+            phase: _keyword_hits(query_lower, terms)
+            for phase, terms in PHASE_KEYWORDS.items()
+        }
+        ranked = sorted(scores.values(), reverse=True)
+        winner, runner_up = ranked[0], ranked[1]
+        if winner:
+            phase = max(scores, key=scores.get)
+            reasoning = PHASE_REASONING[phase]
+            confidence = (1 - 0.5**winner) * (winner - runner_up) / winner
         else:
             phase = "pre-op"
             reasoning = "Defaulting to pre-op for general queries"
+            confidence = 0.0
 
         # Collection detection - always include patients
         collections = ["patients"]
+        for collection, terms in COLLECTION_KEYWORDS.items():
+            if _keyword_hits(query_lower, terms):
+                collections.append(collection)
 
-        if any(
-            term in query_lower
-            for term in ["device", "stent", "graft", "implant", "sizing", "delivery"]
-        ):
-            collections.append("devices")
-        if any(
-            term in query_lower
-            for term in [
-                "guideline",
-                "protocol",
-                "standard",
-                "recommend",
-                "best practice",
-            ]
-        ):
-            collections.append("guidelines")
-        if any(
-            term in query_lower
-            for term in [
-                "study",
-                "literature",
-                "research",
-                "trial",
-                "evidence",
-                "outcome",
-            ]
-        ):
-            collections.append("literature")
-        if any(
-            term in query_lower
-            for term in ["note", "record", "history", "previous", "prior"]
-        ):
-            collections.append("notes")
+        if len(collections) > 1:
+            confidence *= COVERAGE_COLLECTION
+        elif patient_id is not None:
+            confidence *= COVERAGE_PATIENT
+        else:
+            confidence *= COVERAGE_NONE
 
         # Check if patient-specific
         patient_specific = patient_id is not None
@@ -190,4 +444,9 @@ class QueryRouter:
         if patient_specific:
             result["patient_id"] = patient_id
 
+        return result, confidence
+
+    def _fallback_routing(self, query: str, patient_id: str = None) -> Dict[str, Any]:
+        """Fallback routing logic if LLM parsing fails"""
+        result, _ = self._keyword_routing(query, patient_id)
         return result
@@ -0,0 +1,174 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_IDENTIFIER = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+
+def query_identifiers(query: str) -> Tuple[str, ...]:
+    """Tokens of a query containing a digit: device, patient and note ids, numbers"""
+    return tuple(
+        sorted(
+            {
+                token
+                for token in _IDENTIFIER.findall(query.lower())
+                if any(char.isdigit() for char in token)
+            }
+        )
+    )
+
+
+class ResponseCache:
+    """Semantic cache of generated answers.
+
+    An entry is reused when a new query has the same patient_id, routed phase
+    and identifiers (see ``query_identifiers``) as a stored one, its
+    embedding is at least ``similarity_threshold`` cosine-similar, the entry
+    is younger than ``ttl_seconds`` and the data version (a fingerprint of
+    the documents the answer was built from) is unchanged. Identifiers must
+    match exactly since queries about SG-0042 and SG-0043 embed almost alike.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 1800,
+        similarity_threshold: float = 0.97,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(query_embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return (
+            self.ttl_seconds > 0 and time.time() - entry["created"] > self.ttl_seconds
+        )
+
+    def lookup(
+        self,
+        query_embedding: Sequence[float],
+        patient_id: Optional[str],
+        phase: str,
+        version: Optional[str] = None,
+        identifiers: Sequence[str] = (),
+    ) -> Optional[Dict[str, Any]]:
+        """Return the closest stored response above the threshold, or None"""
+        query_vector = self._normalize(query_embedding)
+        identifiers = tuple(identifiers)
+        with self._lock:
+            candidates = []
+            for entry_id, entry in list(self._entries.items()):
+                if self._expired(entry):
+                    del self._entries[entry_id]
+                    continue
+                if (
+                    entry["patient_id"] == patient_id
+                    and entry["phase"] == phase
+                    and entry["identifiers"] == identifiers
+                ):
+                    candidates.append(entry_id)
+
+            if candidates:
+                vectors = np.stack([self._entries[i]["vector"] for i in candidates])
+                similarities = vectors @ query_vector
+                best = int(np.argmax(similarities))
+                entry_id = candidates[best]
+                entry = self._entries[entry_id]
+                if similarities[best] >= self.similarity_threshold:
+                    if entry["version"] != version:
+                        # The documents behind this answer changed since
+                        del self._entries[entry_id]
+                        self.stale += 1
+                    else:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        return {
+                            **entry["response"],
+                            "similarity": round(float(similarities[best]), 4),
+                        }
+
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        query_embedding: Sequence[float],
+        patient_id: Optional[str],
+        phase: str,
+        response: Dict[str, Any],
+        version: Optional[str] = None,
+        identifiers: Sequence[str] = (),
+    ):
+        """Remember a generated response for similar future queries"""
+        with self._lock:
+            self._entries[self._next_id] = {
+                "vector": self._normalize(query_embedding),
+                "patient_id": patient_id,
+                "phase": phase,
+                "identifiers": tuple(identifiers),
+                "version": version,
+                "created": time.time(),
+                "response": dict(response),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, patient_id: str = None):
+        """Drop the entries of one patient, or everything when no patient is given"""
+        with self._lock:
+            if patient_id is None:
+                self._entries.clear()
+                return
+            for entry_id in [
+                i for i, e in self._entries.items() if e["patient_id"] == patient_id
+            ]:
+                del self._entries[entry_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the debug panel"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """Build the response cache from RESPONSE_CACHE_* settings"""
+    max_entries = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+    if max_entries <= 0:
+        return None
+    return ResponseCache(
+        max_entries=max_entries,
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "1800")),
+        similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.97")),
+    )
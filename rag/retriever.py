@@ -1,64 +1,834 @@
 import os
-import chromadb
-from typing import List, Dict, Any
+import hashlib
+import json
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
 from .embedding import embedding_model
+from .patient_index import PatientIndex
+from .compact_index import CompactIndex, compact_index_dir, compact_mode_from_env
+from .lexical_index import (
+    LEXICAL_FIELDS,
+    LexicalIndex,
+    lexical_enabled,
+    load_or_build,
+    reciprocal_rank_fusion,
+)
+from .device_compatibility import (
+    DeviceCompatibility,
+    compatibility_enabled,
+    load_for,
+    patient_anatomy,
+)
+from .vector_store import (
+    VectorStore,
+    collection_signature,
+    load_signatures,
+    signatures_path,
+    vector_backend_from_env,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
 class ChromaRetriever:
-    def __init__(self):
-        db_path = os.path.abspath(
-            os.path.join(os.path.dirname(__file__), "..", "database", "chroma_db")
+    def __init__(self, max_workers: int = None, parallel: bool = None):
+        # Chroma by default; VECTOR_STORE=numpy for exact search over mmap files
+        self.backend = vector_backend_from_env()
+
+        # Collection searches fan out on a bounded thread pool shared by all callers
+        self.max_workers = max_workers or int(os.getenv("RETRIEVER_MAX_WORKERS", "4"))
+        if parallel is None:
+            parallel = os.getenv("RETRIEVER_PARALLEL", "true").lower() == "true"
+        self.parallel = parallel
+        # Neighbouring chunks merged into each chunked hit (0 = matching chunk only)
+        self.chunk_window = int(os.getenv("RETRIEVER_CHUNK_WINDOW", "0"))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        # Content signatures of the collections, which the indexes built from
+        # them are checked against, re-read every INDEX_REFRESH_SECONDS and
+        # replaced as soon as ingestion records new ones
+        self.index_refresh_seconds = float(os.getenv("INDEX_REFRESH_SECONDS", "60"))
+        self._signatures: Dict[str, Tuple[float, str]] = {}
+        self._signatures_mtime = None
+        self._pending_signatures = set()
+        self._signatures_lock = threading.Lock()
+
+        # Quantized vector indexes searched instead of Chroma when enabled,
+        # keyed by collection with the signature they were validated against
+        self.compact_mode = compact_mode_from_env()
+        self._compact: Dict[str, Tuple[Optional[str], Optional[CompactIndex]]] = {}
+
+        # BM25 / exact-ID indexes over device, patient and note identifiers
+        self.lexical = lexical_enabled()
+        self.rrf_k = int(os.getenv("LEXICAL_RRF_K", "60"))
+        self._lexical: Dict[str, Tuple[Optional[str], Optional[LexicalIndex]]] = {}
+
+        # Patient x device anatomical compatibility, parsed once from device metadata
+        self.device_compatibility = compatibility_enabled()
+        self._compatibility: Optional[DeviceCompatibility] = None
+        self._compatibility_lock = threading.Lock()
+
+        # Collection handles resolved once and reused on the hot path
+        self._collections: Dict[str, VectorStore] = {}
+        self._collections_lock = threading.Lock()
+        self.refresh_collections()
+
+        # patient_id / note_type lookups served from memory instead of scans
+        self.patient_index = PatientIndex(
+            lambda name: self._run_on_collection(name, "get"),
+            signature=self._read_signature,
         )
-        self.client = chromadb.PersistentClient(path=db_path)
 
-    def query_collection(
-        self, collection_name: str, query: str, n_results: int = 5, filters: Dict = None
+    def refresh_collections(self) -> List[str]:
+        """Resolve a handle for every collection in the database"""
+        try:
+            names = self.backend.collection_names()
+            handles = {name: self.backend.get_store(name) for name in names}
+        except Exception as e:
+            print(f"Error listing collections: {e}")
+            return list(self._collections)
+
+        with self._collections_lock:
+            # Only a changed set of collections invalidates the in-memory
+            # indexes; an unknown name or a transient error must not
+            if set(handles) != set(self._collections):
+                self._compact = {}
+                self._lexical = {}
+            self._collections = handles
+        return names
+
+    def collection_signature(self, name: str, wait: bool = True) -> Optional[str]:
+        """Hash of a collection's ids and content hashes, to validate indexes.
+
+        Taken from the signatures ingestion records, or read on first use;
+        re-read in the background once older than ``index_refresh_seconds``
+        while callers keep the last value. Without ``wait`` a signature that
+        was never read is only requested in the background. None when the
+        collection has not been read successfully (yet).
+        """
+        self._sync_recorded_signatures()
+        cached = self._signatures.get(name)
+        if cached is None:
+            if wait:
+                return self._read_signature(name)
+            self._read_signature_later(name)
+            return None
+        checked, signature = cached
+        if (
+            self.index_refresh_seconds > 0
+            and time.time() - checked > self.index_refresh_seconds
+        ):
+            # Only one re-read per interval
+            self._signatures[name] = (time.time(), signature)
+            self._read_signature_later(name)
+        return signature
+
+    def _sync_recorded_signatures(self):
+        """Adopt the signatures ingestion recorded since the last check"""
+        path = signatures_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._signatures_mtime:
+            return
+        self._signatures_mtime = mtime
+        try:
+            recorded = load_signatures(path)
+        except Exception as e:
+            print(f"Error loading collection signatures: {e}")
+            return
+        now = time.time()
+        for name, signature in recorded.items():
+            self._signatures[name] = (now, signature)
+
+    def _read_signature_later(self, name: str):
+        with self._signatures_lock:
+            if name in self._pending_signatures:
+                return
+            self._pending_signatures.add(name)
+
+        def read():
+            try:
+                self._read_signature(name)
+            finally:
+                with self._signatures_lock:
+                    self._pending_signatures.discard(name)
+
+        self._submit(read)
+
+    def _read_signature(self, name: str) -> Optional[str]:
+        try:
+            signature = collection_signature(self._collection(name))
+        except Exception as e:
+            print(f"Error reading signature of collection {name}: {e}")
+            cached = self._signatures.get(name)
+            return cached[1] if cached is not None else None
+        self._signatures[name] = (time.time(), signature)
+        return signature
+
+    def _compact_index(self, name: str) -> Optional[CompactIndex]:
+        """The collection's compact index, if enabled, built and up to date"""
+        if self.compact_mode is None:
+            return None
+        signature = self.collection_signature(name)
+        # The dict may be swapped by a refresh on another thread
+        compact = self._compact
+        entry = compact.get(name)
+        if entry is not None and (signature is None or entry[0] == signature):
+            return entry[1]
+
+        index = None
+        directory = compact_index_dir(name)
+        try:
+            if os.path.exists(directory):
+                index = CompactIndex.load(directory)
+                if index.mode != self.compact_mode:
+                    print(f"Compact index for {name} is {index.mode}; using Chroma")
+                    index = None
+                elif signature is None or index.signature != signature:
+                    print(f"Compact index for {name} is out of date; using Chroma")
+                    index = None
+        except Exception as e:
+            print(f"Error loading compact index for {name}: {e}")
+            index = None
+        compact[name] = (signature, index)
+        return index
+
+    def _lexical_index(self, name: str) -> Optional[LexicalIndex]:
+        """The collection's lexical index, rebuilt in memory if the saved one is stale"""
+        if not self.lexical or name not in LEXICAL_FIELDS:
+            return None
+        signature = self.collection_signature(name)
+        # The dict may be swapped by a refresh on another thread
+        lexical = self._lexical
+        entry = lexical.get(name)
+        if entry is not None and (signature is None or entry[0] == signature):
+            return entry[1]
+        try:
+            index = load_or_build(self._collection(name), name, signature=signature)
+        except Exception as e:
+            print(f"Error loading lexical index for {name}: {e}")
+            index = None
+        lexical[name] = (signature, index)
+        return index
+
+    def _compatibility_engine(self) -> Optional[DeviceCompatibility]:
+        """The devices' compatibility engine, rebuilt when the devices change"""
+        if not self.device_compatibility:
+            return None
+        signature = self.collection_signature("devices")
+        with self._compatibility_lock:
+            if self._compatibility is not None and signature is None:
+                # Keep the last engine while the collection cannot be read
+                return self._compatibility
+            try:
+                engine = load_for(
+                    self._collection("devices"), self._compatibility, signature
+                )
+            except Exception as e:
+                print(f"Error loading device compatibility: {e}")
+                return None
+            if engine is not self._compatibility:
+                self._compatibility = engine
+                self.patient_index.ensure_fresh(submit=self._submit)
+                # Fill the whole patient x device matrix in one pass
+                engine.evaluate_all(
+                    {
+                        patient_id: patient_anatomy(record["metadata"])
+                        for patient_id, record in self.patient_index.all_patients().items()
+                    }
+                )
+            return engine
+
+    def device_compatibility_for(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Ranked compatible devices and rejection reasons for a patient.
+
+        Returns None when the check is disabled, the patient is unknown or
+        their record carries none of the anatomical measurements.
+        """
+        engine = self._compatibility_engine()
+        patient = self.get_patient_info(patient_id) if engine is not None else None
+        if patient is None:
+            return None
+        anatomy = patient_anatomy(patient["metadata"])
+        if not anatomy:
+            return None
+        return engine.evaluate(patient_id, anatomy)
+
+    def compatible_devices(
+        self,
+        patient_id: str,
+        devices: List[Dict[str, Any]],
+        query: str = None,
+        query_embedding: Sequence[float] = None,
+        n_results: int = 5,
     ) -> List[Dict[str, Any]]:
-        """Query a specific collection with optional filters"""
+        """Restrict retrieved devices to those compatible with a patient's anatomy.
+
+        Retrieved devices the patient's measurements rule out are dropped and
+        the list is topped up with the best-ranked compatible devices, carrying
+        their squared L2 distance to the query. Retrieved devices that could
+        not be checked against the patient's measurements only fill the
+        places left after that. Without a compatibility result for the
+        patient the devices are returned unchanged.
+        """
+        compatibility = self.device_compatibility_for(patient_id)
+        if compatibility is None:
+            return devices
+
+        ranked = [device["doc_id"] for device in compatibility["compatible"]]
+        allowed = set(ranked)
+        unverified = {device["doc_id"] for device in compatibility["unverified"]}
+        kept = [
+            result
+            for result in devices
+            if result["metadata"].get("device_id") in allowed
+        ][:n_results]
+        present = {result["metadata"].get("device_id") for result in kept}
+        missing = [doc_id for doc_id in ranked if doc_id not in present][
+            : n_results - len(kept)
+        ]
+        unchecked = [
+            result
+            for result in devices
+            if result["metadata"].get("device_id") in unverified
+        ]
+        if not missing:
+            return (kept + unchecked)[:n_results]
+
         try:
-            collection = self.client.get_collection(name=collection_name)
-            query_embedding = embedding_model.embed_text(query)
-
-            # Prepare where clause if filters are provided
-            where_clause = None
-            if filters:
-                where_clause = {"$and": []}
-                for key, value in filters.items():
-                    where_clause["$and"].append({key: {"$eq": value}})
-
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                where=where_clause,
+            fetched = self._run_on_collection(
+                "devices",
+                "get",
+                ids=missing,
+                include=["documents", "metadatas", "embeddings"],
             )
+            if query_embedding is None:
+                query_embedding = embedding_model.embed_text(query)
+        except Exception as e:
+            print(f"Error fetching compatible devices for {patient_id}: {e}")
+            return kept
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        by_id = {}
+        for doc_id, document, metadata, embedding in zip(
+            fetched["ids"],
+            fetched["documents"],
+            fetched["metadatas"],
+            fetched["embeddings"],
+        ):
+            difference = np.asarray(embedding, dtype=np.float32) - query_vector
+            by_id[doc_id] = {
+                "document": document,
+                "metadata": metadata,
+                "distance": float(difference @ difference),
+            }
+        kept += [by_id[doc_id] for doc_id in missing if doc_id in by_id]
+        return (kept + unchecked)[:n_results]
 
-            # Format results
-            formatted_results = []
-            if results["documents"]:
-                for i in range(len(results["documents"][0])):
-                    formatted_results.append(
-                        {
-                            "document": results["documents"][0][i],
-                            "metadata": results["metadatas"][0][i],
-                            "distance": results["distances"][0][i],
-                        }
+    def _query_exact(
+        self,
+        collection_name: str,
+        doc_ids: List[str],
+        filters: Dict = None,
+    ) -> List[Dict[str, Any]]:
+        """Fetch documents named by id in the query, in the order they were named"""
+        fetched = self._run_on_collection(
+            collection_name, "get", ids=doc_ids, where=self._build_where(filters)
+        )
+        found = {
+            doc_id: {"document": document, "metadata": metadata, "distance": 0.0}
+            for doc_id, document, metadata in zip(
+                fetched["ids"], fetched["documents"], fetched["metadatas"]
+            )
+        }
+        return [found[doc_id] for doc_id in doc_ids if doc_id in found]
+
+    def _fuse_lexical(
+        self,
+        index: LexicalIndex,
+        collection_name: str,
+        query: str,
+        query_embedding: Sequence[float],
+        dense: List[Tuple[str, Dict[str, Any]]],
+        n_results: int,
+        filters: Dict = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Merge BM25 hits into the dense ranking with reciprocal rank fusion.
+
+        Lexical-only hits are fetched with their embeddings so they carry the
+        same squared L2 distance as dense hits and rank consistently across
+        collections downstream.
+        """
+        hits = index.search(query, n_results)
+        if not hits:
+            return dense
+        fused = reciprocal_rank_fusion(
+            [[doc_id for doc_id, _ in dense], [doc_id for doc_id, _ in hits]],
+            k=self.rrf_k,
+        )
+        by_id = dict(dense)
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing:
+            fetched = self._run_on_collection(
+                collection_name,
+                "get",
+                ids=missing,
+                where=self._build_where(filters),
+                include=["documents", "metadatas", "embeddings"],
+            )
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            for doc_id, document, metadata, embedding in zip(
+                fetched["ids"],
+                fetched["documents"],
+                fetched["metadatas"],
+                fetched["embeddings"],
+            ):
+                difference = np.asarray(embedding, dtype=np.float32) - query_vector
+                by_id[doc_id] = {
+                    "document": document,
+                    "metadata": metadata,
+                    "distance": float(difference @ difference),
+                }
+        return [(doc_id, by_id[doc_id]) for doc_id, _ in fused if doc_id in by_id][
+            :n_results
+        ]
+
+    def _query_compact(
+        self,
+        index: CompactIndex,
+        collection_name: str,
+        query_embedding: Sequence[float],
+        n_results: int,
+        filters: Dict = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Search the compact index, then fetch the hits' documents from Chroma"""
+        hits = index.search(query_embedding, n_results, filters)
+        if not hits:
+            return []
+        fetched = self._run_on_collection(
+            collection_name,
+            "get",
+            ids=[doc_id for doc_id, _, _ in hits],
+            include=["documents"],
+        )
+        documents = dict(zip(fetched["ids"], fetched["documents"]))
+        return [
+            (
+                doc_id,
+                {
+                    "document": documents[doc_id],
+                    "metadata": metadata,
+                    "distance": distance,
+                },
+            )
+            for doc_id, metadata, distance in hits
+            if doc_id in documents
+        ]
+
+    def _collection(self, name: str) -> VectorStore:
+        """Cached collection handle, refreshing the registry for unknown names"""
+        collection = self._collections.get(name)
+        if collection is None:
+            self.refresh_collections()
+            collection = self._collections.get(name)
+            if collection is None:
+                raise ValueError(f"Collection [{name}] does not exist")
+        return collection
+
+    def _run_on_collection(self, name: str, operation: str, **kwargs):
+        """Call a collection method, re-resolving the handle once if it went stale"""
+        try:
+            return getattr(self._collection(name), operation)(**kwargs)
+        except Exception:
+            if name not in self._collections:
+                raise
+            # The collection may have been dropped and recreated by ingestion
+            self.refresh_collections()
+            return getattr(self._collection(name), operation)(**kwargs)
+
+    def warmup(
+        self, query: str = "cardiac surgery warmup query", background: bool = False
+    ) -> Optional[threading.Thread]:
+        """Load every collection's index and the embedding model before real traffic.
+
+        Runs one real forward pass and a one-result query per collection so
+        the first surgeon question after a deploy does not pay for it. With
+        ``background`` the model starts loading on its own thread and the
+        rest runs on a daemon thread, which is returned so startup is not
+        blocked; queries arriving earlier wait for whatever is still loading.
+        """
+        if background:
+            embedding_model.warmup(background=True)
+            thread = threading.Thread(
+                target=self.warmup, args=(query,), name="retriever-warmup", daemon=True
+            )
+            thread.start()
+            return thread
+
+        start = time.perf_counter()
+        names = self.refresh_collections()
+        self.patient_index.refresh()
+        for name in names:
+            # Response cache versions never wait for a first signature read
+            self.collection_signature(name)
+        query_embedding = embedding_model.embed_batch([query])[0].tolist()
+        for name in names:
+            try:
+                collection = self._collections[name]
+                if collection.count() > 0:
+                    collection.query(query_embeddings=[query_embedding], n_results=1)
+            except Exception as e:
+                print(f"Error warming up collection {name}: {e}")
+        print(
+            f"Warmed up {len(names)} collections in {time.perf_counter() - start:.2f}s"
+        )
+        return None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Create the shared thread pool on first use"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="retriever"
+                )
+            return self._executor
+
+    def _submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Run a lookup on the pool, or inline when parallel mode is off"""
+        if self.parallel:
+            return self._get_executor().submit(fn, *args, **kwargs)
+
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    @staticmethod
+    def _result(future: Future, label: str, default: Any) -> Any:
+        """Collect a lookup result so that one failing source cannot fail the turn"""
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"Error retrieving from {label}: {e}")
+            return default
+
+    def shutdown(self):
+        """Stop the retrieval thread pool"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    @staticmethod
+    def _build_where(filters: Dict = None) -> Optional[Dict]:
+        """Translate simple equality filters into a Chroma where clause"""
+        if not filters:
+            return None
+        conditions = [{key: {"$eq": value}} for key, value in filters.items()]
+        # Chroma rejects an $and with fewer than two expressions
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+
+    def query_collection(
+        self,
+        collection_name: str,
+        query: str,
+        n_results: int = 5,
+        filters: Dict = None,
+        query_embedding: Sequence[float] = None,
+        chunk_window: int = None,
+    ) -> List[Dict[str, Any]]:
+        """Query a specific collection with optional filters.
+
+        Pass ``query_embedding`` to reuse a vector that was already computed
+        for this query instead of embedding it again. For chunked collections
+        each hit is the matching chunk; a ``chunk_window`` above 0 (default
+        RETRIEVER_CHUNK_WINDOW) widens it to that many neighbours on each side.
+        With VECTOR_COMPACT_MODE set, collections with an up-to-date compact
+        index are searched there instead of in Chroma.
+
+        Collections with a lexical index (devices, patients, notes) also
+        match the query against identifiers, names and manufacturers. A query
+        that names a device, patient or note id returns those documents
+        directly with distance 0.0, skipping the embedding and vector search;
+        otherwise the BM25 hits are fused with the dense results.
+        """
+        try:
+            lexical = self._lexical_index(collection_name) if query else None
+            if lexical is not None:
+                exact_ids = lexical.exact_ids(query)
+                if exact_ids:
+                    exact = self._query_exact(
+                        collection_name, exact_ids[:n_results], filters
+                    )
+                    if exact:
+                        return exact
+
+            if query_embedding is None:
+                query_embedding = embedding_model.embed_text(query)
+
+            dense = None
+            index = self._compact_index(collection_name)
+            if index is not None:
+                try:
+                    dense = self._query_compact(
+                        index, collection_name, query_embedding, n_results, filters
                     )
+                except Exception as e:
+                    print(f"Error searching compact index for {collection_name}: {e}")
+            if dense is None:
+                results = self._run_on_collection(
+                    collection_name,
+                    "query",
+                    query_embeddings=[list(query_embedding)],
+                    n_results=n_results,
+                    where=self._build_where(filters),
+                )
 
+                # Format results
+                dense = []
+                if results["documents"]:
+                    for i in range(len(results["documents"][0])):
+                        dense.append(
+                            (
+                                results["ids"][0][i],
+                                {
+                                    "document": results["documents"][0][i],
+                                    "metadata": results["metadatas"][0][i],
+                                    "distance": results["distances"][0][i],
+                                },
+                            )
+                        )
+
+            if lexical is not None:
+                dense = self._fuse_lexical(
+                    lexical,
+                    collection_name,
+                    query,
+                    query_embedding,
+                    dense,
+                    n_results,
+                    filters,
+                )
+            formatted_results = [result for _, result in dense]
+
+            if chunk_window is None:
+                chunk_window = self.chunk_window
+            if chunk_window > 0:
+                formatted_results = self.expand_chunks(
+                    collection_name, formatted_results, chunk_window
+                )
             return formatted_results
         except Exception as e:
             print(f"Error querying collection {collection_name}: {e}")
             return []
 
+    @staticmethod
+    def _merge_chunks(chunks: List[Dict[str, Any]]) -> str:
+        """Join consecutive chunks of a document, keeping their overlap once"""
+        merged = ""
+        end = None
+        for chunk in chunks:
+            metadata = chunk["metadata"]
+            start = int(metadata["char_start"])
+            body = chunk["document"][int(metadata.get("body_offset", 0)) :]
+            if end is None:
+                # The first chunk keeps its title prefix
+                merged = chunk["document"]
+            elif start < end:
+                merged += body[end - start :]
+            else:
+                merged += "\n\n" + body
+            end = max(end or 0, int(metadata["char_end"]))
+        return merged
+
+    def expand_chunks(
+        self,
+        collection_name: str,
+        results: List[Dict[str, Any]],
+        window: int = 1,
+    ) -> List[Dict[str, Any]]:
+        """Widen chunk hits to their ``window`` neighbouring chunks on each side.
+
+        Hits from unchunked documents are returned unchanged. A hit whose
+        chunk is already covered by a higher-ranked hit of the same document
+        is dropped, so the expanded passages never repeat text.
+        """
+        covered: Dict[str, set] = {}
+        expanded = []
+        for result in results:
+            metadata = result["metadata"] or {}
+            if "chunk_index" not in metadata:
+                expanded.append(result)
+                continue
+
+            doc_id = metadata["doc_id"]
+            index = int(metadata["chunk_index"])
+            if index in covered.get(doc_id, ()):
+                continue
+            last = int(metadata.get("chunk_count", index + 1)) - 1
+            indices = range(max(0, index - window), min(last, index + window) + 1)
+            covered.setdefault(doc_id, set()).update(indices)
+
+            try:
+                neighbours = self._run_on_collection(
+                    collection_name, "get", ids=[f"{doc_id}#{i}" for i in indices]
+                )
+            except Exception as e:
+                print(f"Error expanding chunk {doc_id}#{index}: {e}")
+                expanded.append(result)
+                continue
+
+            chunks = sorted(
+                (
+                    {"document": document, "metadata": chunk_metadata}
+                    for document, chunk_metadata in zip(
+                        neighbours["documents"], neighbours["metadatas"]
+                    )
+                ),
+                key=lambda chunk: int(chunk["metadata"]["chunk_index"]),
+            )
+            if not chunks:
+                expanded.append(result)
+                continue
+            expanded.append(
+                {
+                    "document": self._merge_chunks(chunks),
+                    "metadata": {
+                        **metadata,
+                        "char_start": chunks[0]["metadata"]["char_start"],
+                        "char_end": chunks[-1]["metadata"]["char_end"],
+                        "chunk_range": f"{chunks[0]['metadata']['chunk_index']}"
+                        f"-{chunks[-1]['metadata']['chunk_index']}",
+                    },
+                    "distance": result["distance"],
+                }
+            )
+        return expanded
+
+    def query_many(
+        self,
+        collections: List[str],
+        query: str = None,
+        query_embedding: Sequence[float] = None,
+        n_results: int = 5,
+        filters: Dict[str, Dict] = None,
+        chunk_window: int = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Query several collections with a single query embedding.
+
+        The query is embedded once (unless ``query_embedding`` is given) and the
+        vector is reused for every collection. ``filters`` maps a collection
+        name to its equality filters. Results are keyed by collection name in
+        the order the collections were requested. ``chunk_window`` is passed
+        on to ``query_collection``.
+        """
+        _, results = self.retrieve_all(
+            collections,
+            query=query,
+            query_embedding=query_embedding,
+            n_results=n_results,
+            filters=filters,
+            chunk_window=chunk_window,
+        )
+        return results
+
+    def retrieve_all(
+        self,
+        collections: List[str],
+        query: str = None,
+        query_embedding: Sequence[float] = None,
+        patient_id: str = None,
+        n_results: int = 5,
+        filters: Dict[str, Dict] = None,
+        chunk_window: int = None,
+    ) -> Tuple[Optional[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+        """Fetch the patient record and search all collections concurrently.
+
+        The patient lookup starts first since it does not need the query
+        vector. Collection searches then run on the bounded pool; a failing
+        collection yields an empty result list without affecting the others.
+        For patient-scoped turns the patient's notes come from the patient
+        index, most recent first, instead of a filtered vector search.
+        Returns ``(patient_info, results)`` with results in request order.
+        """
+        patient_future = None
+        indexed = {}
+        if patient_id:
+            patient_future = self._submit(self.get_patient_info, patient_id)
+            if "notes" in collections:
+                notes = self.get_patient_notes(patient_id)
+                if notes:
+                    indexed["notes"] = [
+                        {
+                            "document": note["document"],
+                            "metadata": note["metadata"],
+                            "distance": None,
+                        }
+                        for note in reversed(notes[-n_results:])
+                    ]
+
+        results = {}
+        if collections:
+            if query_embedding is None:
+                try:
+                    query_embedding = embedding_model.embed_text(query)
+                except Exception as e:
+                    print(f"Error embedding query: {e}")
+                    results = {collection_name: [] for collection_name in collections}
+
+            if query_embedding is not None:
+                filters = filters or {}
+                futures = {
+                    collection_name: self._submit(
+                        self.query_collection,
+                        collection_name,
+                        query,
+                        n_results=n_results,
+                        filters=filters.get(collection_name),
+                        query_embedding=query_embedding,
+                        chunk_window=chunk_window,
+                    )
+                    for collection_name in collections
+                    if collection_name not in indexed
+                }
+                results = {
+                    collection_name: (
+                        indexed[collection_name]
+                        if collection_name in indexed
+                        else self._result(futures[collection_name], collection_name, [])
+                    )
+                    for collection_name in collections
+                }
+
+        patient_info = None
+        if patient_future is not None:
+            patient_info = self._result(patient_future, f"patient {patient_id}", None)
+
+        return patient_info, results
+
     def get_patient_info(self, patient_id: str) -> Dict[str, Any]:
         """Get specific patient information by ID"""
-        try:
-            collection = self.client.get_collection(name="patients")
+        self.patient_index.ensure_fresh(submit=self._submit)
+        record = self.patient_index.get_patient(patient_id)
+        if record is not None:
+            return {"document": record["document"], "metadata": record["metadata"]}
 
+        # Not indexed yet (e.g. added since the last refresh): scan Chroma
+        try:
             # Query specifically for this patient
-            results = collection.get(where={"patient_id": {"$eq": patient_id}})
+            results = self._run_on_collection(
+                "patients", "get", where={"patient_id": {"$eq": patient_id}}
+            )
 
             if results["ids"]:
                 # Return the first match (should be only one)
@@ -72,9 +842,79 @@ class ChromaRetriever:
             print(f"Error retrieving patient {patient_id}: {e}")
             return None
 
+    def get_patient_notes(self, patient_id: str) -> List[Dict[str, Any]]:
+        """A patient's notes in timestamp order, from the patient index"""
+        self.patient_index.ensure_fresh(submit=self._submit)
+        return self.patient_index.get_notes(patient_id)
+
+    def get_notes_by_type(self, note_type: str) -> List[Dict[str, Any]]:
+        """All notes of one type (e.g. "Post-op") in timestamp order"""
+        self.patient_index.ensure_fresh(submit=self._submit)
+        return self.patient_index.get_notes_by_type(note_type)
+
+    def patient_fingerprint(self, patient_id: str) -> Optional[str]:
+        """Hash of a patient's record and notes, used to detect changed documents.
+
+        Served from the patient index, so changes are seen within one index
+        refresh interval. Falls back to reading Chroma for patients the index
+        does not know, and returns None when the documents cannot be read, so
+        callers should not trust cached answers for that patient.
+        """
+        self.patient_index.ensure_fresh(submit=self._submit)
+        fingerprint = self.patient_index.fingerprint(patient_id)
+        if fingerprint is not None:
+            return fingerprint
+
+        digest = hashlib.sha256()
+        try:
+            for collection_name in ("patients", "notes"):
+                results = self._run_on_collection(
+                    collection_name, "get", where={"patient_id": {"$eq": patient_id}}
+                )
+                for doc_id, document, metadata in sorted(
+                    zip(results["ids"], results["documents"], results["metadatas"]),
+                    key=lambda item: item[0],
+                ):
+                    digest.update(
+                        json.dumps(
+                            [collection_name, doc_id, document, metadata],
+                            sort_keys=True,
+                        ).encode("utf-8")
+                    )
+        except Exception as e:
+            print(f"Error fingerprinting patient {patient_id}: {e}")
+            return None
+        return digest.hexdigest()
+
+    def data_version(
+        self, collections: List[str], patient_id: str = None
+    ) -> Optional[str]:
+        """Fingerprint of the documents an answer over ``collections`` draws on.
+
+        Combines the patient's record and notes (for patient turns) with the
+        content signature of every other routed collection, so answers about
+        devices, guidelines or literature change with them. Signatures come
+        from the cache kept for the indexes and are never read inline; returns
+        None when any part is not available yet.
+        """
+        parts = []
+        if patient_id:
+            fingerprint = self.patient_fingerprint(patient_id)
+            if fingerprint is None:
+                return None
+            parts.append(fingerprint)
+        for name in sorted(set(collections)):
+            if patient_id and name in ("patients", "notes"):
+                continue
+            signature = self.collection_signature(name, wait=False)
+            if signature is None:
+                return None
+            parts.append(f"{name}:{signature}")
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
     def get_collection_names(self) -> List[str]:
         """Get list of all available collections"""
-        return [col.name for col in self.client.list_collections()]
+        return self.refresh_collections()
 
 
 # Singleton instance
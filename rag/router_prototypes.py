@@ -0,0 +1,86 @@
+# Labeled prototype queries for embedding-based routing.
+# Each label's centroid is the normalized mean of its prototype embeddings.
+PHASE_PROTOTYPES = {
+    "pre-op": [
+        "Is this patient a suitable candidate for endovascular repair?",
+        "Which stent graft should I select for this aneurysm?",
+        "What pre-operative imaging is needed before EVAR?",
+        "Assess the surgical risk for this patient before the operation",
+        "What are the sizing requirements for the proximal landing zone?",
+        "Evaluate the anatomy for device compatibility",
+        "What risk factors should I consider when planning the repair?",
+        "Which contraindications rule out this device for the patient?",
+    ],
+    "intra-op": [
+        "What are the deployment steps for this stent graft?",
+        "How do I align the proximal markers with the renal arteries?",
+        "The sheath will not advance through the iliac artery, what now?",
+        "How to deploy the contralateral limb?",
+        "What should I check on completion angiography?",
+        "There is a type I endoleak during the procedure, how do I fix it?",
+        "Which sheath size does the delivery system need?",
+        "When should I post-dilate with the balloon catheter?",
+    ],
+    "post-op": [
+        "What follow-up imaging schedule is recommended after EVAR?",
+        "Which complications should we monitor after surgery?",
+        "When can the patient be discharged after TEVAR?",
+        "How should a type II endoleak be managed at follow-up?",
+        "What activity restrictions apply during recovery?",
+        "How often is CT surveillance needed after the repair?",
+        "The patient has access site bleeding after the operation",
+        "What medications should be continued at discharge?",
+    ],
+}
+
+COLLECTION_PROTOTYPES = {
+    "patients": [
+        "What is the medical history of this patient?",
+        "What is the aneurysm diameter for this patient?",
+        "Which risk factors does the patient have?",
+        "What intervention is planned for the patient?",
+    ],
+    "devices": [
+        "What are the specifications of this stent graft?",
+        "What diameter range does the device support?",
+        "What are the contraindications for this device?",
+        "Which manufacturer makes this graft and what sheath does it need?",
+    ],
+    "guidelines": [
+        "What do the clinical practice guidelines recommend?",
+        "What is the standard protocol for this procedure?",
+        "What is the best practice for post-operative surveillance?",
+        "Which guideline covers patient selection criteria?",
+    ],
+    "literature": [
+        "What does the research literature say about outcomes?",
+        "Are there clinical trials comparing open and endovascular repair?",
+        "What is the evidence on long-term durability?",
+        "What studies report reintervention rates?",
+    ],
+    "notes": [
+        "What did the previous clinical notes say?",
+        "Show the operative note for this patient",
+        "What was recorded at the last follow-up visit?",
+        "What was the estimated blood loss in the procedure note?",
+    ],
+}
+
+# Held-out labeled queries for offline router evaluation
+EVAL_QUERIES = [
+    ("What risks can patient P003 have before the operation?", "pre-op"),
+    (
+        "What is the best device for this patient according to their medical data?",
+        "pre-op",
+    ),
+    ("Is P014 anatomically suitable for an EndoFlex graft?", "pre-op"),
+    ("Which CT measurements do I need to size the graft?", "pre-op"),
+    ("What are the deployment steps for the EndoFlex device?", "intra-op"),
+    ("How do I manage a kinked limb while deploying?", "intra-op"),
+    ("What sheath should I use for femoral access right now?", "intra-op"),
+    ("Proximal markers are misaligned, how to reposition?", "intra-op"),
+    ("What post-operative care is recommended after TEVAR procedures?", "post-op"),
+    ("When should P022 come back for imaging?", "post-op"),
+    ("Warning signs to tell the patient at discharge", "post-op"),
+    ("How do we follow a type II endoleak at six months?", "post-op"),
+]
@@ -0,0 +1,557 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VECTOR_STORES = ("chroma", "numpy")
+
+DEFAULT_CHROMA_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "database", "chroma_db")
+)
+DEFAULT_NUMPY_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "database", "numpy_store")
+)
+DEFAULT_SIGNATURES_PATH = os.path.abspath(
+    os.path.join(
+        os.path.dirname(__file__), "..", "database", "collection_signatures.json"
+    )
+)
+
+
+class VectorStore(Protocol):
+    """One collection of documents, embeddings and metadata.
+
+    Payloads follow Chroma's collection API (which satisfies this protocol
+    as-is): ``query`` returns lists of lists, one per query embedding, and
+    ``get`` returns flat lists. Distances are squared L2.
+    """
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        **kwargs,
+    ) -> Dict[str, Any]: ...
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]: ...
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> None: ...
+
+    def delete(self, ids: Optional[List[str]] = None) -> None: ...
+
+    def count(self) -> int: ...
+
+
+class NumpyVectorStore:
+    """Exact brute-force vector store over a memory-mapped float32 matrix.
+
+    Each collection is a directory holding ``vectors.f32`` (row-major float32)
+    and ``records.json`` (ids, documents, metadatas, dimension). A query is
+    one matrix multiply against the mapped vectors, so results are exact and
+    latency is predictable. ``where`` filters use the Chroma syntax; equality
+    on low-cardinality metadata keys is served from boolean masks computed
+    when the collection is loaded. Writers replace ``records.json``
+    atomically and readers reload when it changes; rows in ``vectors.f32``
+    beyond the records are leftovers of an interrupted append and are
+    ignored, then overwritten by the next one.
+    """
+
+    def __init__(self, directory: str, max_mask_values: int = None):
+        self.directory = directory
+        self.max_mask_values = max_mask_values or int(
+            os.getenv("NUMPY_STORE_MAX_MASK_VALUES", "1024")
+        )
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self._load()
+
+    @property
+    def _records_path(self) -> str:
+        return os.path.join(self.directory, "records.json")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    # --- Loading ---
+
+    def _load(self):
+        with self._lock:
+            self.ids: List[str] = []
+            self.documents: List[str] = []
+            self.metadatas: List[Dict[str, Any]] = []
+            self.dimension = 0
+            mtime = None
+            if os.path.exists(self._records_path):
+                mtime = os.stat(self._records_path).st_mtime_ns
+                with open(self._records_path, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+                self.ids = records["ids"]
+                self.documents = records["documents"]
+                self.metadatas = records["metadatas"]
+                self.dimension = records["dimension"]
+
+            if self.ids:
+                self.vectors = np.memmap(
+                    self._vectors_path,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(len(self.ids), self.dimension),
+                )
+                self.norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+            else:
+                self.vectors = np.empty((0, self.dimension), dtype=np.float32)
+                self.norms = np.empty(0, dtype=np.float32)
+            self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+            self._build_masks()
+            self._loaded_mtime = mtime
+
+    def _build_masks(self):
+        """Boolean row masks per (key, value) for low-cardinality metadata keys"""
+        rows_by_value: Dict[str, Optional[Dict[str, List[int]]]] = {}
+        for row, metadata in enumerate(self.metadatas):
+            for key, value in metadata.items():
+                values = rows_by_value.setdefault(key, {})
+                if values is None:
+                    continue
+                values.setdefault(json.dumps(value), []).append(row)
+                if len(values) > self.max_mask_values:
+                    # Ids, hashes and free text are compared column-wise
+                    rows_by_value[key] = None
+
+        self._masks: Dict[str, Dict[str, np.ndarray]] = {}
+        for key, values in rows_by_value.items():
+            if values is None:
+                continue
+            self._masks[key] = {}
+            for value, rows in values.items():
+                mask = np.zeros(len(self.ids), dtype=bool)
+                mask[rows] = True
+                self._masks[key][value] = mask
+
+    def _ensure_current(self):
+        """Reload when another process rewrote the collection"""
+        mtime = (
+            os.stat(self._records_path).st_mtime_ns
+            if os.path.exists(self._records_path)
+            else None
+        )
+        if mtime != self._loaded_mtime:
+            self._load()
+
+    # --- Filters ---
+
+    def _column(self, key: str) -> List[Any]:
+        return [metadata.get(key) for metadata in self.metadatas]
+
+    def _equals(self, key: str, value: Any) -> np.ndarray:
+        masks = self._masks.get(key)
+        if masks is not None:
+            mask = masks.get(json.dumps(value))
+            if mask is None:
+                return np.zeros(len(self.ids), dtype=bool)
+            return mask.copy()
+        return np.fromiter(
+            (v == value for v in self._column(key)), dtype=bool, count=len(self.ids)
+        )
+
+    def _condition(self, key: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            return self._equals(key, condition)
+
+        mask = np.ones(len(self.ids), dtype=bool)
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                mask &= self._equals(key, operand)
+            elif operator == "$ne":
+                mask &= ~self._equals(key, operand)
+            elif operator in ("$in", "$nin"):
+                matched = np.zeros(len(self.ids), dtype=bool)
+                for value in operand:
+                    matched |= self._equals(key, value)
+                mask &= matched if operator == "$in" else ~matched
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                compare = {
+                    "$gt": lambda v: v > operand,
+                    "$gte": lambda v: v >= operand,
+                    "$lt": lambda v: v < operand,
+                    "$lte": lambda v: v <= operand,
+                }[operator]
+                mask &= np.fromiter(
+                    (
+                        isinstance(v, (int, float)) and compare(v)
+                        for v in self._column(key)
+                    ),
+                    dtype=bool,
+                    count=len(self.ids),
+                )
+            else:
+                raise ValueError(f"Unsupported where operator {operator!r}")
+        return mask
+
+    def _where_mask(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Row mask for a Chroma-style where clause, or None for no filter"""
+        if not where:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                matched = np.zeros(len(self.ids), dtype=bool)
+                for clause in condition:
+                    matched |= self._where_mask(clause)
+                mask &= matched
+            else:
+                mask &= self._condition(key, condition)
+        return mask
+
+    # --- Reads ---
+
+    def count(self) -> int:
+        with self._lock:
+            self._ensure_current()
+            return len(self.ids)
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Exact nearest neighbours by squared L2 distance"""
+        with self._lock:
+            self._ensure_current()
+            queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+            mask = self._where_mask(where)
+            rows = np.arange(len(self.ids)) if mask is None else np.flatnonzero(mask)
+
+            payload = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            if len(rows) == 0:
+                return {key: [[] for _ in queries] for key in payload}
+
+            vectors = self.vectors if mask is None else self.vectors[rows]
+            distances = (
+                self.norms[rows][None, :]
+                - 2.0 * (queries @ np.asarray(vectors).T)
+                + np.einsum("ij,ij->i", queries, queries)[:, None]
+            )
+            k = min(n_results, len(rows))
+            for query_distances in distances:
+                top = np.argpartition(query_distances, k - 1)[:k]
+                top = top[np.argsort(query_distances[top])]
+                hits = rows[top]
+                payload["ids"].append([self.ids[i] for i in hits])
+                payload["documents"].append([self.documents[i] for i in hits])
+                payload["metadatas"].append([self.metadatas[i] for i in hits])
+                payload["distances"].append(
+                    [float(max(d, 0.0)) for d in query_distances[top]]
+                )
+            return payload
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Documents by id and/or where clause, in insertion order"""
+        include = include if include is not None else ["documents", "metadatas"]
+        with self._lock:
+            self._ensure_current()
+            if ids is not None:
+                rows = [self._positions[i] for i in ids if i in self._positions]
+            else:
+                rows = list(range(len(self.ids)))
+            mask = self._where_mask(where)
+            if mask is not None:
+                rows = [row for row in rows if mask[row]]
+            start = offset or 0
+            rows = rows[start : start + limit if limit is not None else None]
+
+            payload: Dict[str, Any] = {"ids": [self.ids[row] for row in rows]}
+            payload["documents"] = (
+                [self.documents[row] for row in rows]
+                if "documents" in include
+                else None
+            )
+            payload["metadatas"] = (
+                [self.metadatas[row] for row in rows]
+                if "metadatas" in include
+                else None
+            )
+            if "embeddings" in include:
+                payload["embeddings"] = np.asarray(self.vectors[rows])
+            return payload
+
+    # --- Writes ---
+
+    def _write(
+        self,
+        ids,
+        documents,
+        metadatas,
+        vectors: np.ndarray = None,
+        appended: np.ndarray = None,
+    ):
+        """Persist the collection: replace the vectors file (``vectors``) or
+        append rows to it (``appended``), then swap in the records last"""
+        os.makedirs(self.directory, exist_ok=True)
+        if appended is not None:
+            with open(self._vectors_path, "ab") as f:
+                # Drop rows of an earlier append that crashed before its
+                # records were swapped in, so rows stay aligned with the ids
+                stored = len(self.ids) * self.dimension * 4
+                if os.fstat(f.fileno()).st_size > stored:
+                    f.truncate(stored)
+                f.write(np.ascontiguousarray(appended, dtype=np.float32).tobytes())
+            dimension = int(appended.shape[1])
+        else:
+            tmp_vectors = self._vectors_path + ".tmp"
+            np.ascontiguousarray(vectors, dtype=np.float32).tofile(tmp_vectors)
+            os.replace(tmp_vectors, self._vectors_path)
+            dimension = int(vectors.shape[1]) if len(vectors) else self.dimension
+
+        tmp_records = self._records_path + ".tmp"
+        with open(tmp_records, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ids": ids,
+                    "documents": documents,
+                    "metadatas": metadatas,
+                    "dimension": dimension,
+                },
+                f,
+            )
+        os.replace(tmp_records, self._records_path)
+        self._load()
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """Insert new ids and overwrite existing ones"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            self._ensure_current()
+            if self.ids and embeddings.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match "
+                    f"collection dimension {self.dimension}"
+                )
+            all_ids = list(self.ids)
+            all_documents = list(self.documents)
+            all_metadatas = list(self.metadatas)
+            positions = dict(self._positions)
+            new_rows = []
+            updated_rows = {}
+            for doc_id, document, metadata, vector in zip(
+                ids, documents, metadatas, embeddings
+            ):
+                row = positions.get(doc_id)
+                if row is None:
+                    positions[doc_id] = len(all_ids)
+                    all_ids.append(doc_id)
+                    all_documents.append(document)
+                    all_metadatas.append(metadata)
+                    new_rows.append(vector)
+                    continue
+                all_documents[row] = document
+                all_metadatas[row] = metadata
+                if row >= len(self.ids):
+                    new_rows[row - len(self.ids)] = vector
+                else:
+                    updated_rows[row] = vector
+
+            appended = np.stack(new_rows) if new_rows else None
+            if not updated_rows and appended is not None and self.ids:
+                # New documents only: grow the vectors file in place
+                self._write(all_ids, all_documents, all_metadatas, appended=appended)
+                return
+
+            vectors = np.array(self.vectors, dtype=np.float32)
+            for row, vector in updated_rows.items():
+                vectors[row] = vector
+            if appended is not None:
+                vectors = np.vstack([vectors, appended]) if len(vectors) else appended
+            self._write(all_ids, all_documents, all_metadatas, vectors=vectors)
+
+    def delete(self, ids: Optional[List[str]] = None):
+        with self._lock:
+            self._ensure_current()
+            removed = set(ids or [])
+            keep = [row for row, doc_id in enumerate(self.ids) if doc_id not in removed]
+            if len(keep) == len(self.ids):
+                return
+            self._write(
+                [self.ids[row] for row in keep],
+                [self.documents[row] for row in keep],
+                [self.metadatas[row] for row in keep],
+                vectors=np.asarray(self.vectors[keep]).reshape(
+                    len(keep), self.dimension
+                ),
+            )
+
+
+class ChromaBackend:
+    """Collections stored in a persistent ChromaDB database"""
+
+    name = "chroma"
+
+    def __init__(self, path: str = None):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path or DEFAULT_CHROMA_PATH)
+
+    def collection_names(self) -> List[str]:
+        return [
+            col if isinstance(col, str) else col.name
+            for col in self.client.list_collections()
+        ]
+
+    def get_store(self, name: str) -> VectorStore:
+        return self.client.get_collection(name=name)
+
+    def get_or_create_store(self, name: str) -> VectorStore:
+        return self.client.get_or_create_collection(name=name)
+
+    def delete_store(self, name: str):
+        self.client.delete_collection(name=name)
+
+
+class NumpyBackend:
+    """Collections stored as memory-mapped NumPy stores, one directory each"""
+
+    name = "numpy"
+
+    def __init__(self, path: str = None):
+        self.path = path or DEFAULT_NUMPY_PATH
+        self._stores: Dict[str, NumpyVectorStore] = {}
+        self._lock = threading.Lock()
+
+    def collection_names(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.path)
+            if os.path.exists(os.path.join(self.path, name, "records.json"))
+        )
+
+    def get_store(self, name: str) -> VectorStore:
+        if name not in self.collection_names():
+            raise ValueError(f"Collection [{name}] does not exist")
+        return self.get_or_create_store(name)
+
+    def get_or_create_store(self, name: str) -> VectorStore:
+        with self._lock:
+            if name not in self._stores:
+                store = NumpyVectorStore(os.path.join(self.path, name))
+                if not os.path.exists(store._records_path):
+                    store._write([], [], [], vectors=np.empty((0, 0), np.float32))
+                self._stores[name] = store
+            return self._stores[name]
+
+    def delete_store(self, name: str):
+        with self._lock:
+            self._stores.pop(name, None)
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+
+def content_signature(
+    ids: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]]
+) -> str:
+    """Order-independent hash of documents' ids and contents.
+
+    Uses the ``content_hash`` ingestion stores in each document's metadata
+    (it covers the text and metadata), or the metadata itself without one.
+    """
+    digest = hashlib.sha256()
+    for doc_id, metadata in sorted(zip(ids, metadatas), key=lambda item: item[0]):
+        metadata = metadata or {}
+        content = metadata.get("content_hash") or json.dumps(metadata, sort_keys=True)
+        digest.update(json.dumps([doc_id, content]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def collection_signature(store: VectorStore, page_size: int = 5000) -> str:
+    """``content_signature`` of every document in a collection"""
+    ids: List[str] = []
+    metadatas: List[Optional[Dict[str, Any]]] = []
+    offset = 0
+    while True:
+        page = store.get(include=["metadatas"], limit=page_size, offset=offset)
+        ids.extend(page["ids"])
+        metadatas.extend(page["metadatas"] or [None] * len(page["ids"]))
+        if len(page["ids"]) < page_size:
+            return content_signature(ids, metadatas)
+        offset += page_size
+
+
+def signatures_path() -> str:
+    return os.getenv("COLLECTION_SIGNATURES_PATH") or DEFAULT_SIGNATURES_PATH
+
+
+def load_signatures(path: str = None) -> Dict[str, str]:
+    """Collection name -> signature as last recorded by ingestion"""
+    path = path or signatures_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_signature(collection_name: str, signature: str, path: str = None):
+    """Record a collection's signature once ingestion has synced it"""
+    path = path or signatures_path()
+    try:
+        signatures = load_signatures(path)
+    except ValueError:
+        signatures = {}
+    signatures[collection_name] = signature
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(signatures, f)
+    os.replace(tmp_path, path)
+
+
+def vector_backend_from_env():
+    """The vector store backend selected by VECTOR_STORE (chroma by default)"""
+    name = os.getenv("VECTOR_STORE", "chroma").strip().lower()
+    path = os.getenv("VECTOR_STORE_PATH") or None
+    if name == "numpy":
+        return NumpyBackend(path)
+    if name != "chroma":
+        print(f"Unknown VECTOR_STORE {name!r}; using chroma")
+    return ChromaBackend(path)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from rag.compact_index import COMPACT_MODES, CompactIndex
+from rag.vector_store import NumpyVectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 32)).astype(np.float32)
+    store = NumpyVectorStore(str(tmp_path / "store"))
+    store.upsert(
+        [f"doc-{i}" for i in range(len(vectors))],
+        vectors,
+        [f"document {i}" for i in range(len(vectors))],
+        [{"group": "even" if i % 2 == 0 else "odd"} for i in range(len(vectors))],
+    )
+    return store, vectors
+
+
+@pytest.mark.parametrize("mode", COMPACT_MODES)
+def test_search_matches_exact_neighbours(tmp_path, store, mode):
+    store, vectors = store
+    index = CompactIndex.build(store, str(tmp_path / mode), mode=mode)
+    assert len(index) == len(vectors)
+    assert index.recall_at_k(vectors[:10] + 0.01, k=5) >= 0.9
+
+    hits = index.search(vectors[7], k=3)
+    assert hits[0][0] == "doc-7"
+    assert hits[0][2] == pytest.approx(0.0, abs=1e-4)
+    assert [distance for _, _, distance in hits] == sorted(
+        distance for _, _, distance in hits
+    )
+
+
+def test_filters_restrict_candidates(tmp_path, store):
+    store, vectors = store
+    index = CompactIndex.build(store, str(tmp_path / "int8"), mode="int8")
+    hits = index.search(vectors[7], k=5, filters={"group": "even"})
+    assert len(hits) == 5
+    assert all(metadata["group"] == "even" for _, metadata, _ in hits)
+
+
+def test_load_keeps_signature_and_saves_memory(tmp_path, store):
+    store, _ = store
+    built = CompactIndex.build(store, str(tmp_path / "binary"), mode="binary")
+    loaded = CompactIndex.load(str(tmp_path / "binary"))
+    assert loaded.signature == built.signature is not None
+    assert loaded.memory()["saved_bytes"] > 0
+
+
+def test_unknown_mode_is_rejected(tmp_path, store):
+    store, _ = store
+    with pytest.raises(ValueError):
+        CompactIndex.build(store, str(tmp_path / "bad"), mode="float8")
@@ -0,0 +1,61 @@
+from rag.context_packer import ContextPacker
+
+
+def _packer():
+    return ContextPacker(
+        phase_budgets={"intra-op": 30},
+        default_budget=100,
+        counter=lambda text: len(text.split()),
+    )
+
+
+def test_patient_record_first_and_closest_documents_next():
+    packer = _packer()
+    context, stats = packer.pack(
+        {"document": "Patient P003 record"},
+        {
+            "devices": [{"document": "far device", "distance": 0.9}],
+            "guidelines": [{"document": "near guideline", "distance": 0.1}],
+        },
+        phase="pre-op",
+        patient_id="P003",
+    )
+    assert context.index("Patient P003 record") < context.index("near guideline")
+    assert context.index("near guideline") < context.index("far device")
+    assert stats["budget"] == 100
+    assert stats["included"] == 2
+
+
+def test_duplicates_and_overlapping_chunks_are_dropped():
+    packer = _packer()
+    chunk = {"doc_id": "g1", "chunk_index": 0, "char_start": 0, "char_end": 100}
+    overlapping = {"doc_id": "g1", "chunk_index": 1, "char_start": 80, "char_end": 180}
+    _, stats = packer.pack(
+        None,
+        {
+            "guidelines": [
+                {"document": "first chunk", "metadata": chunk, "distance": 0.1},
+                {"document": "second chunk", "metadata": overlapping, "distance": 0.2},
+            ],
+            "literature": [{"document": "first   chunk", "distance": 0.3}],
+        },
+    )
+    assert stats["included"] == 1
+    assert stats["duplicates"] == 2
+
+
+def test_budget_skips_long_documents_but_keeps_shorter_ones():
+    packer = _packer()
+    context, stats = packer.pack(
+        None,
+        {
+            "literature": [
+                {"document": "word " * 40, "distance": 0.1},
+                {"document": "short abstract", "distance": 0.2},
+            ]
+        },
+        phase="intra-op",
+    )
+    assert "short abstract" in context
+    assert stats["dropped"] == 1
+    assert stats["used_tokens"] <= stats["budget"] == 30
@@ -0,0 +1,74 @@
+from agents.conversation_store import ConversationStore
+
+
+def test_fold_replaces_oldest_messages_with_summary():
+    store = ConversationStore(max_messages=50, max_sessions=4, idle_seconds=0)
+    for i in range(6):
+        store.append("s1", "user", f"message {i}")
+    messages, _, _ = store.snapshot("s1")
+
+    assert store.fold("s1", messages[:4], "summary of four", 40)
+    remaining, summary, folded_tokens = store.snapshot("s1")
+    assert [m["content"] for m in remaining] == ["message 4", "message 5"]
+    assert summary == "summary of four"
+    assert folded_tokens == 40
+
+
+def test_fold_is_refused_once_the_session_moved_on():
+    store = ConversationStore(max_messages=50, max_sessions=4, idle_seconds=0)
+    store.append("s1", "user", "first")
+    messages, _, _ = store.snapshot("s1")
+    store.clear("s1")
+    store.append("s1", "user", "after clear")
+
+    assert not store.fold("s1", messages, "stale summary", 10)
+    assert store.snapshot("s1") == (
+        [{"role": "user", "content": "after clear"}],
+        "",
+        0,
+    )
+
+
+def test_message_cap_bounds_a_session():
+    store = ConversationStore(max_messages=3, max_sessions=4, idle_seconds=0)
+    for i in range(5):
+        store.append("s1", "user", f"message {i}")
+    assert [m["content"] for m in store.history("s1")] == [
+        "message 2",
+        "message 3",
+        "message 4",
+    ]
+
+
+def test_least_recently_used_session_is_evicted():
+    store = ConversationStore(max_messages=10, max_sessions=2, idle_seconds=0)
+    store.append("s1", "user", "one")
+    store.append("s2", "user", "two")
+    store.history("s1")  # s1 is now the most recently used
+    store.append("s3", "user", "three")
+
+    assert store.history("s2") == []
+    assert [m["content"] for m in store.history("s1")] == ["one"]
+    assert store.stats()["evicted_lru"] == 1
+
+
+def test_idle_sessions_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("agents.conversation_store.time.time", lambda: now[0])
+    store = ConversationStore(max_messages=10, max_sessions=4, idle_seconds=60)
+    store.append("s1", "user", "old")
+    now[0] += 30
+    store.append("s2", "user", "recent")
+    now[0] += 45
+
+    stats = store.stats()
+    assert stats["sessions"] == 1
+    assert stats["evicted_idle"] == 1
+    assert store.history("s1") == []
+    assert [m["content"] for m in store.history("s2")] == ["recent"]
+
+
+def test_reading_an_unknown_session_does_not_create_it():
+    store = ConversationStore(max_messages=10, max_sessions=4, idle_seconds=0)
+    assert store.history("missing") == []
+    assert store.stats()["sessions"] == 0
@@ -0,0 +1,106 @@
+import json
+
+import numpy as np
+
+from rag.device_compatibility import DeviceCompatibility, patient_anatomy
+
+
+def _device(device_id, proximal=None, min_neck_length=None, max_angulation=None):
+    sizing = {}
+    if proximal is not None:
+        sizing["proximal_diameter_range_mm"] = proximal
+    requirements = {}
+    if min_neck_length is not None:
+        requirements["min_neck_length_mm"] = min_neck_length
+    if max_angulation is not None:
+        requirements["max_neck_angulation_deg"] = max_angulation
+    return {
+        "device_id": device_id,
+        "device_name": f"Device {device_id}",
+        "sizing": json.dumps(sizing),
+        "anatomical_requirements": json.dumps(requirements),
+    }
+
+
+def _engine(*metadatas):
+    return DeviceCompatibility.from_metadatas(
+        [metadata["device_id"] for metadata in metadatas], list(metadatas)
+    )
+
+
+def test_devices_rank_by_smallest_margin():
+    engine = _engine(
+        _device("TIGHT", proximal=[24, 27]),
+        _device("ROOMY", proximal=[18, 32]),
+    )
+    result = engine.evaluate("P001", {"proximal_diameter": 25.0})
+    assert [device["device_id"] for device in result["compatible"]] == [
+        "ROOMY",
+        "TIGHT",
+    ]
+    assert result["rejected"] == {}
+
+
+def test_out_of_range_measurement_rejects_with_reason():
+    engine = _engine(
+        _device("SMALL", proximal=[10, 20]),
+        _device("STRICT", min_neck_length=15, max_angulation=60),
+    )
+    result = engine.evaluate(
+        "P001",
+        {"proximal_diameter": 25.0, "neck_length": 10.0, "neck_angulation": 75.0},
+    )
+    assert result["compatible"] == []
+    assert result["rejected"]["SMALL"] == [
+        "Aortic neck diameter 25 mm above maximum 20 mm"
+    ]
+    assert result["rejected"]["STRICT"] == [
+        "Neck length 10 mm below minimum 15 mm",
+        "Neck angulation 75 deg above maximum 60 deg",
+    ]
+
+
+def test_device_without_checkable_bounds_is_unverified_not_ranked():
+    engine = _engine(
+        _device("CHECKED", proximal=[20, 30]),
+        _device("NO_SIZING"),
+        _device("OTHER_BOUNDS", min_neck_length=10),
+    )
+    result = engine.evaluate("P001", {"proximal_diameter": 25.0})
+    assert [device["device_id"] for device in result["compatible"]] == ["CHECKED"]
+    assert [device["device_id"] for device in result["unverified"]] == [
+        "NO_SIZING",
+        "OTHER_BOUNDS",
+    ]
+    # Margins stay finite, so the result is valid JSON
+    json.dumps(result, allow_nan=False)
+
+
+def test_matrix_margins_are_nan_where_nothing_was_checked():
+    engine = _engine(_device("CHECKED", proximal=[20, 30]), _device("NO_SIZING"))
+    anatomies = np.full((1, len(engine.low)), np.nan)
+    anatomies[0, 0] = 25.0
+    failures, margins = engine.matrix(anatomies)
+    assert not failures.any()
+    assert margins[0, 0] == 0.5
+    assert np.isnan(margins[0, 1])
+
+
+def test_unmeasured_criteria_are_reported_as_unchecked():
+    engine = _engine(_device("STRICT", proximal=[20, 30], min_neck_length=15))
+    result = engine.evaluate("P001", {"proximal_diameter": 25.0})
+    assert "neck_length" in result["unchecked"]
+    assert [device["device_id"] for device in result["compatible"]] == ["STRICT"]
+
+
+def test_cached_row_follows_changed_measurements():
+    engine = _engine(_device("A", proximal=[20, 30]))
+    assert engine.evaluate("P001", {"proximal_diameter": 25.0})["compatible"]
+    assert not engine.evaluate("P001", {"proximal_diameter": 35.0})["compatible"]
+
+
+def test_patient_anatomy_skips_missing_and_unparseable_values():
+    anatomy = patient_anatomy(
+        {"aortic_neck_diameter_mm": "26.5", "neck_length_mm": "n/a"}
+    )
+    assert anatomy == {"proximal_diameter": 26.5}
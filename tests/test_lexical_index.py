@@ -0,0 +1,94 @@
+import numpy as np
+
+from rag.lexical_index import (
+    LexicalIndex,
+    lexical_index_path,
+    load_or_build,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+from rag.vector_store import NumpyVectorStore, collection_signature
+
+DEVICES = [
+    (
+        "dev-1",
+        {"device_id": "SG-0137", "device_name": "EndoFlex", "manufacturer": "Medcor"},
+    ),
+    (
+        "dev-2",
+        {"device_id": "SG-0200", "device_name": "AortaSeal", "manufacturer": "Medcor"},
+    ),
+    (
+        "dev-3",
+        {
+            "device_id": "SG-0301",
+            "device_name": "EndoFlex XL",
+            "manufacturer": "Vastek",
+        },
+    ),
+]
+
+
+def _store(path, devices=DEVICES):
+    store = NumpyVectorStore(str(path))
+    store.upsert(
+        [doc_id for doc_id, _ in devices],
+        np.eye(len(devices), 4),
+        [metadata["device_name"] for _, metadata in devices],
+        [metadata for _, metadata in devices],
+    )
+    return store
+
+
+def test_tokenize_keeps_hyphenated_ids_whole():
+    assert tokenize("Is SG-0137 sized for P003?") == [
+        "is",
+        "sg-0137",
+        "sized",
+        "for",
+        "p003",
+    ]
+
+
+def test_query_naming_an_id_resolves_exactly(tmp_path):
+    index = LexicalIndex.build(_store(tmp_path / "devices"), "devices")
+    assert index.exact_ids("Deployment steps for sg-0137 and SG-0301") == [
+        "dev-1",
+        "dev-3",
+    ]
+    assert index.exact_ids("Which graft suits a short neck?") == []
+
+
+def test_bm25_ranks_name_and_manufacturer_matches(tmp_path):
+    index = LexicalIndex.build(_store(tmp_path / "devices"), "devices")
+    ranked = [doc_id for doc_id, _ in index.search("endoflex by vastek")]
+    assert ranked[0] == "dev-3"
+    assert set(ranked) == {"dev-1", "dev-3"}
+
+
+def test_saved_index_is_reused_until_the_collection_changes(tmp_path, monkeypatch):
+    monkeypatch.setenv("LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+    store = _store(tmp_path / "devices")
+    LexicalIndex.build(store, "devices").save(lexical_index_path("devices"))
+
+    loaded = load_or_build(store, "devices", signature=collection_signature(store))
+    assert loaded.signature == collection_signature(store)
+
+    store.upsert(
+        ["dev-4"],
+        np.ones((1, 4)),
+        ["new"],
+        [{"device_id": "SG-0400", "device_name": "Nova", "manufacturer": "Vastek"}],
+    )
+    rebuilt = load_or_build(store, "devices")
+    assert rebuilt.exact_ids("SG-0400") == ["dev-4"]
+
+
+def test_collections_without_fields_have_no_index(tmp_path):
+    assert load_or_build(_store(tmp_path / "guidelines"), "guidelines") is None
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from rag.vector_store import NumpyVectorStore, content_signature
+
+
+def _store(path):
+    store = NumpyVectorStore(str(path))
+    store.upsert(
+        ["a", "b", "c"],
+        [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+        ["doc a", "doc b", "doc c"],
+        [{"phase": "pre-op"}, {"phase": "post-op"}, {"phase": "pre-op"}],
+    )
+    return store
+
+
+def test_query_returns_exact_neighbours_with_filters(tmp_path):
+    store = _store(tmp_path)
+    results = store.query([[0.1, 0.9, 0.0]], n_results=2)
+    assert results["ids"] == [["b", "a"]]
+
+    filtered = store.query([[0.1, 0.9, 0.0]], n_results=2, where={"phase": "pre-op"})
+    assert filtered["ids"] == [["a", "c"]]
+    assert filtered["distances"][0][0] == pytest.approx(1.62)
+
+
+def test_upsert_overwrites_existing_rows(tmp_path):
+    store = _store(tmp_path)
+    store.upsert(["b"], [[0, 0, 2]], ["doc b v2"], [{"phase": "intra-op"}])
+    fetched = store.get(ids=["b"])
+    assert fetched["documents"] == ["doc b v2"]
+    assert store.count() == 3
+    assert store.query([[0, 0, 2]], n_results=1)["ids"] == [["b"]]
+
+
+def test_delete_removes_rows(tmp_path):
+    store = _store(tmp_path)
+    store.delete(ids=["a"])
+    assert store.count() == 2
+    assert store.query([[1, 0, 0]], n_results=3)["ids"][0][-1] != "a"
+
+
+def test_append_after_interrupted_append_stays_aligned(tmp_path):
+    _store(tmp_path)
+    # An append that wrote its vectors but crashed before swapping the records
+    with open(os.path.join(str(tmp_path), "vectors.f32"), "ab") as f:
+        f.write(np.full((2, 3), 9, dtype=np.float32).tobytes())
+
+    store = NumpyVectorStore(str(tmp_path))
+    assert store.count() == 3
+    store.upsert(["d"], [[0, 5, 0]], ["doc d"], [{}])
+    assert os.path.getsize(os.path.join(str(tmp_path), "vectors.f32")) == 4 * 3 * 4
+    assert store.query([[0, 5, 0]], n_results=1)["ids"] == [["d"]]
+    assert store.query([[1, 0, 0]], n_results=1)["ids"] == [["a"]]
+
+
+def test_content_signature_ignores_order_and_tracks_content():
+    first = content_signature(
+        ["a", "b"], [{"content_hash": "1"}, {"content_hash": "2"}]
+    )
+    assert first == content_signature(
+        ["b", "a"], [{"content_hash": "2"}, {"content_hash": "1"}]
+    )
+    assert first != content_signature(
+        ["a", "b"], [{"content_hash": "1"}, {"content_hash": "3"}]
+    )
@@ -2,14 +2,16 @@ from langgraph.graph import StateGraph, END
 from .nodes import retrieval_node, generation_node
 
 # Define the state structure
-from typing import TypedDict, List, Optional
+from typing import Any, Dict, TypedDict, List, Optional
 
 
 class GraphState(TypedDict):
     query: str
     phase: str
     collections: List[str]
+    results: Optional[Dict[str, List[Dict[str, Any]]]]
     context: Optional[str]
+    context_stats: Optional[Dict[str, Any]]
     response: Optional[str]
     system_prompt: str
 
@@ -10,33 +10,30 @@ def retrieval_node(state):
     # Import here to avoid circular imports
     from rag.retriever import chroma_retriever
 
-    context = ""
-    for collection in collections:
-        results = chroma_retriever.query_collection(collection, query)
-        if results:
-            context += f"\n\n--- Information from {collection} ---\n"
-            for i, result in enumerate(results[:3]):
-                context += f"\n{result['document']}\n"
-
-    return {"context": context}
+    # Raw results; generation_node packs them into the phase's token budget
+    return {"results": chroma_retriever.query_many(collections, query)}
 
 
 def generation_node(state):
     """Node for generating responses based on context"""
     query = state.get("query")
-    context = state.get("context", "")
+    context = state.get("context") or ""
     system_prompt = state.get("system_prompt", "")
 
     # Import here to avoid circular imports
-    from langchain_groq import ChatGroq
     from langchain.schema import HumanMessage, SystemMessage
-    import os
+    from rag.context_packer import context_packer
+    from rag.llm_provider import get_llm
+
+    # Retrieved documents are fitted to the phase's token budget
+    context_stats = None
+    if state.get("results") is not None:
+        context, context_stats = context_packer.pack(
+            None, state["results"], phase=state.get("phase")
+        )
 
-    llm = ChatGroq(
-        groq_api_key=os.getenv("GROQ_API_KEY"),
-        model_name="llama-3.1-8b-instant",
-        temperature=0.7,
-    )
+    # Shared keep-alive client instead of a new connection per call
+    llm = get_llm(temperature=0.7)
 
     messages = [
         SystemMessage(content=system_prompt),
@@ -44,4 +41,8 @@ def generation_node(state):
     ]
 
     response = llm.invoke(messages)
-    return {"response": response.content}
+    return {
+        "response": response.content,
+        "context": context,
+        "context_stats": context_stats,
+    }